@@ -0,0 +1,48 @@
+"""
+Keystroke-by-keystroke autocomplete latency on a large synthetic catalog.
+
+    python -m benchmarks.book_autocomplete --rows 1000000 --repeat 20
+"""
+
+import argparse
+
+from benchmarks.book_search import populate
+from benchmarks.utils import benchmark_database, timer
+
+from django.conf import settings
+
+from books.models import Book
+
+TYPED = ("tolkien", "winter gar", "murakmi", "secrte", "golden cr")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        populate(args.rows)
+        print(f"{'prefix':<14} {'p50 ms':>10} {'p99 ms':>10}")
+
+        for word in TYPED:
+            for end in range(settings.AUTOCOMPLETE_MIN_LENGTH, len(word) + 1):
+                prefix = word[:end]
+                samples = []
+                for _ in range(args.repeat):
+                    with timer() as elapsed:
+                        list(
+                            Book.objects.autocomplete(
+                                prefix, settings.AUTOCOMPLETE_LIMIT
+                            )
+                        )
+                    samples.append(elapsed["seconds"] * 1000)
+                samples.sort()
+                p50 = samples[len(samples) // 2]
+                p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+                print(f"{prefix:<14} {p50:>10.2f} {p99:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
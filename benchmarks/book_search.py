@@ -0,0 +1,96 @@
+"""
+Full-text book search on a large synthetic catalog: stored vs computed vector.
+
+    python -m benchmarks.book_search --rows 1000000 --repeat 20
+"""
+
+import argparse
+import statistics
+
+from benchmarks.utils import benchmark_database, timer
+
+from django.conf import settings
+from django.db import connection
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import F
+
+from books.models import SEARCH_CONFIG, Book
+
+WORDS = (
+    "shadow river winter garden silent empire stone light night crown "
+    "glass ocean iron forest storm golden broken hidden last secret"
+).split()
+AUTHORS = (
+    "Austen Tolstoy Dickens Orwell Tolkien Herbert Asimov Christie "
+    "Murakami Atwood Pratchett Gaiman Le_Guin Bradbury Vonnegut"
+).split()
+QUERIES = ("winter garden", "tolkien", "secret -empire", '"golden crown"', "orwell")
+
+
+def populate(rows):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO books_book (title, author, cover, inventory, daily_fee)
+            SELECT
+                initcap((%(words)s::text[])[1 + (i * 7) %% %(nwords)s] || ' '
+                    || (%(words)s::text[])[1 + (i * 13) %% %(nwords)s] || ' '
+                    || (%(words)s::text[])[1 + (i / 3) %% %(nwords)s]) || ' ' || i,
+                (%(authors)s::text[])[1 + (i * 31) %% %(nauthors)s],
+                CASE WHEN i %% 2 = 0 THEN 'SOFT' ELSE 'HARD' END,
+                1 + i %% 10,
+                1.00
+            FROM generate_series(1, %(rows)s) AS i
+            """,
+            {
+                "words": list(WORDS),
+                "nwords": len(WORDS),
+                "authors": list(AUTHORS),
+                "nauthors": len(AUTHORS),
+                "rows": rows,
+            },
+        )
+        cursor.execute("ANALYZE books_book")
+
+
+def measure(queryset, repeat):
+    samples = []
+    for _ in range(repeat):
+        with timer() as elapsed:
+            list(queryset[: settings.PAGINATION_PAGE_SIZE])
+        samples.append(elapsed["seconds"] * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        with timer() as elapsed:
+            populate(args.rows)
+        print(f"populated {args.rows} books in {elapsed['seconds']:.1f}s\n")
+        print(f"{'query':<18} {'strategy':<10} {'p50 ms':>10} {'p95 ms':>10}")
+
+        for text in QUERIES:
+            query = SearchQuery(text, config=SEARCH_CONFIG, search_type="websearch")
+            computed = SearchVector(
+                "title", weight="A", config=SEARCH_CONFIG
+            ) + SearchVector("author", weight="B", config=SEARCH_CONFIG)
+            strategies = {
+                "stored": Book.objects.search(text).order_by("-rank", "id"),
+                "computed": Book.objects.annotate(vector=computed)
+                .filter(vector=query)
+                .annotate(rank=SearchRank(F("vector"), query))
+                .order_by("-rank", "id"),
+            }
+            for name, queryset in strategies.items():
+                p50, p95 = measure(queryset, args.repeat)
+                print(f"{text:<18} {name:<10} {p50:>10.2f} {p95:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
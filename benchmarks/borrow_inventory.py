@@ -0,0 +1,102 @@
+"""
+Concurrent borrows of one hot book: row lock vs conditional UPDATE.
+
+    python -m benchmarks.borrow_inventory --threads 16 --seconds 5
+"""
+
+import argparse
+import threading
+import time
+from datetime import date, timedelta
+
+from benchmarks.utils import benchmark_database
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+
+from books.models import Book
+from borrowings.models import Borrowing
+
+User = get_user_model()
+
+
+def borrow_with_row_lock(book_id, user, work):
+    with transaction.atomic():
+        book = Book.objects.select_for_update().get(id=book_id)
+        if book.inventory <= 0:
+            return False
+        Borrowing.objects.create(
+            user=user, book=book, expected_return=date.today() + timedelta(days=7)
+        )
+        time.sleep(work)
+        book.inventory -= 1
+        book.save()
+    return True
+
+
+def borrow_with_conditional_update(book_id, user, work):
+    with transaction.atomic():
+        Borrowing.objects.create(
+            user=user, book_id=book_id, expected_return=date.today() + timedelta(days=7)
+        )
+        time.sleep(work)
+        if not Book.objects.reserve(book_id):
+            transaction.set_rollback(True)
+            return False
+    return True
+
+
+def run(strategy, threads, seconds, work):
+    book = Book.objects.create(
+        title="Hot book",
+        author="Bench",
+        cover=Book.Cover.SOFT,
+        inventory=10_000_000,
+        daily_fee=1,
+    )
+    users = [
+        User.objects.create_user(
+            email=f"{strategy.__name__}-{i}@bench.test", password="x"
+        )
+        for i in range(threads)
+    ]
+    counts = [0] * threads
+    deadline = time.perf_counter() + seconds
+
+    def worker(index):
+        try:
+            while time.perf_counter() < deadline:
+                if strategy(book.id, users[index], work):
+                    counts[index] += 1
+        finally:
+            connection.close()
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+    return sum(counts) / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument(
+        "--work-ms",
+        type=float,
+        default=5,
+        help="Simulated request work done inside the borrow transaction.",
+    )
+    args = parser.parse_args()
+
+    with benchmark_database():
+        for strategy in (borrow_with_row_lock, borrow_with_conditional_update):
+            rate = run(strategy, args.threads, args.seconds, args.work_ms / 1000)
+            print(f"{strategy.__name__:<32} {rate:>10.1f} borrows/sec")
+
+
+if __name__ == "__main__":
+    main()
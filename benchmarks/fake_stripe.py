@@ -0,0 +1,252 @@
+"""
+Local stand-in for Stripe's checkout sessions API, for load tests.
+
+    python -m benchmarks.fake_stripe --port 12111 --latency-ms 80 --error-rate 0.01
+
+Then point the app at it with STRIPE_API_BASE=http://127.0.0.1:12111.
+Only creating, retrieving and expiring checkout sessions is implemented. It does not
+depend on Django, so it can run next to the app or inside a benchmark.
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+SESSIONS_PATH = "/v1/checkout/sessions"
+SESSION_PATH = re.compile(rf"^{SESSIONS_PATH}/([\w-]+)$")
+EXPIRE_PATH = re.compile(rf"^{SESSIONS_PATH}/([\w-]+)/expire$")
+KEY_PART = re.compile(r"\[([^\]]*)\]")
+
+
+class FakeStripe:
+    """
+    Threaded HTTP server answering like Stripe, after ``latency`` seconds
+    plus up to ``jitter`` more. A share ``error_rate`` of the requests fail
+    with ``error_status`` instead. Requests repeating an Idempotency-Key get
+    the first response back, as with Stripe.
+
+        with FakeStripe(latency=0.05) as stripe_api:
+            ...  # STRIPE_API_BASE=stripe_api.url
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        latency=0.0,
+        jitter=0.0,
+        error_rate=0.0,
+        error_status=500,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.sessions = {}
+        self.requests = 0
+        self._responses = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def handle(self, method, path, params, idempotency_key):
+        """
+        ``(status, body)`` for a request, honouring the idempotency key.
+        """
+        with self._lock:
+            self.requests += 1
+            if idempotency_key in self._responses:
+                return self._responses[idempotency_key]
+
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+        if random.random() < self.error_rate:
+            # failures are not stored, so a retry with the key can succeed
+            return self.error_status, _error("api_error", "Injected failure")
+
+        if method == "POST" and path == SESSIONS_PATH:
+            response = 200, self._create_session(params)
+        elif method == "GET" and SESSION_PATH.match(path):
+            session = self.sessions.get(SESSION_PATH.match(path)[1])
+            response = (
+                (200, session)
+                if session
+                else (404, _error("invalid_request_error", "No such session"))
+            )
+        elif method == "POST" and EXPIRE_PATH.match(path):
+            response = self._expire_session(EXPIRE_PATH.match(path)[1])
+        else:
+            response = 404, _error("invalid_request_error", f"No route {path}")
+
+        if idempotency_key and method == "POST":
+            with self._lock:
+                response = self._responses.setdefault(idempotency_key, response)
+        return response
+
+    def _create_session(self, params):
+        session_id = f"cs_test_{uuid.uuid4().hex}"
+        created = int(time.time())
+        line_items = params.get("line_items", [])
+        session = {
+            "id": session_id,
+            "object": "checkout.session",
+            "amount_total": sum(
+                int(item["price_data"]["unit_amount"]) * int(item.get("quantity", 1))
+                for item in line_items
+            ),
+            "cancel_url": params.get("cancel_url"),
+            "created": created,
+            "currency": (
+                line_items[0]["price_data"]["currency"].lower() if line_items else None
+            ),
+            "expires_at": int(params.get("expires_at", created + 24 * 60 * 60)),
+            "livemode": False,
+            "metadata": params.get("metadata", {}),
+            "mode": params.get("mode"),
+            "payment_status": "unpaid",
+            "status": "open",
+            "success_url": params.get("success_url"),
+            "url": f"{self.url}/pay/{session_id}",
+        }
+        with self._lock:
+            self.sessions[session_id] = session
+        return session
+
+    def _expire_session(self, session_id):
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                return 404, _error("invalid_request_error", "No such session")
+            if session["status"] != "open":
+                return 400, _error(
+                    "invalid_request_error",
+                    "Only Checkout Sessions with a status of open can be expired",
+                )
+            session["status"] = "expired"
+            return 200, session
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # keep-alive, so clients can reuse pooled connections
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._respond()
+
+    def do_POST(self):
+        self._respond()
+
+    def _respond(self):
+        path, _, query = self.path.partition("?")
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode() if length else query
+        status, payload = self.server.fake.handle(
+            self.command,
+            path,
+            decode_params(body),
+            self.headers.get("Idempotency-Key"),
+        )
+
+        content = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("Request-Id", f"req_{uuid.uuid4().hex[:14]}")
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def decode_params(body):
+    """
+    Stripe's form encoding back into nested dicts and lists:
+    ``line_items[0][price_data][currency]=usd``.
+    """
+    params = {}
+    for key, value in parse_qsl(body, keep_blank_values=True):
+        name, _, rest = key.partition("[")
+        parts = [name, *KEY_PART.findall("[" + rest)] if rest else [name]
+        target = params
+        for part, following in zip(parts, parts[1:]):
+            default = [] if following.isdigit() else {}
+            if isinstance(target, list):
+                index = int(part)
+                while len(target) <= index:
+                    target.append(None)
+                if target[index] is None:
+                    target[index] = default
+                target = target[index]
+            else:
+                target = target.setdefault(part, default)
+        if isinstance(target, list):
+            target.append(value)
+        else:
+            target[parts[-1]] = value
+    return params
+
+
+def _error(error_type, message):
+    return {"error": {"type": error_type, "message": message}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=12111)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument(
+        "--jitter-ms", type=float, default=0, help="Random extra latency, up to"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0, help="Share of failing requests"
+    )
+    parser.add_argument("--error-status", type=int, default=500)
+    args = parser.parse_args()
+
+    fake = FakeStripe(
+        host=args.host,
+        port=args.port,
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+    )
+    print(f"Fake Stripe listening on {fake.url}")
+    try:
+        fake._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
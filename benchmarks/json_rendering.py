@@ -0,0 +1,86 @@
+"""
+JSON rendering and parsing: DRF's stdlib-based classes vs the orjson ones.
+
+    python -m benchmarks.json_rendering --rows 10000 --repeat 5
+"""
+
+import argparse
+import io
+from datetime import date, timedelta
+from decimal import Decimal
+
+from benchmarks.utils import timer
+
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from library_project.parsers import ORJSONParser
+from library_project.renderers import ORJSONRenderer
+
+
+def payload(rows):
+    """
+    A borrowing list page the size of ``rows``, as the API would hand it to
+    the renderer.
+    """
+    today = date.today()
+    return {
+        "next": "http://testserver/api/borrowings/?cursor=cD0xMDA%3D",
+        "previous": None,
+        "results": [
+            {
+                "id": i,
+                "borrow_date": today,
+                "expected_return": today + timedelta(days=7),
+                "actual_return": None,
+                "book": {
+                    "id": i,
+                    "title": f"Book {i} – édition",
+                    "author": f"Author {i % 100}",
+                    "cover": "SOFT",
+                    "daily_fee": Decimal("1.25"),
+                },
+                "payments": [i, i + 1],
+            }
+            for i in range(rows)
+        ],
+    }
+
+
+def best_of(repeat, function):
+    best = float("inf")
+    for _ in range(repeat):
+        with timer() as elapsed:
+            function()
+        best = min(best, elapsed["seconds"])
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    data = payload(args.rows)
+    body = JSONRenderer().render(data)
+    assert ORJSONRenderer().render(data) == body, "renderers disagree"
+
+    print(f"{'step':<8} {'stdlib ms':>10} {'orjson ms':>10} {'speedup':>8}")
+    cases = (
+        ("render", JSONRenderer().render, ORJSONRenderer().render, data),
+        (
+            "parse",
+            lambda body: JSONParser().parse(io.BytesIO(body)),
+            lambda body: ORJSONParser().parse(io.BytesIO(body)),
+            body,
+        ),
+    )
+    for step, stdlib, fast, argument in cases:
+        slow_ms = best_of(args.repeat, lambda: stdlib(argument))
+        fast_ms = best_of(args.repeat, lambda: fast(argument))
+        print(f"{step:<8} {slow_ms:>10.1f} {fast_ms:>10.1f} {slow_ms / fast_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
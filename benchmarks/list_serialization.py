@@ -0,0 +1,96 @@
+"""
+List serialization: DRF model serializers vs the values() fast path.
+
+    python -m benchmarks.list_serialization --rows 10000 --repeat 5
+"""
+
+import argparse
+from datetime import date, timedelta
+
+from benchmarks.utils import benchmark_database, timer
+
+from django.contrib.auth import get_user_model
+
+from books.models import Book
+from books.serializers import BookListSerializer
+from books.values import ValuesSerializer
+from borrowings.models import Borrowing
+from borrowings.serializers import BorrowingListSerializer
+from payment.models import Payment
+from payment.serializers import PaymentListSerializer
+
+User = get_user_model()
+
+
+def populate(rows):
+    user = User.objects.create_user(email="bench@bench.test", password="x")
+    books = Book.objects.bulk_create(
+        Book(
+            title=f"Book {i}",
+            author=f"Author {i % 100}",
+            cover=Book.Cover.SOFT,
+            inventory=10,
+            daily_fee="1.25",
+        )
+        for i in range(rows)
+    )
+    borrowings = Borrowing.objects.bulk_create(
+        Borrowing(
+            user=user, book=book, expected_return=date.today() + timedelta(days=7)
+        )
+        for book in books
+    )
+    Payment.objects.bulk_create(
+        Payment(
+            borrowing=borrowing,
+            status=Payment.PaymentStatus.PENDING,
+            type=Payment.Type.PAYMENT,
+            money_to_pay="8.75",
+        )
+        for borrowing in borrowings
+    )
+
+
+def best_of(repeat, function):
+    best = float("inf")
+    for _ in range(repeat):
+        with timer() as elapsed:
+            function()
+        best = min(best, elapsed["seconds"])
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    cases = (
+        (BookListSerializer, Book.objects.all()),
+        (BorrowingListSerializer, Borrowing.objects.select_related("book")),
+        (PaymentListSerializer, Payment.objects.all()),
+    )
+
+    with benchmark_database():
+        populate(args.rows)
+        print(f"{'serializer':<26} {'drf ms':>10} {'values ms':>10} {'speedup':>8}")
+
+        for serializer_class, queryset in cases:
+            fast = ValuesSerializer.for_serializer(serializer_class)
+            drf = best_of(
+                args.repeat,
+                lambda: serializer_class(queryset.all(), many=True).data,
+            )
+            values = best_of(
+                args.repeat,
+                lambda: fast.serialize(fast.values(queryset.all())),
+            )
+            print(
+                f"{serializer_class.__name__:<26} {drf:>10.1f} {values:>10.1f} "
+                f"{drf / values:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Borrow, checkout and return-with-fine end to end against a local fake Stripe.
+
+    python -m benchmarks.payment_flows --threads 8 --seconds 10 --latency-ms 80
+
+Requests go through the real URL routing, views and payment gateway; Celery
+tasks run eagerly, so the payment outbox calls the fake Stripe right after the
+borrow and return commit. Redis must be reachable for the cache.
+"""
+
+import argparse
+import statistics
+import threading
+import time
+from datetime import date, timedelta
+
+from benchmarks.fake_stripe import FakeStripe
+from benchmarks.utils import benchmark_database
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from books.models import Book
+from borrowings.models import Borrowing
+from library_project.celery import app
+from payment import gateway
+
+User = get_user_model()
+
+FLOWS = ("borrow", "checkout", "return")
+
+
+def run_flows(client, book_id, timings):
+    """
+    One borrow, a checkout for it, then an overdue return that opens a fine
+    session. Returns False if any step failed.
+    """
+    started = time.perf_counter()
+    resp = client.post(
+        reverse("borrowings:borrowing-list"),
+        {"book": book_id, "expected_return": str(date.today())},
+    )
+    timings["borrow"].append(time.perf_counter() - started)
+    if resp.status_code != 202:
+        return False
+    borrowing_id = resp.json()["id"]
+
+    started = time.perf_counter()
+    resp = client.post(reverse("payment:checkout", args=[borrowing_id]))
+    timings["checkout"].append(time.perf_counter() - started)
+    if resp.status_code != 200:
+        return False
+
+    Borrowing.objects.filter(id=borrowing_id).update(
+        expected_return=date.today() - timedelta(days=2)
+    )
+    started = time.perf_counter()
+    resp = client.post(reverse("borrowings:return-book", args=[borrowing_id]))
+    timings["return"].append(time.perf_counter() - started)
+    return resp.status_code == 200
+
+
+def run(threads, seconds):
+    book = Book.objects.create(
+        title="Bench book",
+        author="Bench",
+        cover=Book.Cover.SOFT,
+        inventory=threads,
+        daily_fee=1,
+    )
+    timings = {flow: [] for flow in FLOWS}
+    failures = [0] * threads
+    deadline = time.perf_counter() + seconds
+
+    def worker(index):
+        client = APIClient()
+        client.force_authenticate(
+            User.objects.create_user(email=f"flows-{index}@bench.test", password="x")
+        )
+        try:
+            while time.perf_counter() < deadline:
+                if not run_flows(client, book.id, timings):
+                    failures[index] += 1
+        finally:
+            connection.close()
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+    return timings, sum(failures)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--latency-ms", type=float, default=80)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    app.conf.task_always_eager = True
+
+    fake = FakeStripe(
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        error_rate=args.error_rate,
+    )
+    with fake, override_settings(STRIPE_API_BASE=fake.url), benchmark_database():
+        gateway.get_client.cache_clear()
+        timings, failures = run(args.threads, args.seconds)
+
+    print(f"{'flow':<10} {'count':>7} {'per sec':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for flow in FLOWS:
+        samples = sorted(timings[flow])
+        if not samples:
+            continue
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        print(
+            f"{flow:<10} {len(samples):>7} {len(samples) / args.seconds:>8.1f} "
+            f"{statistics.median(samples) * 1000:>8.1f} {p95 * 1000:>8.1f}"
+        )
+    print(f"failed flows: {failures}, Stripe requests: {fake.requests}")
+
+
+if __name__ == "__main__":
+    main()
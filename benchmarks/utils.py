@@ -0,0 +1,34 @@
+import os
+import time
+from contextlib import contextmanager
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "library_project.settings")
+django.setup()
+
+from django.db import connection, connections
+
+
+@contextmanager
+def benchmark_database():
+    """
+    Run the block against a throwaway, fully migrated database so the
+    benchmarks never touch real data.
+    """
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+@contextmanager
+def timer():
+    result = {}
+    start = time.perf_counter()
+    try:
+        yield result
+    finally:
+        result["seconds"] = time.perf_counter() - start
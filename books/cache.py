@@ -0,0 +1,99 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+CATALOG_VERSION_KEY = "books:catalog:version"
+
+
+def get_version(key):
+    """
+    Current value of a version key. Versions are nanosecond timestamps, so
+    a version lost to eviction is never handed out again, and they double
+    as a modification time.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(*keys):
+    """
+    Move the given version keys forward once the current transaction
+    commits, so readers never cache pre-commit data under a new version.
+    """
+    transaction.on_commit(
+        lambda: cache.set_many(dict.fromkeys(keys, time.time_ns()), None)
+    )
+
+
+def get_catalog_version():
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    bump_version(CATALOG_VERSION_KEY)
+
+
+def catalog_cache_key(request, action):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f"books:catalog:{get_catalog_version()}:{action}:{path}"
+
+
+def autocomplete_cache_key(text, limit):
+    digest = hashlib.md5(text.encode()).hexdigest()
+    return f"books:autocomplete:{limit}:{digest}"
+
+
+class CatalogCacheMixin:
+    """
+    Read-through cache for list and retrieve responses of the catalog.
+
+    Entries are keyed by the catalog version, so any write makes them
+    unreachable at once. On a miss only one request rebuilds the entry;
+    concurrent requests for the same key wait briefly for it instead of
+    hitting the database together.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        key = catalog_cache_key(request, self.action)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        lock_key = f"{key}:lock"
+        locked = cache.add(lock_key, 1, settings.BOOK_CACHE_LOCK_TIMEOUT)
+        if not locked:
+            data = self._wait_for(key)
+            if data is not None:
+                return Response(data)
+
+        try:
+            response = handler(request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                cache.set(key, response.data, settings.BOOK_CACHE_TTL)
+            return response
+        finally:
+            if locked:
+                cache.delete(lock_key)
+
+    def _wait_for(self, key):
+        deadline = time.monotonic() + settings.BOOK_CACHE_LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            data = cache.get(key)
+            if data is not None:
+                return data
+        return None
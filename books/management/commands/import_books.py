@@ -0,0 +1,244 @@
+import csv
+import json
+import os
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from books.cache import bump_catalog_version
+from books.models import Book
+
+FIELDS = ("title", "author", "cover", "inventory", "daily_fee")
+NATURAL_KEY = ("title", "author", "cover")
+
+STAGING_TABLE = "books_book_import"
+
+CREATE_STAGING = f"""
+    CREATE TEMPORARY TABLE IF NOT EXISTS {STAGING_TABLE} (
+        line bigint NOT NULL,
+        title varchar(255) NOT NULL,
+        author varchar(255) NOT NULL,
+        cover varchar NOT NULL,
+        inventory integer NOT NULL,
+        daily_fee numeric(10, 2) NOT NULL
+    )
+"""
+
+BOOK_TABLE = Book._meta.db_table
+
+# The last line of the batch wins when the feed repeats a book.
+LATEST = f"""
+    SELECT DISTINCT ON ({", ".join(NATURAL_KEY)}) {", ".join(FIELDS)}
+    FROM {STAGING_TABLE}
+    ORDER BY {", ".join(NATURAL_KEY)}, line DESC
+"""
+
+SAME_BOOK = " AND ".join(f"book.{field} = latest.{field}" for field in NATURAL_KEY)
+
+# Books are not unique on their natural key, so the upsert is an UPDATE of
+# the books that exist and an INSERT of the rest, under a lock that keeps
+# concurrent writers from adding a matching book in between. Reads go on.
+LOCK_BOOKS = f"LOCK TABLE {BOOK_TABLE} IN SHARE ROW EXCLUSIVE MODE"
+
+UPDATE_EXISTING = f"""
+    UPDATE {BOOK_TABLE} book
+    SET inventory = latest.inventory, daily_fee = latest.daily_fee
+    FROM ({LATEST}) latest
+    WHERE {SAME_BOOK}
+        AND (book.inventory, book.daily_fee)
+            IS DISTINCT FROM (latest.inventory, latest.daily_fee)
+"""
+
+INSERT_NEW = f"""
+    INSERT INTO {BOOK_TABLE} ({", ".join(FIELDS)})
+    SELECT {", ".join(FIELDS)}
+    FROM ({LATEST}) latest
+    WHERE NOT EXISTS (SELECT 1 FROM {BOOK_TABLE} book WHERE {SAME_BOOK})
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports books from a CSV or JSON Lines file, inserting new books and "
+        "updating inventory and daily fee of existing ones (matched by title, "
+        "author and cover). Interrupted runs resume from the last batch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV (with a header row) or JSONL file")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="Input format, guessed from the file extension by default",
+        )
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument(
+            "--checkpoint",
+            help="Where progress is recorded, defaults to <path>.checkpoint",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Ignore an existing checkpoint and import from the first row",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+
+        input_format = options["format"] or _guess_format(path)
+        checkpoint_path = options["checkpoint"] or f"{path}.checkpoint"
+        size = os.path.getsize(path)
+
+        done = 0 if options["restart"] else _read_checkpoint(checkpoint_path, size)
+        if done:
+            self.stdout.write(f"Resuming after row {done}")
+
+        with connection.cursor() as cursor:
+            cursor.execute(CREATE_STAGING)
+
+        created = updated = skipped = 0
+        started = time.monotonic()
+        with open(path, newline="", encoding="utf-8") as feed:
+            rows = _read_rows(feed, input_format)
+            batch = []
+            line = done
+            for line, row in enumerate(rows, start=1):
+                if line <= done:
+                    continue
+                try:
+                    batch.append((line, *_clean(row)))
+                except ValueError as error:
+                    skipped += 1
+                    self.stderr.write(f"Row {line} skipped: {error}")
+
+                if line - done >= options["batch_size"]:
+                    batch_created, batch_updated = self._load(batch)
+                    created += batch_created
+                    updated += batch_updated
+                    done = line
+                    _write_checkpoint(checkpoint_path, size, done)
+                    self._progress(done, created, updated, skipped, started)
+                    batch = []
+
+            if line > done:
+                batch_created, batch_updated = self._load(batch)
+                created += batch_created
+                updated += batch_updated
+                done = line
+                _write_checkpoint(checkpoint_path, size, done)
+
+        bump_catalog_version()
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {done} rows: {created} created, {updated} updated, "
+                f"{skipped} skipped"
+            )
+        )
+
+    def _load(self, batch):
+        """
+        COPY one batch into the staging table and upsert it in a single
+        transaction, so a batch is either fully applied or not at all.
+        Returns how many books were created and updated.
+        """
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {STAGING_TABLE}")
+            columns = ", ".join(("line", *FIELDS))
+            with cursor.cursor.copy(
+                f"COPY {STAGING_TABLE} ({columns}) FROM STDIN"
+            ) as copy:
+                for row in batch:
+                    copy.write_row(row)
+            cursor.execute(LOCK_BOOKS)
+            cursor.execute(UPDATE_EXISTING)
+            updated = cursor.rowcount
+            cursor.execute(INSERT_NEW)
+            created = cursor.rowcount
+        return created, updated
+
+    def _progress(self, done, created, updated, skipped, started):
+        rate = done / max(time.monotonic() - started, 1e-9)
+        self.stdout.write(
+            f"{done} rows processed ({created} created, {updated} updated, "
+            f"{skipped} skipped), {rate:.0f} rows/s"
+        )
+
+
+def _guess_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".jsonl", ".ndjson"):
+        return "jsonl"
+    raise CommandError(f"Cannot guess the format of {path}, pass --format")
+
+
+def _read_rows(feed, input_format):
+    if input_format == "csv":
+        yield from csv.DictReader(feed)
+        return
+    for line in feed:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield {}
+
+
+def _clean(row):
+    try:
+        values = {field: row[field] for field in FIELDS}
+    except (KeyError, TypeError) as error:
+        raise ValueError(f"missing field {error}")
+
+    title = str(values["title"]).strip()
+    author = str(values["author"]).strip()
+    if not title or not author:
+        raise ValueError("title and author are required")
+    if len(title) > 255 or len(author) > 255:
+        raise ValueError("title and author must be at most 255 characters")
+
+    cover = str(values["cover"]).strip().upper()
+    if cover not in Book.Cover.values:
+        raise ValueError(f"unknown cover {values['cover']!r}")
+
+    try:
+        inventory = int(values["inventory"])
+        daily_fee = Decimal(str(values["daily_fee"]))
+        if not daily_fee.is_finite():
+            raise InvalidOperation
+        daily_fee = daily_fee.quantize(Decimal("0.01"))
+    except (TypeError, ValueError, InvalidOperation):
+        raise ValueError("inventory and daily_fee must be numbers")
+    if not 0 <= inventory < 2**31 or not 0 <= daily_fee < Decimal("1e8"):
+        raise ValueError("inventory and daily_fee are out of range")
+
+    return title, author, cover, inventory, daily_fee
+
+
+def _read_checkpoint(path, size):
+    if not os.path.exists(path):
+        return 0
+    with open(path) as checkpoint:
+        state = json.load(checkpoint)
+    if state["size"] != size:
+        raise CommandError(
+            f"{path} was written for a different version of the file, "
+            "pass --restart to import from the beginning"
+        )
+    return state["rows"]
+
+
+def _write_checkpoint(path, size, rows):
+    with open(f"{path}.tmp", "w") as checkpoint:
+        json.dump({"size": size, "rows": rows}, checkpoint)
+    os.replace(f"{path}.tmp", path)
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-17 06:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0004_book_trigram_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                fields=["title", "author", "cover"], name="book_natural_key_idx"
+            ),
+        ),
+    ]
@@ -1,4 +1,93 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    SearchVectorField,
+    TrigramWordSimilarity,
+)
 from django.db import models
+from django.db.models import Case, F, Q, When
+from django.db.models.functions import Cast, Greatest
+
+from books.cache import bump_catalog_version
+
+SEARCH_CONFIG = "english"
+
+
+class BookQuerySet(models.QuerySet):
+    def reserve(self, book_id):
+        """
+        Take one copy of the book with a single conditional UPDATE.
+        Returns False when the book is out of stock.
+        """
+        reserved = bool(
+            self.filter(id=book_id, inventory__gt=0).update(
+                inventory=F("inventory") - 1
+            )
+        )
+        if reserved:
+            bump_catalog_version()
+        return reserved
+
+    def release(self, book_id):
+        """
+        Put one copy of the book back on the shelf.
+        """
+        released = bool(self.filter(id=book_id).update(inventory=F("inventory") + 1))
+        if released:
+            bump_catalog_version()
+        return released
+
+    def apply_inventory_deltas(self, deltas):
+        """
+        Add ``{book_id: delta}`` to the inventories in one UPDATE ... CASE.
+        """
+        updated = self.filter(id__in=deltas).update(
+            inventory=Case(
+                *(
+                    When(id=book_id, then=F("inventory") + delta)
+                    for book_id, delta in deltas.items()
+                ),
+                default=F("inventory"),
+                output_field=models.PositiveIntegerField(),
+            )
+        )
+        if updated:
+            bump_catalog_version()
+        return updated
+
+    def search(self, text):
+        """
+        Full-text match against the stored search vector, annotated with
+        ``rank`` so results can be ordered by relevance. The rank is cast to
+        double precision so it survives a round trip through a cursor.
+        """
+        query = SearchQuery(text, config=SEARCH_CONFIG, search_type="websearch")
+        rank = SearchRank(F("search_vector"), query)
+        return self.filter(search_vector=query).annotate(
+            rank=Cast(rank, output_field=models.FloatField())
+        )
+
+    def autocomplete(self, text, limit):
+        """
+        Best prefix or fuzzy matches on title and author. Both lookups are
+        served by the trigram GIN indexes; only matching rows are scored.
+        """
+        return (
+            self.filter(
+                Q(title__trigram_word_similar=text)
+                | Q(author__trigram_word_similar=text)
+            )
+            .annotate(
+                similarity=Greatest(
+                    TrigramWordSimilarity(text, "title"),
+                    TrigramWordSimilarity(text, "author"),
+                )
+            )
+            .order_by("-similarity", "id")
+            .values("id", "title", "author")[:limit]
+        )
 
 
 class Book(models.Model):
@@ -11,6 +100,31 @@ class Book(models.Model):
     cover = models.CharField(choices=Cover.choices)
     inventory = models.PositiveIntegerField()
     daily_fee = models.DecimalField(max_digits=10, decimal_places=2)
+    search_vector = models.GeneratedField(
+        expression=SearchVector("title", weight="A", config=SEARCH_CONFIG)
+        + SearchVector("author", weight="B", config=SEARCH_CONFIG),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    objects = BookQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # import_books matches books on title, author and cover
+            models.Index(
+                fields=["title", "author", "cover"], name="book_natural_key_idx"
+            ),
+            GinIndex(fields=["search_vector"], name="book_search_vector_idx"),
+            GinIndex(
+                fields=["title"], name="book_title_trgm_idx", opclasses=["gin_trgm_ops"]
+            ),
+            GinIndex(
+                fields=["author"],
+                name="book_author_trgm_idx",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ]
 
     def __str__(self):
         return f"{self.author} - {self.title}"
@@ -0,0 +1,75 @@
+import csv
+import json
+from abc import ABCMeta, abstractmethod
+
+from rest_framework.renderers import BaseRenderer
+
+
+class _Echo:
+    """
+    File-like object whose write() returns the value, for csv.writer.
+    """
+
+    def write(self, value):
+        return value
+
+
+class StreamingRenderer(BaseRenderer, metaclass=ABCMeta):
+    """
+    Renderer that can also turn an iterator of ``values_list`` rows into an
+    iterator of encoded chunks for StreamingHttpResponse. Subclasses encode
+    a single row in ``line``.
+    """
+
+    charset = "utf-8"
+    batch_size = 500
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Used for error responses and anything that is not streamed.
+        if data is None:
+            return b""
+        rows = data if isinstance(data, list) else [data]
+        fields = list(rows[0]) if rows else []
+        values = ([row.get(field) for field in fields] for row in rows)
+        return b"".join(self.stream(fields, values))
+
+    def stream(self, fields, rows):
+        lines = list(self.header(fields))
+        for row in rows:
+            lines.append(self.line(fields, row))
+            if len(lines) >= self.batch_size:
+                yield "".join(lines).encode(self.charset)
+                lines = []
+        if lines:
+            yield "".join(lines).encode(self.charset)
+
+    def header(self, fields):
+        return []
+
+    @abstractmethod
+    def line(self, fields, row):
+        """
+        One encoded row, including its line terminator.
+        """
+
+
+class NDJSONRenderer(StreamingRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+    def line(self, fields, row):
+        return json.dumps(dict(zip(fields, row)), default=str) + "\n"
+
+
+class CSVRenderer(StreamingRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+    def __init__(self):
+        self.writer = csv.writer(_Echo())
+
+    def header(self, fields):
+        return [self.writer.writerow(fields)]
+
+    def line(self, fields, row):
+        return self.writer.writerow(row)
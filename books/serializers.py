@@ -1,12 +1,74 @@
+from collections import defaultdict
+
 from rest_framework import serializers
 
+from books.cache import bump_catalog_version
 from books.models import Book
 
 
+class BookBulkListSerializer(serializers.ListSerializer):
+    """
+    Validates a batch of books with a fixed number of queries and saves it
+    with bulk_create/bulk_update. Errors are returned as a list with one
+    entry per item, empty for valid items.
+
+    For updates, pass the books being changed as ``instance``; every item
+    must then carry the ``id`` of one of them.
+    """
+
+    @staticmethod
+    def instances_for(data):
+        """
+        Books referenced by the items of a raw update batch.
+        """
+        ids = [_item_id(item) for item in data] if isinstance(data, list) else []
+        return list(Book.objects.filter(id__in=[i for i in ids if i is not None]))
+
+    def run_child_validation(self, data):
+        self.child.instance = None
+        if self.instance is not None:
+            book_id = _item_id(data)
+            if book_id not in self._instances:
+                raise serializers.ValidationError({"id": ["Book does not exist."]})
+            if book_id in self._seen:
+                raise serializers.ValidationError(
+                    {"id": ["Book appears more than once in this batch."]}
+                )
+            self._seen.add(book_id)
+            self.child.instance = self._instances[book_id]
+        return super().run_child_validation(data)
+
+    def to_internal_value(self, data):
+        if self.instance is not None:
+            self._instances = {book.id: book for book in self.instance}
+            self._seen = set()
+        return super().to_internal_value(data)
+
+    def create(self, validated_data):
+        books = Book.objects.bulk_create(Book(**item) for item in validated_data)
+        bump_catalog_version()
+        return books
+
+    def update(self, instance, validated_data):
+        books = []
+        fields = set()
+        for item, attrs in zip(self.initial_data, validated_data):
+            book = self._instances[_item_id(item)]
+            for field, value in attrs.items():
+                setattr(book, field, value)
+            fields.update(attrs)
+            books.append(book)
+        if fields:
+            Book.objects.bulk_update(books, fields)
+            bump_catalog_version()
+        return books
+
+
 class BookSerializer(serializers.ModelSerializer):
     class Meta:
         model = Book
         fields = ("id", "title", "author", "cover", "inventory", "daily_fee")
+        list_serializer_class = BookBulkListSerializer
 
 
 class BookListSerializer(serializers.ModelSerializer):
@@ -19,3 +81,88 @@ class BookDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = Book
         fields = ("id", "title", "author", "cover", "inventory", "daily_fee")
+
+
+class BookAutocompleteSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Book
+        fields = ("id", "title", "author")
+
+
+class BookIdListSerializer(serializers.ListSerializer):
+    """
+    Checks that every item refers to an existing book, in one query.
+    """
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        ids = {item["id"] for item in items}
+        existing = set(Book.objects.filter(id__in=ids).values_list("id", flat=True))
+        errors = [
+            {} if item["id"] in existing else {"id": ["Book does not exist."]}
+            for item in items
+        ]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return items
+
+
+class BookIdSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+
+    class Meta:
+        list_serializer_class = BookIdListSerializer
+
+
+class BookInventoryDeltaListSerializer(BookIdListSerializer):
+    def create(self, validated_data):
+        """
+        Add the deltas to the books' inventories with a single UPDATE. The
+        books are locked first, so run this inside a transaction; a batch
+        that would drive any inventory below zero, or that refers to a book
+        deleted since validation, changes nothing.
+        """
+        deltas = defaultdict(int)
+        for item in validated_data:
+            deltas[item["id"]] += item["delta"]
+
+        inventories = dict(
+            Book.objects.select_for_update()
+            .filter(id__in=deltas)
+            .order_by("id")
+            .values_list("id", "inventory")
+        )
+        errors = [
+            _inventory_error(item["id"], inventories, deltas) for item in validated_data
+        ]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        Book.objects.apply_inventory_deltas(deltas)
+        return [
+            {"id": book_id, "inventory": inventories[book_id] + delta}
+            for book_id, delta in deltas.items()
+        ]
+
+
+class BookInventoryDeltaSerializer(BookIdSerializer):
+    delta = serializers.IntegerField(write_only=True)
+    inventory = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        list_serializer_class = BookInventoryDeltaListSerializer
+
+
+def _inventory_error(book_id, inventories, deltas):
+    if book_id not in inventories:
+        return {"id": ["Book does not exist."]}
+    if inventories[book_id] + deltas[book_id] < 0:
+        return {"delta": ["Inventory cannot drop below zero."]}
+    return {}
+
+
+def _item_id(data):
+    try:
+        return int(data["id"])
+    except (KeyError, TypeError, ValueError):
+        return None
@@ -0,0 +1,190 @@
+from functools import cache
+
+from django.db.models import Prefetch
+from drf_spectacular.utils import OpenApiParameter
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+SPARSE_ACTIONS = ("list", "retrieve")
+
+SPARSE_PARAMETERS = [
+    OpenApiParameter(
+        name="fields",
+        description=(
+            "Comma-separated fields to return. Relations that are not "
+            "expanded come back as ids."
+        ),
+        required=False,
+        type=str,
+    ),
+    OpenApiParameter(
+        name="expand",
+        description="Comma-separated relations to return as nested objects",
+        required=False,
+        type=str,
+    ),
+]
+
+
+class SparseFieldsMixin:
+    """
+    ``?fields=`` and ``?expand=`` for the list and retrieve actions.
+
+    Without either parameter responses keep their full shape. With them,
+    only the listed fields are returned and nested serializers are rendered
+    as ids unless expanded, so the queryset only loads the matching columns
+    and joins or prefetches the relations that are actually expanded.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault("context", self.get_serializer_context())
+        return self.get_sparse_serializer_class()(*args, **kwargs)
+
+    def get_sparse_serializer_class(self):
+        serializer_class = self.get_serializer_class()
+        params = self.request.query_params
+        if self.action not in SPARSE_ACTIONS or not (
+            "fields" in params or "expand" in params
+        ):
+            return serializer_class
+
+        fields = _names(params["fields"]) if "fields" in params else None
+        expand = _names(params.get("expand", ""))
+        try:
+            return sparse_serializer(serializer_class, fields, expand)
+        except ValueError as error:
+            raise ValidationError(error.args[0])
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action in SPARSE_ACTIONS:
+            queryset = narrow_queryset(queryset, self.get_serializer())
+        return queryset
+
+
+def _names(value):
+    return frozenset(name.strip() for name in value.split(",") if name.strip())
+
+
+@cache
+def sparse_serializer(serializer_class, fields, expand):
+    """
+    Subclass of ``serializer_class`` restricted to ``fields`` (all of them
+    when None) where nested serializers not in ``expand`` become primary
+    key fields. Expanded relations are always included.
+    """
+    declared = serializer_class().fields
+    nested = {
+        name
+        for name, field in declared.items()
+        if isinstance(field, serializers.BaseSerializer)
+    }
+
+    errors = {}
+    if fields is not None and fields - set(declared):
+        errors["fields"] = [
+            f"Unknown field: {name}" for name in sorted(fields - set(declared))
+        ]
+    if expand - nested:
+        errors["expand"] = [
+            f"Cannot expand: {name}" for name in sorted(expand - nested)
+        ]
+    if errors:
+        raise ValueError(errors)
+
+    names = []
+    attrs = {}
+    for name, field in declared.items():
+        if fields is not None and name not in fields and name not in expand:
+            continue
+        names.append(name)
+        if name in nested and name not in expand:
+            source = {} if field.source == name else {"source": field.source}
+            attrs[name] = serializers.PrimaryKeyRelatedField(
+                read_only=True,
+                many=isinstance(field, serializers.ListSerializer),
+                **source,
+            )
+
+    attrs["Meta"] = type("Meta", (serializer_class.Meta,), {"fields": tuple(names)})
+    return type(serializer_class.__name__, (serializer_class,), attrs)
+
+
+def narrow_queryset(queryset, serializer):
+    """
+    Load only the columns ``serializer`` reads, join its nested to-one
+    serializers and prefetch its to-many relations. The queryset is returned
+    untouched when a field does not map onto a model field.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    plan = _plan(serializer, queryset.model, prefix="")
+    if plan is None:
+        return queryset
+    return _apply(queryset, plan)
+
+
+def _apply(queryset, plan):
+    only, select_related, prefetch_related = plan
+    queryset = queryset.select_related(None).prefetch_related(None).only(*only)
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    return queryset
+
+
+def _plan(serializer, model, prefix):
+    only, select_related, prefetch_related = [], [], []
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        model_field = _model_field(model, field.source)
+        if model_field is None:
+            return None
+        lookup = prefix + field.source
+
+        if model_field.one_to_many or model_field.many_to_many:
+            child = getattr(field, "child", None)
+            if isinstance(child, serializers.BaseSerializer):
+                related_plan = _plan(child, model_field.related_model, prefix="")
+                if related_plan is None:
+                    return None
+            else:
+                related_plan = (["pk"], [], [])
+            if model_field.one_to_many:
+                # the reverse foreign key is needed to match rows up
+                related_plan[0].append(model_field.field.name)
+            related = _apply(
+                model_field.related_model._default_manager.all(), related_plan
+            )
+            prefetch_related.append(Prefetch(lookup, queryset=related))
+        elif isinstance(field, serializers.BaseSerializer):
+            nested = _plan(field, model_field.related_model, prefix=f"{lookup}__")
+            if nested is None:
+                return None
+            select_related.append(lookup)
+            only.extend(nested[0])
+            select_related.extend(nested[1])
+            prefetch_related.extend(nested[2])
+        else:
+            only.append(lookup)
+    return only, select_related, prefetch_related
+
+
+def _model_field(model, source):
+    """
+    Model field or relation behind the attribute ``source``, or None if
+    there is none.
+    """
+    if "." in source or source == "*":
+        return None
+    for field in model._meta.get_fields():
+        name = (
+            field.get_accessor_name()
+            if field.auto_created and not field.concrete
+            else field.name
+        )
+        if name == source:
+            return field
+    return None
@@ -1,16 +1,53 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import uuid
+import warnings
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.base import CacheKeyWarning
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.translation import gettext_lazy
 from django.contrib.auth import get_user_model
 
+from books.cache import autocomplete_cache_key, catalog_cache_key
 from books.models import Book
+from books.pagination import BookCursorPagination
+from books.serializers import (
+    BookInventoryDeltaSerializer,
+    BookListSerializer,
+    BookSerializer,
+)
+from books.values import ValuesSerializer
+from borrowings.models import Borrowing
+from borrowings.serializers import BorrowingDetailSerializer, BorrowingListSerializer
+from library_project.parsers import ORJSONParser
+from library_project.renderers import ORJSONRenderer
+from payment.models import Payment
+from payment.serializers import PaymentListSerializer
 
-from rest_framework.test import APIClient
+import orjson
+from rest_framework.exceptions import ErrorDetail, ParseError, ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.utils.serializer_helpers import ReturnDict
 
 User = get_user_model()
 
 
 class BookViewSetTestCase(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         self.user = User.objects.create_user(email="user", password="pass")
         self.staff_user = User.objects.create_user(
@@ -82,3 +119,737 @@ class BookViewSetTestCase(TestCase):
         self.client.force_authenticate(user=self.staff_user)
         resp = self.client.patch(url, data)
         self.assertEqual(resp.status_code, 200)
+
+    def test_book_list_cursor_pagination(self):
+        for i in range(3, 8):
+            Book.objects.create(
+                title=f"Book{i}",
+                author="Author",
+                cover="SOFT",
+                inventory=1,
+                daily_fee=1,
+            )
+        url = reverse("books:book-list")
+
+        resp = self.client.get(url, {"page_size": 3})
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual(
+            [book["title"] for book in data["results"]], ["Book1", "Book2", "Book3"]
+        )
+        self.assertIsNone(data["previous"])
+
+        resp = self.client.get(data["next"])
+        data = resp.json()
+        self.assertEqual(
+            [book["title"] for book in data["results"]], ["Book4", "Book5", "Book6"]
+        )
+
+        previous = self.client.get(data["previous"]).json()
+        self.assertEqual(
+            [book["title"] for book in previous["results"]],
+            ["Book1", "Book2", "Book3"],
+        )
+        self.assertIsNone(previous["previous"])
+
+        data = self.client.get(data["next"]).json()
+        self.assertEqual([book["title"] for book in data["results"]], ["Book7"])
+        self.assertIsNone(data["next"])
+
+    def test_book_list_page_size_is_capped(self):
+        url = reverse("books:book-list")
+        with patch.object(BookCursorPagination, "max_page_size", 1):
+            resp = self.client.get(url, {"page_size": 1000})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.json()["results"]), 1)
+        self.assertIsNotNone(resp.json()["next"])
+
+    def test_book_list_invalid_cursor(self):
+        url = reverse("books:book-list")
+        resp = self.client.get(url, {"cursor": "garbage"})
+        self.assertEqual(resp.status_code, 404)
+
+    def test_book_reserve_and_release(self):
+        self.assertTrue(Book.objects.reserve(self.book2.id))
+        self.book2.refresh_from_db()
+        self.assertEqual(self.book2.inventory, 2)
+
+        Book.objects.filter(pk=self.book2.pk).update(inventory=0)
+        self.assertFalse(Book.objects.reserve(self.book2.id))
+
+        self.assertTrue(Book.objects.release(self.book2.id))
+        self.book2.refresh_from_db()
+        self.assertEqual(self.book2.inventory, 1)
+
+    def test_book_inventory_cannot_go_negative(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Book.objects.filter(pk=self.book1.pk).update(inventory=-1)
+
+    def test_book_search_ranks_title_matches_first(self):
+        by_author = Book.objects.create(
+            title="Collected letters",
+            author="Tolkien",
+            cover="SOFT",
+            inventory=1,
+            daily_fee=1,
+        )
+        by_title = Book.objects.create(
+            title="Tolkien: A Biography",
+            author="Carpenter",
+            cover="HARD",
+            inventory=1,
+            daily_fee=1,
+        )
+        url = reverse("books:book-list")
+
+        resp = self.client.get(url, {"search": "tolkien"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(
+            [book["id"] for book in resp.json()], [by_title.id, by_author.id]
+        )
+
+        resp = self.client.get(url, {"search": "hobbit"})
+        self.assertEqual(resp.json(), [])
+
+    def test_book_search_cursor_pagination(self):
+        for i in range(5):
+            Book.objects.create(
+                title=f"Dune {i}",
+                author="Herbert",
+                cover="SOFT",
+                inventory=1,
+                daily_fee=1,
+            )
+        url = reverse("books:book-list")
+
+        data = self.client.get(url, {"search": "dune", "page_size": 2}).json()
+        seen = [book["id"] for book in data["results"]]
+        while data["next"]:
+            data = self.client.get(data["next"]).json()
+            seen += [book["id"] for book in data["results"]]
+
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+
+    def test_book_search_vector_is_stored(self):
+        self.book1.title = "Neuromancer"
+        self.book1.save()
+
+        self.assertTrue(Book.objects.search("neuromancer").filter(pk=self.book1.pk))
+
+
+class BookCatalogCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.list_url = reverse("books:book-list")
+        self.book = Book.objects.create(
+            title="Book1", author="Author1", cover="SOFT", inventory=5, daily_fee=1.5
+        )
+        self.detail_url = reverse("books:book-detail", args=[self.book.id])
+
+    def test_list_is_served_from_cache(self):
+        self.client.get(self.list_url)
+        with self.assertNumQueries(0):
+            resp = self.client.get(self.list_url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.json()), 1)
+
+    def test_query_params_are_part_of_the_key(self):
+        self.client.get(self.list_url)
+        with self.assertNumQueries(1):
+            self.client.get(self.list_url, {"page_size": 10})
+
+    def test_save_invalidates_cache(self):
+        self.client.get(self.detail_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.title = "Renamed"
+            self.book.save()
+
+        resp = self.client.get(self.detail_url)
+        self.assertEqual(resp.json()["title"], "Renamed")
+
+    def test_delete_invalidates_cache(self):
+        self.client.get(self.list_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.delete()
+
+        self.assertEqual(self.client.get(self.list_url).json(), [])
+
+    def test_inventory_change_invalidates_cache(self):
+        self.client.get(self.detail_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.reserve(self.book.id)
+
+        self.assertEqual(self.client.get(self.detail_url).json()["inventory"], 4)
+
+    def test_waits_for_concurrent_rebuild(self):
+        key = catalog_cache_key(APIRequestFactory().get(self.list_url), action="list")
+        rebuilt = [{"id": self.book.id, "title": "Rebuilt elsewhere"}]
+
+        def other_request_finishes(seconds):
+            cache.set(key, rebuilt)
+
+        with patch("books.cache.cache.add", return_value=False), patch(
+            "books.cache.time.sleep", side_effect=other_request_finishes
+        ):
+            with self.assertNumQueries(0):
+                resp = self.client.get(self.list_url)
+
+        self.assertEqual(resp.json(), rebuilt)
+
+
+class BookConditionalGetTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse("books:book-list")
+        self.book = Book.objects.create(
+            title="Book1", author="Author1", cover="SOFT", inventory=5, daily_fee=1.5
+        )
+
+    def test_not_modified_without_queries(self):
+        resp = self.client.get(self.url)
+        etag = resp["ETag"]
+        self.assertTrue(etag.startswith('"'))
+        self.assertIn("Last-Modified", resp)
+
+        with self.assertNumQueries(0):
+            resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp["ETag"], etag)
+
+    def test_etag_changes_with_catalog(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.reserve(self.book.id)
+
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp["ETag"], etag)
+
+    def test_etag_depends_on_query(self):
+        etag = self.client.get(self.url)["ETag"]
+        detail = reverse("books:book-detail", args=[self.book.id])
+        self.assertNotEqual(self.client.get(detail)["ETag"], etag)
+
+
+class BookAutocompleteTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse("books:book-autocomplete")
+        self.hobbit = Book.objects.create(
+            title="The Hobbit", author="Tolkien", cover="SOFT", inventory=1, daily_fee=1
+        )
+        self.dune = Book.objects.create(
+            title="Dune", author="Frank Herbert", cover="HARD", inventory=1, daily_fee=1
+        )
+
+    def test_autocomplete_prefix_and_fuzzy_matches(self):
+        resp = self.client.get(self.url, {"q": "Tolk"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(
+            resp.json(),
+            [{"id": self.hobbit.id, "title": "The Hobbit", "author": "Tolkien"}],
+        )
+
+        resp = self.client.get(self.url, {"q": "hobit"})
+        self.assertEqual([book["id"] for book in resp.json()], [self.hobbit.id])
+
+    def test_autocomplete_short_query_returns_nothing(self):
+        with self.assertNumQueries(0):
+            resp = self.client.get(self.url, {"q": "du"})
+        self.assertEqual(resp.json(), [])
+
+    def test_autocomplete_limit(self):
+        for i in range(5):
+            Book.objects.create(
+                title=f"Dune {i}",
+                author="Herbert",
+                cover="SOFT",
+                inventory=1,
+                daily_fee=1,
+            )
+        resp = self.client.get(self.url, {"q": "dune", "limit": 3})
+        self.assertEqual(len(resp.json()), 3)
+
+    def test_autocomplete_is_cached(self):
+        self.client.get(self.url, {"q": "Dune"})
+        with self.assertNumQueries(0):
+            resp = self.client.get(self.url, {"q": "  dune "})
+        self.assertEqual([book["id"] for book in resp.json()], [self.dune.id])
+
+    def test_autocomplete_cache_key_is_hashed(self):
+        text = "dune\x07" + "x" * 300
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", CacheKeyWarning)
+            self.client.get(self.url, {"q": text})
+
+        key = autocomplete_cache_key(text, settings.AUTOCOMPLETE_LIMIT)
+        self.assertLess(len(key), 250)
+        self.assertNotIn("dune", key)
+        self.assertIsNotNone(cache.get(key))
+
+
+class BookExportTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse("books:book-export")
+        self.staff_user = User.objects.create_user(
+            email="staff@test.com", password="pass", is_staff=True
+        )
+        self.book = Book.objects.create(
+            title="Dune, Part 1",
+            author="Herbert",
+            cover="SOFT",
+            inventory=5,
+            daily_fee=1.5,
+        )
+
+    def test_export_requires_admin(self):
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, 401)
+
+        self.client.force_authenticate(
+            User.objects.create_user(email="user@test.com", password="pass")
+        )
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, 403)
+
+    def test_export_ndjson(self):
+        self.client.force_authenticate(self.staff_user)
+        resp = self.client.get(self.url, {"format": "ndjson"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        self.assertTrue(resp["Content-Type"].startswith("application/x-ndjson"))
+
+        lines = b"".join(resp.streaming_content).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [
+                {
+                    "id": self.book.id,
+                    "title": "Dune, Part 1",
+                    "author": "Herbert",
+                    "cover": "SOFT",
+                    "inventory": 5,
+                    "daily_fee": "1.50",
+                }
+            ],
+        )
+
+    def test_export_csv(self):
+        self.client.force_authenticate(self.staff_user)
+        resp = self.client.get(self.url, {"format": "csv"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('filename="books.csv"', resp["Content-Disposition"])
+
+        content = b"".join(resp.streaming_content).decode()
+        self.assertEqual(
+            list(csv.reader(io.StringIO(content))),
+            [
+                ["id", "title", "author", "cover", "inventory", "daily_fee"],
+                [str(self.book.id), "Dune, Part 1", "Herbert", "SOFT", "5", "1.50"],
+            ],
+        )
+
+
+class ImportBooksCommandTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "w") as feed:
+            feed.write(content)
+        return path
+
+    def import_books(self, path, **options):
+        out, err = io.StringIO(), io.StringIO()
+        call_command("import_books", path, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_csv_upserts_on_natural_key(self):
+        existing = Book.objects.create(
+            title="Dune", author="Herbert", cover="SOFT", inventory=1, daily_fee=1
+        )
+        path = self.write(
+            "feed.csv",
+            "title,author,cover,inventory,daily_fee\n"
+            "Dune,Herbert,SOFT,7,2.50\n"
+            '"Emma, Vol. 1",Austen,hard,3,1\n'
+            "Emma,Austen,PAPER,3,1\n"
+            "Emma,Austen,SOFT,3,1\n"
+            "Emma,Austen,SOFT,4,1\n",
+        )
+
+        out, err = self.import_books(path, batch_size=2)
+
+        self.assertIn("Imported 5 rows: 2 created, 2 updated, 1 skipped", out)
+        self.assertIn("Row 3 skipped", err)
+        existing.refresh_from_db()
+        self.assertEqual(existing.inventory, 7)
+        self.assertEqual(str(existing.daily_fee), "2.50")
+        self.assertEqual(Book.objects.get(title="Emma, Vol. 1").cover, Book.Cover.HARD)
+        self.assertEqual(Book.objects.get(title="Emma").inventory, 4)
+        self.assertFalse(os.path.exists(f"{path}.checkpoint"))
+
+    def test_import_upserts_under_a_table_lock(self):
+        path = self.write(
+            "feed.csv",
+            "title,author,cover,inventory,daily_fee\nDune,Herbert,SOFT,7,2.50\n",
+        )
+        with CaptureQueriesContext(connection) as queries:
+            self.import_books(path)
+
+        statements = [query["sql"] for query in queries]
+        lock = statements.index("LOCK TABLE books_book IN SHARE ROW EXCLUSIVE MODE")
+        self.assertIn("UPDATE books_book", statements[lock + 1])
+        self.assertIn("NOT EXISTS", statements[lock + 2])
+        self.assertFalse(any("ON CONFLICT" in sql for sql in statements))
+
+    def test_import_jsonl(self):
+        path = self.write(
+            "feed.jsonl",
+            '{"title": "Dune", "author": "Herbert", "cover": "SOFT", '
+            '"inventory": 2, "daily_fee": "1.5"}\n'
+            "not json\n",
+        )
+
+        out, _ = self.import_books(path)
+
+        self.assertIn("Imported 2 rows: 1 created, 0 updated, 1 skipped", out)
+        self.assertTrue(Book.objects.filter(title="Dune", inventory=2).exists())
+
+    def test_import_resumes_from_checkpoint(self):
+        content = (
+            "title,author,cover,inventory,daily_fee\n"
+            "Dune,Herbert,SOFT,1,1\n"
+            "Emma,Austen,SOFT,1,1\n"
+        )
+        path = self.write("feed.csv", content)
+        with open(f"{path}.checkpoint", "w") as checkpoint:
+            json.dump({"size": len(content), "rows": 1}, checkpoint)
+
+        out, _ = self.import_books(path)
+
+        self.assertIn("Resuming after row 1", out)
+        self.assertEqual(list(Book.objects.values_list("title", flat=True)), ["Emma"])
+
+    def test_import_rejects_stale_checkpoint(self):
+        path = self.write("feed.csv", "title,author,cover,inventory,daily_fee\n")
+        with open(f"{path}.checkpoint", "w") as checkpoint:
+            json.dump({"size": 1, "rows": 1}, checkpoint)
+
+        with self.assertRaises(CommandError):
+            self.import_books(path)
+
+        self.import_books(path, restart=True)
+
+
+class BookBulkTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse("books:book-bulk")
+        self.inventory_url = reverse("books:book-bulk-inventory")
+        self.staff_user = User.objects.create_user(
+            email="staff@test.com", password="pass", is_staff=True
+        )
+        self.client.force_authenticate(self.staff_user)
+        self.dune = Book.objects.create(
+            title="Dune", author="Herbert", cover="SOFT", inventory=2, daily_fee=1
+        )
+        self.emma = Book.objects.create(
+            title="Emma", author="Austen", cover="HARD", inventory=5, daily_fee=1
+        )
+
+    def test_bulk_requires_admin(self):
+        self.client.force_authenticate(
+            User.objects.create_user(email="user@test.com", password="pass")
+        )
+        resp = self.client.post(self.url, [], format="json")
+        self.assertEqual(resp.status_code, 403)
+
+    def test_bulk_create(self):
+        payload = [
+            {
+                "title": f"Book {i}",
+                "author": "Author",
+                "cover": "SOFT",
+                "inventory": i,
+                "daily_fee": "1.00",
+            }
+            for i in range(10)
+        ]
+
+        with self.assertNumQueries(3):
+            resp = self.client.post(self.url, payload, format="json")
+
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(len(resp.json()), 10)
+        self.assertTrue(all(book["id"] for book in resp.json()))
+        self.assertEqual(Book.objects.filter(author="Author").count(), 10)
+
+    def test_bulk_create_reports_errors_per_item(self):
+        payload = [
+            {
+                "title": "New",
+                "author": "A",
+                "cover": "SOFT",
+                "inventory": 1,
+                "daily_fee": 1,
+            },
+            {
+                "title": "New",
+                "author": "A",
+                "cover": "PAPER",
+                "inventory": 1,
+                "daily_fee": 1,
+            },
+            {
+                "title": "Dune",
+                "author": "Herbert",
+                "cover": "SOFT",
+                "inventory": 1,
+                "daily_fee": 1,
+            },
+        ]
+
+        resp = self.client.post(self.url, payload, format="json")
+
+        self.assertEqual(resp.status_code, 400)
+        errors = resp.json()
+        self.assertEqual(len(errors), 3)
+        self.assertEqual(errors[0], {})
+        self.assertIn("cover", errors[1])
+        self.assertEqual(Book.objects.count(), 2)
+
+    def test_bulk_update(self):
+        payload = [
+            {"id": self.dune.id, "daily_fee": "3.00"},
+            {"id": self.emma.id, "title": "Emma (annotated)"},
+        ]
+
+        resp = self.client.patch(self.url, payload, format="json")
+
+        self.assertEqual(resp.status_code, 200)
+        self.dune.refresh_from_db()
+        self.emma.refresh_from_db()
+        self.assertEqual(str(self.dune.daily_fee), "3.00")
+        self.assertEqual(self.emma.title, "Emma (annotated)")
+
+    def test_bulk_update_unknown_and_duplicate_ids(self):
+        payload = [
+            {"id": self.dune.id, "inventory": 1},
+            {"id": self.dune.id, "inventory": 2},
+            {"id": 0, "inventory": 3},
+        ]
+
+        resp = self.client.patch(self.url, payload, format="json")
+
+        self.assertEqual(resp.status_code, 400)
+        errors = resp.json()
+        self.assertEqual(errors[0], {})
+        self.assertIn("id", errors[1])
+        self.assertIn("id", errors[2])
+
+    def test_bulk_delete(self):
+        resp = self.client.delete(
+            self.url, [{"id": self.dune.id}, {"id": 0}], format="json"
+        )
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json(), [{}, {"id": ["Book does not exist."]}])
+
+        resp = self.client.delete(self.url, [{"id": self.dune.id}], format="json")
+        self.assertEqual(resp.status_code, 204)
+        self.assertFalse(Book.objects.filter(pk=self.dune.pk).exists())
+
+    def test_bulk_inventory_deltas(self):
+        payload = [
+            {"id": self.dune.id, "delta": 3},
+            {"id": self.emma.id, "delta": -5},
+        ]
+
+        resp = self.client.post(self.inventory_url, payload, format="json")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(
+            resp.json(),
+            [
+                {"id": self.dune.id, "inventory": 5},
+                {"id": self.emma.id, "inventory": 0},
+            ],
+        )
+        self.dune.refresh_from_db()
+        self.assertEqual(self.dune.inventory, 5)
+
+    def test_bulk_inventory_cannot_go_negative(self):
+        payload = [
+            {"id": self.dune.id, "delta": 1},
+            {"id": self.emma.id, "delta": -6},
+        ]
+
+        resp = self.client.post(self.inventory_url, payload, format="json")
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json()[0], {})
+        self.assertIn("delta", resp.json()[1])
+        self.dune.refresh_from_db()
+        self.assertEqual(self.dune.inventory, 2)
+
+    def test_bulk_inventory_book_deleted_after_validation(self):
+        serializer = BookInventoryDeltaSerializer(
+            data=[
+                {"id": self.dune.id, "delta": 1},
+                {"id": self.emma.id, "delta": 1},
+            ],
+            many=True,
+        )
+        self.assertTrue(serializer.is_valid())
+        self.emma.delete()
+
+        with self.assertRaises(ValidationError) as error, transaction.atomic():
+            serializer.save()
+
+        self.assertEqual(
+            error.exception.detail,
+            [{}, {"id": ["Book does not exist."]}],
+        )
+        self.dune.refresh_from_db()
+        self.assertEqual(self.dune.inventory, 2)
+
+
+class ValuesSerializerTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@test.com", password="pass")
+        self.book = Book.objects.create(
+            title="Dune", author="Herbert", cover="SOFT", inventory=2, daily_fee=1.5
+        )
+        self.borrowing = Borrowing.objects.create(
+            user=self.user, book=self.book, expected_return=date.today()
+        )
+        Payment.objects.create(
+            borrowing=self.borrowing,
+            status=Payment.PaymentStatus.PENDING,
+            type=Payment.Type.PAYMENT,
+            money_to_pay="3.5",
+        )
+
+    def test_output_matches_model_serializers(self):
+        cases = (
+            (BookListSerializer, Book.objects.all()),
+            (BookSerializer, Book.objects.all()),
+            (BorrowingListSerializer, Borrowing.objects.all()),
+            (PaymentListSerializer, Payment.objects.all()),
+        )
+        for serializer_class, queryset in cases:
+            with self.subTest(serializer_class.__name__):
+                fast = ValuesSerializer.for_serializer(serializer_class)
+                self.assertEqual(
+                    fast.serialize(fast.values(queryset)),
+                    json.loads(json.dumps(serializer_class(queryset, many=True).data)),
+                )
+
+    def test_to_many_fields_are_rejected(self):
+        with self.assertRaises(TypeError):
+            ValuesSerializer(BorrowingDetailSerializer)
+
+    def test_borrowing_list_is_a_single_query(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        sequel = Book.objects.create(
+            title="Dune Messiah",
+            author="Herbert",
+            cover="SOFT",
+            inventory=1,
+            daily_fee=1,
+        )
+        Borrowing.objects.create(
+            user=self.user, book=sequel, expected_return=date.today()
+        )
+        with self.assertNumQueries(1):
+            resp = client.get(reverse("borrowings:borrowing-list"))
+        self.assertEqual(len(resp.json()), 2)
+        self.assertEqual(resp.json()[0]["book"]["title"], "Dune")
+
+
+class BookSparseFieldsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.book = Book.objects.create(
+            title="Dune", author="Herbert", cover="SOFT", inventory=2, daily_fee=1
+        )
+
+    def test_list_and_retrieve(self):
+        resp = self.client.get(reverse("books:book-list"), {"fields": "title,id"})
+        self.assertEqual(resp.json(), [{"id": self.book.id, "title": "Dune"}])
+
+        url = reverse("books:book-detail", args=[self.book.id])
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(url, {"fields": "daily_fee"})
+        self.assertEqual(resp.json(), {"daily_fee": "1.00"})
+        self.assertNotIn("inventory", queries[-1]["sql"])
+
+    def test_sparse_responses_are_cached_per_query(self):
+        url = reverse("books:book-detail", args=[self.book.id])
+        self.client.get(url, {"fields": "title"})
+        self.assertEqual(self.client.get(url).json()["inventory"], 2)
+
+    def test_unknown_fields(self):
+        resp = self.client.get(reverse("books:book-list"), {"fields": "isbn"})
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.get(reverse("books:book-list"), {"expand": "author"})
+        self.assertEqual(resp.status_code, 400)
+
+
+class ORJSONTestCase(TestCase):
+    def test_renderer_matches_drf_json_renderer(self):
+        data = ReturnDict(
+            {
+                "text": 'Zoë     "quoted" </script>',
+                "decimal": Decimal("1.50"),
+                "aware": datetime(2025, 10, 1, 12, 30, 5, 123456, tzinfo=timezone.utc),
+                "naive": datetime(2025, 10, 1, 12, 30),
+                "date": date(2025, 10, 1),
+                "time": time(8, 15),
+                "duration": timedelta(hours=1),
+                "uuid": uuid.UUID(int=1),
+                "lazy": gettext_lazy("Not found."),
+                "error": ErrorDetail("Invalid", code="invalid"),
+                "nested": [{"id": 1, "cover": Book.Cover.SOFT}, (1, 2.5, None, True)],
+                1: "int key",
+            },
+            serializer=None,
+        )
+
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_renderer_falls_back_for_indent(self):
+        data = {"id": 1}
+        self.assertEqual(
+            ORJSONRenderer().render(data, "application/json; indent=4"),
+            JSONRenderer().render(data, "application/json; indent=4"),
+        )
+
+    def test_parser(self):
+        parser = ORJSONParser()
+        self.assertEqual(
+            parser.parse(io.BytesIO(b'{"a": [1, "\\u00eb"]}')), {"a": [1, "ë"]}
+        )
+        with self.assertRaises(ParseError):
+            parser.parse(io.BytesIO(b'{"a": NaN}'))
+
+    def test_api_uses_orjson(self):
+        with patch(
+            "library_project.renderers.orjson.dumps", wraps=orjson.dumps
+        ) as dumps:
+            resp = APIClient().get(reverse("books:book-list"))
+        self.assertEqual(resp.status_code, 200)
+        dumps.assert_called_once()
@@ -0,0 +1,133 @@
+from functools import cache
+
+from rest_framework import serializers
+from rest_framework.response import Response
+
+# Fields whose to_representation returns database values unchanged.
+_PASSTHROUGH = (
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.IntegerField,
+)
+
+
+class ValuesSerializer:
+    """
+    Read-only fast path for a flat or singly nested ModelSerializer.
+
+    The serializer's fields are compiled once into ``values()`` lookups and
+    converters, so rows can be rendered straight from ``queryset.values()``
+    with output identical to ``serializer_class(queryset, many=True).data``
+    but without building model instances or running DRF's per-field
+    machinery. Converters are only kept for fields that actually reshape
+    the value (dates, decimals, ...).
+    """
+
+    def __init__(self, serializer_class):
+        self.fields = _compile(serializer_class(), prefix="")
+        self.lookups = tuple(_lookups(self.fields))
+
+    @classmethod
+    @cache
+    def for_serializer(cls, serializer_class):
+        return cls(serializer_class)
+
+    def values(self, queryset, *extra):
+        """
+        ``queryset.values()`` with every lookup the serializer needs, plus
+        ``extra`` ones such as pagination ordering fields.
+        """
+        extra = [lookup for lookup in extra if lookup not in self.lookups]
+        return queryset.values(*self.lookups, *extra)
+
+    def serialize(self, rows):
+        fields = self.fields
+        return [_build(row, fields) for row in rows]
+
+
+def _compile(serializer, prefix):
+    compiled = []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if isinstance(
+            field, (serializers.ListSerializer, serializers.ManyRelatedField)
+        ):
+            raise TypeError(
+                f"{type(serializer).__name__}.{name}: to-many fields are not "
+                "supported by ValuesSerializer"
+            )
+        lookup = prefix + field.source.replace(".", "__")
+        if isinstance(field, serializers.BaseSerializer):
+            compiled.append((name, lookup, _compile(field, f"{lookup}__")))
+        elif (
+            isinstance(field, serializers.PrimaryKeyRelatedField)
+            and field.pk_field is None
+        ):
+            # values() already yields the foreign key's id
+            compiled.append((name, lookup, None))
+        elif isinstance(field, (serializers.RelatedField, serializers.ModelField)) or (
+            field.source == "*"
+        ):
+            raise TypeError(
+                f"{type(serializer).__name__}.{name} cannot be read from values()"
+            )
+        elif isinstance(field, _PASSTHROUGH) or _identity_choices(field):
+            compiled.append((name, lookup, None))
+        else:
+            compiled.append((name, lookup, field.to_representation))
+    return compiled
+
+
+def _identity_choices(field):
+    return isinstance(field, serializers.ChoiceField) and all(
+        key == value for key, value in field.choice_strings_to_values.items()
+    )
+
+
+def _lookups(fields):
+    for name, lookup, convert in fields:
+        if isinstance(convert, list):
+            yield from _lookups(convert)
+        else:
+            yield lookup
+
+
+def _build(row, fields):
+    data = {}
+    for name, lookup, convert in fields:
+        if convert is None:
+            data[name] = row[lookup]
+        elif isinstance(convert, list):
+            nested = _build(row, convert)
+            data[name] = None if all(v is None for v in nested.values()) else nested
+        else:
+            value = row[lookup]
+            data[name] = None if value is None else convert(value)
+    return data
+
+
+class ValuesListMixin:
+    """
+    Serve the list action through ValuesSerializer. The view's ordering and
+    pagination still apply; pagination just sees dicts instead of models.
+    """
+
+    def list(self, request, *args, **kwargs):
+        # The class of get_serializer() rather than get_serializer_class(),
+        # so view mixins that narrow the serializer apply here as well.
+        fast = ValuesSerializer.for_serializer(type(self.get_serializer()))
+        queryset = self.filter_queryset(self.get_queryset())
+
+        ordering = ()
+        if hasattr(self.paginator, "get_ordering"):
+            ordering = [
+                field.lstrip("-")
+                for field in self.paginator.get_ordering(request, queryset, self)
+            ]
+        rows = fast.values(queryset, *ordering)
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(fast.serialize(page))
+        return Response(fast.serialize(rows))
@@ -1,22 +1,246 @@
-from rest_framework import viewsets, permissions
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiParameter
+from rest_framework import status, viewsets, permissions
+from rest_framework.decorators import action
+from rest_framework.response import Response
 
+from books.cache import (
+    CatalogCacheMixin,
+    autocomplete_cache_key,
+    get_catalog_version,
+)
 from books.models import Book
+from books.pagination import BookCursorPagination
 from books.permissions import IsAdminOrReadOnly
-from books.serializers import BookSerializer, BookListSerializer, BookDetailSerializer
+from books.renderers import CSVRenderer, NDJSONRenderer
+from books.serializers import (
+    BookBulkListSerializer,
+    BookSerializer,
+    BookListSerializer,
+    BookDetailSerializer,
+    BookAutocompleteSerializer,
+    BookIdSerializer,
+    BookInventoryDeltaSerializer,
+)
+from books.sparse import SPARSE_PARAMETERS, SparseFieldsMixin
+from books.values import ValuesListMixin
+from library_project.conditional import ConditionalGetMixin
 
 
-class BookViewSet(viewsets.ModelViewSet):
+@extend_schema_view(
+    list=extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="search",
+                description=(
+                    "Full-text search over title and author. "
+                    "Results are ordered by relevance."
+                ),
+                required=False,
+                type=str,
+            ),
+            *SPARSE_PARAMETERS,
+        ],
+    ),
+    retrieve=extend_schema(parameters=SPARSE_PARAMETERS),
+)
+class BookViewSet(
+    ConditionalGetMixin,
+    CatalogCacheMixin,
+    SparseFieldsMixin,
+    ValuesListMixin,
+    viewsets.ModelViewSet,
+):
     queryset = Book.objects.all()
     serializer_class = BookSerializer
+    pagination_class = BookCursorPagination
+
+    def get_versions(self):
+        return [get_catalog_version()]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        search = self.request.query_params.get("search")
+        if self.action == "list" and search:
+            queryset = queryset.search(search).order_by(
+                *BookCursorPagination.search_ordering
+            )
+        return queryset
 
     def get_serializer_class(self):
         if self.action == "list":
             return BookListSerializer
         elif self.action == "retrieve":
             return BookDetailSerializer
+        elif self.action == "autocomplete":
+            return BookAutocompleteSerializer
+        elif self.action == "bulk" and self.request.method == "DELETE":
+            return BookIdSerializer
+        elif self.action == "bulk_inventory":
+            return BookInventoryDeltaSerializer
         return BookSerializer
 
     def get_permissions(self):
-        if self.action == "list":
+        if self.action in ("list", "autocomplete"):
             return [permissions.AllowAny()]
+        elif self.action in ("export", "bulk", "bulk_inventory"):
+            return [permissions.IsAdminUser()]
         return [IsAdminOrReadOnly()]
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="q",
+                description=(
+                    "Prefix or misspelled fragment of a title or author "
+                    f"(at least {settings.AUTOCOMPLETE_MIN_LENGTH} characters)"
+                ),
+                required=True,
+                type=str,
+            ),
+            OpenApiParameter(
+                name="limit",
+                description=(
+                    f"Number of suggestions, up to {settings.AUTOCOMPLETE_MAX_LIMIT}"
+                ),
+                required=False,
+                type=int,
+            ),
+        ],
+    )
+    @action(detail=False, methods=["get"], pagination_class=None)
+    def autocomplete(self, request):
+        text = " ".join(request.query_params.get("q", "").split()).lower()
+        try:
+            limit = int(request.query_params.get("limit", settings.AUTOCOMPLETE_LIMIT))
+        except ValueError:
+            limit = settings.AUTOCOMPLETE_LIMIT
+        limit = min(max(limit, 1), settings.AUTOCOMPLETE_MAX_LIMIT)
+
+        if len(text) < settings.AUTOCOMPLETE_MIN_LENGTH:
+            return Response([])
+
+        key = autocomplete_cache_key(text, limit)
+        data = cache.get(key)
+        if data is None:
+            books = Book.objects.autocomplete(text, limit)
+            data = self.get_serializer(books, many=True).data
+            cache.set(key, data, settings.AUTOCOMPLETE_CACHE_TTL)
+        return Response(data)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="format",
+                description="`ndjson` (default) or `csv`",
+                required=False,
+                type=str,
+                enum=["ndjson", "csv"],
+            ),
+        ],
+        responses={
+            (200, "application/x-ndjson"): OpenApiTypes.STR,
+            (200, "text/csv"): OpenApiTypes.STR,
+        },
+    )
+    @action(
+        detail=False,
+        methods=["get"],
+        renderer_classes=[NDJSONRenderer, CSVRenderer],
+        pagination_class=None,
+    )
+    def export(self, request, format=None):
+        """
+        Stream the whole catalog, one row at a time, for admins.
+        """
+        renderer = request.accepted_renderer
+        fields = BookSerializer.Meta.fields
+        rows = (
+            Book.objects.order_by("id")
+            .values_list(*fields)
+            .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+        )
+        response = StreamingHttpResponse(
+            renderer.stream(fields, rows),
+            content_type=f"{renderer.media_type}; charset={renderer.charset}",
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="books.{renderer.format}"'
+        )
+        return response
+
+    @extend_schema(
+        description=(
+            "Create (`POST`), partially update (`PATCH`, every item needs its "
+            '`id`) or delete (`DELETE`, items are `{"id": ...}`) up to '
+            f"{settings.BOOK_BULK_MAX_ITEMS} books at once. The batch is applied "
+            "in one transaction only if every item is valid; otherwise the "
+            "response is a list of errors with one entry per item."
+        ),
+    )
+    @action(
+        detail=False,
+        methods=["post", "patch", "delete"],
+        url_path="bulk",
+        pagination_class=None,
+    )
+    def bulk(self, request):
+        instance = None
+        if request.method == "PATCH":
+            instance = BookBulkListSerializer.instances_for(request.data)
+
+        serializer = self.get_serializer(
+            instance,
+            data=request.data,
+            many=True,
+            partial=request.method == "PATCH",
+            allow_empty=False,
+            max_length=settings.BOOK_BULK_MAX_ITEMS,
+        )
+        serializer.is_valid(raise_exception=True)
+
+        if request.method == "DELETE":
+            ids = [item["id"] for item in serializer.validated_data]
+            with transaction.atomic():
+                Book.objects.filter(id__in=ids).delete()
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        with transaction.atomic():
+            serializer.save()
+        return Response(
+            serializer.data,
+            status=(
+                status.HTTP_201_CREATED
+                if request.method == "POST"
+                else status.HTTP_200_OK
+            ),
+        )
+
+    @extend_schema(
+        description=(
+            "Add `delta` to the inventory of each listed book with a single "
+            "UPDATE. Nothing changes if any book is unknown or would end up "
+            "with a negative inventory."
+        ),
+    )
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="bulk/inventory",
+        pagination_class=None,
+    )
+    def bulk_inventory(self, request):
+        serializer = self.get_serializer(
+            data=request.data,
+            many=True,
+            allow_empty=False,
+            max_length=settings.BOOK_BULK_MAX_ITEMS,
+        )
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            serializer.save()
+        return Response(serializer.data)
@@ -0,0 +1,16 @@
+from books.cache import bump_version, get_version
+
+
+def borrowing_version_key(user_id=None):
+    """
+    Version of one user's borrowings, or of everyone's when no user is given.
+    """
+    return f"borrowings:version:{user_id or 'all'}"
+
+
+def get_borrowing_version(user_id=None):
+    return get_version(borrowing_version_key(user_id))
+
+
+def bump_borrowing_version(user_id):
+    bump_version(borrowing_version_key(user_id), borrowing_version_key())
@@ -0,0 +1,255 @@
+import re
+from datetime import date
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from borrowings.models import ARCHIVE_TABLE, Borrowing
+from payment.models import Payment, PaymentOutbox
+from telegram_bot.models import NotificationLog
+
+TABLE = Borrowing._meta.db_table
+DEFAULT_PARTITION = f"{TABLE}_default"
+PARTITION_NAME = re.compile(rf"^{TABLE}_p(\d{{4}})(\d{{2}})$")
+
+
+class Command(BaseCommand):
+    help = (
+        "Maintains the monthly partitions of the borrowing table: creates them "
+        "ahead of time, moves rows out of the default partition, moves months "
+        "in which every book was returned and paid for to the archive table and "
+        "optionally detaches old archived months for good."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ahead",
+            type=int,
+            default=settings.BORROWING_PARTITIONS_AHEAD,
+            help="Months to create after the current one",
+        )
+        parser.add_argument(
+            "--archive-after",
+            type=int,
+            default=settings.BORROWING_ARCHIVE_AFTER_MONTHS,
+            help="Age in months after which a partition is archived",
+        )
+        parser.add_argument(
+            "--detach-after",
+            type=int,
+            default=settings.BORROWING_DETACH_AFTER_MONTHS,
+            help="Age in months after which an archived partition is detached",
+        )
+        parser.add_argument(
+            "--tablespace",
+            default=settings.BORROWING_ARCHIVE_TABLESPACE,
+            help="Tablespace archived partitions are moved to",
+        )
+
+    def handle(self, *args, **options):
+        if options["ahead"] < 0:
+            raise CommandError("--ahead cannot be negative")
+        if options["archive_after"] < 1:
+            raise CommandError("--archive-after must be at least 1")
+        detach_after = options["detach_after"]
+        if detach_after is not None and detach_after <= options["archive_after"]:
+            raise CommandError("--detach-after must be greater than --archive-after")
+
+        current = date.today().replace(day=1)
+        self._create_partitions(current, options["ahead"])
+        self._archive(
+            _add_months(current, -options["archive_after"]), options["tablespace"]
+        )
+        if detach_after is not None:
+            self._detach(_add_months(current, -detach_after))
+
+    def _create_partitions(self, current, ahead):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT MIN(borrow_date) FROM {DEFAULT_PARTITION}")
+            (oldest,) = cursor.fetchone()
+
+        month = min(oldest, current).replace(day=1) if oldest else current
+        last = _add_months(current, ahead)
+        while month <= last:
+            name = _partition_name(month)
+            if not _exists(name):
+                moved = self._create_partition(name, month)
+                self.stdout.write(
+                    f"Created {name}, moved {moved} rows from {DEFAULT_PARTITION}"
+                )
+            month = _add_months(month, 1)
+
+    def _create_partition(self, name, month):
+        """
+        Create the partition beside the table, fill it with the month's rows
+        from the default partition and attach it, all in one transaction.
+        """
+        bounds = [month, _add_months(month, 1)]
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)")
+            cursor.execute(
+                f"""
+                WITH moved AS (
+                    DELETE FROM {DEFAULT_PARTITION}
+                    WHERE borrow_date >= %s AND borrow_date < %s
+                    RETURNING *
+                )
+                INSERT INTO {name} SELECT * FROM moved
+                """,
+                bounds,
+            )
+            moved = cursor.rowcount
+            cursor.execute(
+                f"ALTER TABLE {TABLE} ATTACH PARTITION {name} "
+                "FOR VALUES FROM (%s) TO (%s)",
+                bounds,
+            )
+        return moved
+
+    def _archive(self, cutoff, tablespace):
+        """
+        Archived borrowings are history: their partitions drop the foreign
+        keys to books and users, whose ORM cascades only reach live rows,
+        and their notification log entries are deleted. Paid and abandoned
+        payments stay and keep pointing at them through BorrowingHistory.
+        """
+        if tablespace:
+            tablespace = connection.ops.quote_name(tablespace)
+        for name, _ in _partitions(ARCHIVE_TABLE):
+            # partitions archived before their foreign keys were dropped
+            with connection.cursor() as cursor:
+                _drop_foreign_keys(cursor, name)
+
+        for name, month in _partitions(TABLE):
+            if _add_months(month, 1) > cutoff:
+                continue
+
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f"SELECT EXISTS (SELECT 1 FROM {name} "
+                    "WHERE actual_return_date IS NULL)"
+                )
+                if cursor.fetchone()[0]:
+                    self.stdout.write(f"Keeping {name}: it still has active borrowings")
+                    continue
+
+                # A pending payment only holds its month back while it can
+                # still be paid: its session is open, or the outbox has yet
+                # to create one. Abandoned ones do not.
+                cursor.execute(
+                    f"""
+                    SELECT EXISTS (
+                        SELECT 1 FROM {Payment._meta.db_table} payment
+                        JOIN {name} borrowing ON borrowing.id = payment.borrowing_id
+                        LEFT JOIN {PaymentOutbox._meta.db_table} outbox
+                            ON outbox.payment_id = payment.id
+                        WHERE payment.status = %s AND (
+                            payment.session_expires_at > now()
+                            OR payment.session_id IS NULL
+                                AND outbox.processed_at IS NULL
+                                AND outbox.failed_at IS NULL
+                                AND outbox.id IS NOT NULL
+                        )
+                    )
+                    """,
+                    [Payment.PaymentStatus.PENDING],
+                )
+                if cursor.fetchone()[0]:
+                    self.stdout.write(f"Keeping {name}: it still has pending payments")
+                    continue
+
+                cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {name}")
+                _drop_foreign_keys(cursor, name)
+                cursor.execute(
+                    f"DELETE FROM {NotificationLog._meta.db_table} "
+                    f"WHERE borrowing_id IN (SELECT id FROM {name})"
+                )
+                if tablespace:
+                    cursor.execute(f"ALTER TABLE {name} SET TABLESPACE {tablespace}")
+                    for index in _indexes(cursor, name):
+                        cursor.execute(
+                            f"ALTER INDEX {index} SET TABLESPACE {tablespace}"
+                        )
+                cursor.execute(
+                    f"ALTER TABLE {ARCHIVE_TABLE} ATTACH PARTITION {name} "
+                    "FOR VALUES FROM (%s) TO (%s)",
+                    [month, _add_months(month, 1)],
+                )
+            self.stdout.write(f"Archived {name}")
+
+    def _detach(self, cutoff):
+        for name, month in _partitions(ARCHIVE_TABLE):
+            if _add_months(month, 1) > cutoff:
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f"ALTER TABLE {ARCHIVE_TABLE} DETACH PARTITION {name}")
+            self.stdout.write(
+                f"Detached {name}, it is no longer read and can be dumped and dropped"
+            )
+
+
+def _add_months(month, months):
+    years, index = divmod(month.month - 1 + months, 12)
+    return date(month.year + years, index + 1, 1)
+
+
+def _partition_name(month):
+    return f"{TABLE}_p{month.year:04d}{month.month:02d}"
+
+
+def _exists(name):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [name])
+        return cursor.fetchone()[0]
+
+
+def _partitions(parent):
+    """
+    ``(name, first day of month)`` of the monthly partitions of ``parent``.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = inhrelid
+            WHERE inhparent = %s::regclass
+            ORDER BY child.relname
+            """,
+            [parent],
+        )
+        names = [name for (name,) in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions.append((name, date(int(match[1]), int(match[2]), 1)))
+    return partitions
+
+
+def _drop_foreign_keys(cursor, table):
+    cursor.execute(
+        "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass "
+        "AND contype = 'f'",
+        [table],
+    )
+    for (constraint,) in cursor.fetchall():
+        cursor.execute(
+            f"ALTER TABLE {table} DROP CONSTRAINT "
+            f"{connection.ops.quote_name(constraint)}"
+        )
+
+
+def _indexes(cursor, table):
+    cursor.execute(
+        """
+        SELECT idx.relname
+        FROM pg_index
+        JOIN pg_class idx ON idx.oid = indexrelid
+        WHERE indrelid = %s::regclass
+        """,
+        [table],
+    )
+    return [name for (name,) in cursor.fetchall()]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-17 06:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0005_book_natural_key_idx"),
+        ("borrowings", "0002_borrowing_pagination_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="borrowing",
+            index=models.Index(
+                condition=models.Q(("actual_return_date__isnull", True)),
+                fields=["expected_return"],
+                name="borrowing_active_expected_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="borrowing",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("actual_return_date__isnull", True)),
+                fields=("user", "book"),
+                name="borrowing_active_user_book_uniq",
+                violation_error_message="This book is already borrowed by the user.",
+            ),
+        ),
+    ]
@@ -0,0 +1,181 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+COLUMNS = "id, borrow_date, expected_return, actual_return_date, book_id, user_id"
+ARCHIVE_TABLE = "borrowings_borrowing_archive"
+HISTORY_VIEW = "borrowings_borrowing_history"
+
+
+def partition_borrowings(apps, schema_editor):
+    """
+    Rebuild borrowings_borrowing as a table range-partitioned by
+    borrow_date, next to an archive table for old partitions and a view
+    over both. Existing rows land in the default partition until the
+    borrowing_partitions command moves them into monthly ones.
+    """
+    Borrowing = apps.get_model("borrowings", "Borrowing")
+    Book = apps.get_model("books", "Book")
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    table = Borrowing._meta.db_table
+
+    schema_editor.execute(
+        f"""
+        CREATE TABLE {table}_partitioned (
+            id bigint GENERATED BY DEFAULT AS IDENTITY,
+            borrow_date date NOT NULL,
+            expected_return date NOT NULL,
+            actual_return_date date NULL,
+            book_id bigint NOT NULL,
+            user_id bigint NOT NULL,
+            PRIMARY KEY (id, borrow_date)
+        ) PARTITION BY RANGE (borrow_date)
+        """
+    )
+    schema_editor.execute(
+        f"CREATE TABLE {table}_default PARTITION OF {table}_partitioned DEFAULT"
+    )
+    schema_editor.execute(
+        f"INSERT INTO {table}_partitioned ({COLUMNS}) SELECT {COLUMNS} FROM {table}"
+    )
+    schema_editor.execute(f"DROP TABLE {table}")
+    schema_editor.execute(f"ALTER TABLE {table}_partitioned RENAME TO {table}")
+    schema_editor.execute(
+        f"ALTER SEQUENCE {table}_partitioned_id_seq RENAME TO {table}_id_seq"
+    )
+    schema_editor.execute(
+        f"""
+        SELECT setval('{table}_id_seq', COALESCE(MAX(id), 1), MAX(id) IS NOT NULL)
+        FROM {table}
+        """
+    )
+
+    for column, target in (("book_id", Book), ("user_id", User)):
+        schema_editor.execute(
+            f"""
+            ALTER TABLE {table} ADD CONSTRAINT {table}_{column}_fk
+            FOREIGN KEY ({column}) REFERENCES {target._meta.db_table} (id)
+            DEFERRABLE INITIALLY DEFERRED
+            """
+        )
+        schema_editor.execute(
+            f"CREATE INDEX {table}_{column}_idx ON {table} ({column})"
+        )
+    for index in Borrowing._meta.indexes:
+        schema_editor.add_index(Borrowing, index)
+
+    # The archive mirrors the indexes used to list returned borrowings.
+    schema_editor.execute(
+        f"CREATE TABLE {ARCHIVE_TABLE} (LIKE {table}) PARTITION BY RANGE (borrow_date)"
+    )
+    schema_editor.execute(
+        f"CREATE INDEX borrowing_archive_borrow_date_id_idx "
+        f"ON {ARCHIVE_TABLE} (borrow_date, id)"
+    )
+    schema_editor.execute(
+        f"CREATE INDEX borrowing_archive_user_borrow_date_idx "
+        f"ON {ARCHIVE_TABLE} (user_id, borrow_date, id)"
+    )
+    schema_editor.execute(
+        f"""
+        CREATE VIEW {HISTORY_VIEW} AS
+        SELECT {COLUMNS} FROM {table}
+        UNION ALL
+        SELECT {COLUMNS} FROM {ARCHIVE_TABLE}
+        """
+    )
+
+
+def unpartition_borrowings(apps, schema_editor):
+    """
+    Back to a plain table, with the archived borrowings folded in.
+    """
+    Borrowing = apps.get_model("borrowings", "Borrowing")
+    table = Borrowing._meta.db_table
+
+    schema_editor.execute(
+        f"CREATE TEMPORARY TABLE borrowing_rows AS SELECT * FROM {HISTORY_VIEW}"
+    )
+    schema_editor.execute(f"DROP VIEW {HISTORY_VIEW}")
+    schema_editor.execute(f"DROP TABLE {ARCHIVE_TABLE}, {table} CASCADE")
+    schema_editor.create_model(Borrowing)
+    schema_editor.execute(
+        f"INSERT INTO {table} ({COLUMNS}) SELECT {COLUMNS} FROM borrowing_rows"
+    )
+    schema_editor.execute("DROP TABLE borrowing_rows")
+    schema_editor.execute(
+        f"""
+        SELECT setval(pg_get_serial_sequence('{table}', 'id'),
+                      COALESCE(MAX(id), 1), MAX(id) IS NOT NULL)
+        FROM {table}
+        """
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0005_book_natural_key_idx"),
+        ("borrowings", "0003_active_borrowing_indexes"),
+        # Foreign keys to borrowings cannot survive the rebuild.
+        ("payment", "0003_payment_borrowing_without_db_constraint"),
+        ("telegram_bot", "0004_notification_borrowing_without_db_constraint"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # A unique index on a partitioned table must include borrow_date, so
+        # the active-borrowing constraint becomes a plain partial index; see
+        # BorrowingQuerySet.lock_active.
+        migrations.RemoveConstraint(
+            model_name="borrowing",
+            name="borrowing_active_user_book_uniq",
+        ),
+        migrations.AddIndex(
+            model_name="borrowing",
+            index=models.Index(
+                condition=models.Q(("actual_return_date__isnull", True)),
+                fields=["user", "book"],
+                name="borrowing_active_user_book_idx",
+            ),
+        ),
+        migrations.RunPython(partition_borrowings, unpartition_borrowings),
+        migrations.CreateModel(
+            name="BorrowingHistory",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("borrow_date", models.DateField()),
+                ("expected_return", models.DateField()),
+                ("actual_return_date", models.DateField(blank=True, null=True)),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="books.book",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "borrowings_borrowing_history",
+                "ordering": ["borrow_date"],
+                "managed": False,
+            },
+        ),
+    ]
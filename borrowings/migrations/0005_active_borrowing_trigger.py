@@ -0,0 +1,50 @@
+from django.db import migrations
+
+# Unique indexes on the partitioned table must include borrow_date, so one
+# active borrowing per (user, book) is enforced by a trigger instead. It
+# takes the advisory lock of BorrowingQuerySet.lock_active, so concurrent
+# writers from any path are serialized on the pair and the later one sees
+# the earlier one's row.
+CREATE_TRIGGER = """
+CREATE FUNCTION borrowing_check_active_user_book() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(
+        hashtextextended('borrowing:' || NEW.user_id || ':' || NEW.book_id, 0)
+    );
+    IF EXISTS (
+        SELECT 1 FROM borrowings_borrowing
+        WHERE user_id = NEW.user_id
+          AND book_id = NEW.book_id
+          AND actual_return_date IS NULL
+          AND id <> NEW.id
+    ) THEN
+        RAISE unique_violation USING
+            MESSAGE = 'This book is already borrowed by the user.',
+            CONSTRAINT = 'borrowing_active_user_book_uniq';
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER borrowing_active_user_book_uniq
+BEFORE INSERT OR UPDATE OF user_id, book_id, actual_return_date
+ON borrowings_borrowing
+FOR EACH ROW WHEN (NEW.actual_return_date IS NULL)
+EXECUTE FUNCTION borrowing_check_active_user_book();
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER borrowing_active_user_book_uniq ON borrowings_borrowing;
+DROP FUNCTION borrowing_check_active_user_book();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("borrowings", "0004_partition_borrowings"),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+    ]
@@ -1,8 +1,35 @@
-from django.db import models
+from django.db import connection, models
 
 from books.models import Book
 from library_project import settings
 
+ACTIVE = models.Q(actual_return_date__isnull=True)
+
+# Borrowings are range-partitioned by borrow_date (see the
+# borrowing_partitions command). Old partitions move under ARCHIVE_TABLE,
+# and HISTORY_VIEW reads both.
+ARCHIVE_TABLE = "borrowings_borrowing_archive"
+HISTORY_VIEW = "borrowings_borrowing_history"
+
+
+class BorrowingQuerySet(models.QuerySet):
+    def lock_active(self, user_id, book_id):
+        """
+        Hold a transaction-level lock on "user borrows book", so at most one
+        transaction at a time can check for and create an active borrowing
+        of that pair. A unique index cannot do it on the partitioned table;
+        the borrowing_active_user_book_uniq trigger takes the same lock and
+        rejects a second active borrowing written by any other path.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_advisory_xact_lock(hashtextextended(%s, 0))",
+                [f"borrowing:{user_id}:{book_id}"],
+            )
+
+    def has_active(self, user_id, book_id):
+        return self.filter(ACTIVE, user_id=user_id, book_id=book_id).exists()
+
 
 class Borrowing(models.Model):
     borrow_date = models.DateField(auto_now_add=True)
@@ -11,8 +38,48 @@ class Borrowing(models.Model):
     book = models.ForeignKey(Book, related_name="book", on_delete=models.CASCADE)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
 
+    objects = BorrowingQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.borrow_date} - {self.expected_return}"
 
     class Meta:
         ordering = ["borrow_date"]
+        indexes = [
+            models.Index(
+                fields=["borrow_date", "id"], name="borrowing_borrow_date_id_idx"
+            ),
+            models.Index(
+                fields=["user", "borrow_date", "id"],
+                name="borrowing_user_borrow_date_idx",
+            ),
+            models.Index(
+                fields=["expected_return"],
+                condition=ACTIVE,
+                name="borrowing_active_expected_idx",
+            ),
+            models.Index(
+                fields=["user", "book"],
+                condition=ACTIVE,
+                name="borrowing_active_user_book_idx",
+            ),
+        ]
+
+
+class BorrowingHistory(models.Model):
+    """
+    Read-only view over live and archived borrowings.
+    """
+
+    borrow_date = models.DateField()
+    expected_return = models.DateField()
+    actual_return_date = models.DateField(blank=True, null=True)
+    book = models.ForeignKey(Book, related_name="+", on_delete=models.DO_NOTHING)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, related_name="+", on_delete=models.DO_NOTHING
+    )
+
+    class Meta:
+        managed = False
+        db_table = HISTORY_VIEW
+        ordering = ["borrow_date"]
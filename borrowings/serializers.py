@@ -45,7 +45,7 @@ class BorrowingListSerializer(serializers.ModelSerializer):
 
 class BorrowingDetailSerializer(serializers.ModelSerializer):
     book = BookDetailSerializer(read_only=True)
-    payment = PaymentListSerializer(read_only=True, many=True)
+    payment = PaymentListSerializer(source="payment_set", read_only=True, many=True)
 
     class Meta:
         model = Borrowing
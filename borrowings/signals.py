@@ -0,0 +1,55 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from books.models import Book
+from borrowings.cache import bump_borrowing_version
+from borrowings.models import ARCHIVE_TABLE, Borrowing
+from payment.models import Payment
+
+
+@receiver(post_save, sender=Borrowing)
+@receiver(post_delete, sender=Borrowing)
+def invalidate_borrowing_version(sender, instance, **kwargs):
+    bump_borrowing_version(instance.user_id)
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def invalidate_payment_borrowing_version(sender, instance, **kwargs):
+    if Payment.borrowing.is_cached(instance):
+        user_id = instance.borrowing.user_id
+    else:
+        # A borrowing that is gone or archived leaves only the staff-wide
+        # version to move.
+        user_id = (
+            Borrowing.objects.filter(pk=instance.borrowing_id)
+            .values_list("user_id", flat=True)
+            .first()
+        )
+    bump_borrowing_version(user_id)
+
+
+@receiver(post_delete, sender=Book)
+def delete_archived_borrowings_of_book(sender, instance, **kwargs):
+    _delete_archived_borrowings("book_id", instance.pk)
+
+
+@receiver(post_delete, sender=get_user_model())
+def delete_archived_borrowings_of_user(sender, instance, **kwargs):
+    _delete_archived_borrowings("user_id", instance.pk)
+
+
+def _delete_archived_borrowings(column, value):
+    """
+    Archived borrowings have no foreign keys, so the ORM cascade does not
+    reach them; delete them and their payments the same way.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {ARCHIVE_TABLE} WHERE {column} = %s RETURNING id", [value]
+        )
+        borrowing_ids = [borrowing_id for (borrowing_id,) in cursor.fetchall()]
+    if borrowing_ids:
+        Payment.objects.filter(borrowing_id__in=borrowing_ids).delete()
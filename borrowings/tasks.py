@@ -0,0 +1,7 @@
+from celery import shared_task
+from django.core.management import call_command
+
+
+@shared_task
+def maintain_borrowing_partitions():
+    call_command("borrowing_partitions")
@@ -1,20 +1,35 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, timedelta
 from unittest.mock import patch, MagicMock
 
+import stripe
+
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 
 from books.models import Book
-from borrowings.models import Borrowing
-from payment.models import Payment
+from borrowings.models import Borrowing, BorrowingHistory
+from payment.models import Payment, PaymentOutbox
+from payment.services import fulfil_payment_outbox
+from telegram_bot.models import NotificationLog
 
 User = get_user_model()
 
 
 class BorrowingViewSetTestCase(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         self.user = User.objects.create_user(email="user@test.com", password="pass")
         self.staff_user = User.objects.create_user(
@@ -43,14 +58,81 @@ class BorrowingViewSetTestCase(TestCase):
         }
 
         resp = self.client.post(url, data)
-        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.status_code, 202)
         self.assertTrue(
             Borrowing.objects.filter(user=self.user, book=self.book2).exists()
         )
         self.book2.refresh_from_db()
         self.assertEqual(self.book2.inventory, 2)
 
-    @patch("payment.services.stripe.checkout.Session.create")
+        payment = Payment.objects.get(borrowing__book=self.book2)
+        self.assertEqual(payment.status, Payment.PaymentStatus.PENDING)
+        self.assertEqual(payment.session_url, "")
+        self.assertTrue(PaymentOutbox.objects.filter(payment=payment).exists())
+        self.assertEqual(resp.json()["payment"]["id"], payment.id)
+        self.assertEqual(resp["Location"], resp.json()["payment"]["url"])
+
+    @patch("telegram_bot.tasks.notify_borrowing_created")
+    @patch("borrowings.views.process_payment_outbox")
+    def test_borrowing_create_enqueues_outbox_after_commit(self, mock_task, _):
+        url = reverse("borrowings:borrowing-list")
+        self.client.force_authenticate(self.user)
+        data = {
+            "book": self.book2.id,
+            "expected_return": str(date.today() + timedelta(days=7)),
+        }
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, data)
+
+        outbox = PaymentOutbox.objects.get(payment__borrowing__book=self.book2)
+        mock_task.delay.assert_called_once_with(outbox.id)
+
+    def test_borrowing_create_out_of_stock(self):
+        Book.objects.filter(pk=self.book2.pk).update(inventory=0)
+        url = reverse("borrowings:borrowing-list")
+        self.client.force_authenticate(self.user)
+        data = {
+            "book": self.book2.id,
+            "expected_return": str(date.today() + timedelta(days=7)),
+        }
+
+        resp = self.client.post(url, data)
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("out of stock", resp.json()[0])
+        self.assertFalse(
+            Borrowing.objects.filter(user=self.user, book=self.book2).exists()
+        )
+        self.book2.refresh_from_db()
+        self.assertEqual(self.book2.inventory, 0)
+
+    def test_borrowing_create_twice(self):
+        url = reverse("borrowings:borrowing-list")
+        self.client.force_authenticate(self.user)
+        data = {
+            "book": self.book2.id,
+            "expected_return": str(date.today() + timedelta(days=7)),
+        }
+
+        self.assertEqual(self.client.post(url, data).status_code, 202)
+        resp = self.client.post(url, data)
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("You already borrowed Book2", resp.json()[0])
+        self.book2.refresh_from_db()
+        self.assertEqual(self.book2.inventory, 2)
+        self.assertEqual(Payment.objects.filter(borrowing__book=self.book2).count(), 1)
+
+    def test_returned_book_can_be_borrowed_again(self):
+        self.borrowing.actual_return_date = date.today()
+        self.borrowing.save()
+        self.client.force_authenticate(self.user)
+        resp = self.client.post(
+            reverse("borrowings:borrowing-list"),
+            {"book": self.book1.id, "expected_return": str(date.today())},
+        )
+        self.assertEqual(resp.status_code, 202)
+
+    @patch("stripe.checkout.SessionService.create")
     def test_borrowing_return_and_fine(self, mock_stripe_create):
         # Мокаем сессию Stripe
         mock_session = MagicMock()
@@ -76,7 +158,70 @@ class BorrowingViewSetTestCase(TestCase):
         self.assertIsNotNone(fine_payment)
         self.assertEqual(fine_payment.money_to_pay, 4.00)
 
-    @patch("payment.services.stripe.checkout.Session.create")
+    @patch("payment.tasks.process_payment_outbox.delay")
+    @patch("stripe.checkout.SessionService.create")
+    def test_borrowing_return_queues_fine_session(self, mock_stripe_create, delay):
+        mock_stripe_create.return_value = MagicMock(
+            id="sess_fine", url="https://stripe.test/fine"
+        )
+        url = reverse("borrowings:return-book", args=[self.borrowing.id])
+        self.client.force_authenticate(self.user)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            resp = self.client.post(url)
+
+        self.assertEqual(resp.status_code, 200)
+        mock_stripe_create.assert_not_called()
+        payment = Payment.objects.get(borrowing=self.borrowing)
+        self.assertEqual(payment.type, Payment.Type.FINE)
+        self.assertEqual(payment.money_to_pay, 4)
+        self.assertIsNone(payment.session_id)
+        self.assertEqual(resp.json()["fine_payment"]["id"], payment.id)
+        self.assertEqual(resp.json()["fine_payment"]["status"], "PENDING")
+
+        outbox = PaymentOutbox.objects.get(payment=payment)
+        for callback in callbacks:
+            callback()
+        delay.assert_called_once_with(outbox.id)
+
+        fulfil_payment_outbox(outbox.id)
+        params = mock_stripe_create.call_args[0][0]
+        price_data = params["line_items"][0]["price_data"]
+        self.assertEqual(price_data["unit_amount"], 400)
+        self.assertEqual(price_data["product_data"]["name"], "Late return fine: Book1")
+        payment.refresh_from_db()
+        self.assertEqual(payment.session_url, "https://stripe.test/fine")
+
+    @patch(
+        "stripe.checkout.SessionService.create",
+        side_effect=stripe.APIConnectionError("Stripe is down"),
+    )
+    def test_borrowing_return_does_not_wait_for_stripe(self, mock_stripe_create):
+        url = reverse("borrowings:return-book", args=[self.borrowing.id])
+        self.client.force_authenticate(self.user)
+
+        resp = self.client.post(url)
+
+        self.assertEqual(resp.status_code, 200)
+        mock_stripe_create.assert_not_called()
+        self.borrowing.refresh_from_db()
+        self.book1.refresh_from_db()
+        self.assertEqual(self.borrowing.actual_return_date, date.today())
+        self.assertEqual(self.book1.inventory, 6)
+
+    def test_borrowing_return_on_time_has_no_fine(self):
+        self.borrowing.expected_return = date.today()
+        self.borrowing.save()
+        self.client.force_authenticate(self.user)
+
+        resp = self.client.post(
+            reverse("borrowings:return-book", args=[self.borrowing.id])
+        )
+
+        self.assertIsNone(resp.json()["fine_payment"])
+        self.assertFalse(PaymentOutbox.objects.exists())
+
+    @patch("stripe.checkout.SessionService.create")
     def test_borrowing_return_twice(self, mock_stripe_create):
         mock_session = MagicMock()
         mock_session.id = "sess_test"
@@ -93,6 +238,662 @@ class BorrowingViewSetTestCase(TestCase):
         self.assertEqual(resp2.status_code, 400)
         self.assertIn("This book was returned", resp2.json()["detail"])
 
+    def test_borrowing_create_replays_idempotency_key(self):
+        url = reverse("borrowings:borrowing-list")
+        self.client.force_authenticate(self.user)
+        data = {
+            "book": self.book2.id,
+            "expected_return": str(date.today() + timedelta(days=7)),
+        }
+
+        resp1 = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY="borrow-1")
+        self.assertEqual(resp1.status_code, 202)
+        with self.assertNumQueries(0):
+            resp2 = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY="borrow-1")
+
+        self.assertEqual(resp2.status_code, 202)
+        self.assertEqual(resp2.json(), resp1.json())
+        self.assertEqual(resp2["Location"], resp1["Location"])
+        self.assertEqual(resp2["Idempotent-Replayed"], "true")
+        self.book2.refresh_from_db()
+        self.assertEqual(self.book2.inventory, 2)
+        self.assertEqual(Payment.objects.filter(borrowing__book=self.book2).count(), 1)
+
+    def test_idempotency_key_is_scoped_to_request_and_user(self):
+        url = reverse("borrowings:borrowing-list")
+        data = {
+            "book": self.book2.id,
+            "expected_return": str(date.today() + timedelta(days=7)),
+        }
+        self.client.force_authenticate(self.user)
+        self.client.post(url, data, HTTP_IDEMPOTENCY_KEY="key")
+
+        other = dict(data, expected_return=str(date.today() + timedelta(days=8)))
+        resp = self.client.post(url, other, HTTP_IDEMPOTENCY_KEY="key")
+        self.assertEqual(resp.status_code, 422)
+
+        self.client.force_authenticate(self.staff_user)
+        resp = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY="key")
+        self.assertEqual(resp.status_code, 202)
+        self.assertNotIn("Idempotent-Replayed", resp)
+
+    def test_idempotency_key_in_progress(self):
+        url = reverse("borrowings:borrowing-list")
+        data = {
+            "book": self.book2.id,
+            "expected_return": str(date.today() + timedelta(days=7)),
+        }
+        self.client.force_authenticate(self.user)
+        retries = []
+
+        def retry(*args):
+            retries.append(self.client.post(url, data, HTTP_IDEMPOTENCY_KEY="key"))
+            return False
+
+        with patch("borrowings.views.Borrowing.objects.has_active", retry):
+            resp = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY="key")
+
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(retries[0].status_code, 409)
+
+    def test_client_error_is_replayed_for_its_idempotency_key(self):
+        Book.objects.filter(pk=self.book2.pk).update(inventory=0)
+        url = reverse("borrowings:borrowing-list")
+        data = {
+            "book": self.book2.id,
+            "expected_return": str(date.today() + timedelta(days=7)),
+        }
+        self.client.force_authenticate(self.user)
+        resp = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY="key")
+        self.assertEqual(resp.status_code, 400)
+
+        Book.objects.filter(pk=self.book2.pk).update(inventory=1)
+        with self.assertNumQueries(0):
+            resp = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY="key")
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("out of stock", resp.json()[0])
+        self.assertEqual(resp["Idempotent-Replayed"], "true")
+
+        resp = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY="other-key")
+        self.assertEqual(resp.status_code, 202)
+
+    def test_unhandled_error_releases_idempotency_key(self):
+        url = reverse("borrowings:borrowing-list")
+        data = {
+            "book": self.book2.id,
+            "expected_return": str(date.today() + timedelta(days=7)),
+        }
+        self.client.force_authenticate(self.user)
+        with patch(
+            "borrowings.views.Borrowing.objects.has_active",
+            side_effect=RuntimeError("database went away"),
+        ):
+            with self.assertRaises(RuntimeError):
+                self.client.post(url, data, HTTP_IDEMPOTENCY_KEY="key")
+
+        resp = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY="key")
+        self.assertEqual(resp.status_code, 202)
+
+    def test_borrowing_return_replays_idempotency_key(self):
+        url = reverse("borrowings:return-book", args=[self.borrowing.id])
+        self.client.force_authenticate(self.user)
+
+        resp1 = self.client.post(url, HTTP_IDEMPOTENCY_KEY="return-1")
+        resp2 = self.client.post(url, HTTP_IDEMPOTENCY_KEY="return-1")
+
+        self.assertEqual(resp1.status_code, 200)
+        self.assertEqual(resp2.status_code, 200)
+        self.assertEqual(resp2.json(), resp1.json())
+        self.assertEqual(
+            Payment.objects.filter(
+                borrowing=self.borrowing, type=Payment.Type.FINE
+            ).count(),
+            1,
+        )
+        self.assertEqual(PaymentOutbox.objects.count(), 1)
+
+    def test_borrowing_list_cursor_pagination(self):
+        older = Borrowing.objects.create(
+            user=self.user, book=self.book2, expected_return=date.today()
+        )
+        Borrowing.objects.filter(pk=older.pk).update(
+            borrow_date=date.today() - timedelta(days=10),
+            actual_return_date=date.today() - timedelta(days=5),
+        )
+        newer = Borrowing.objects.create(
+            user=self.user, book=self.book2, expected_return=date.today()
+        )
+        url = reverse("borrowings:borrowing-list")
+        self.client.force_authenticate(self.user)
+
+        resp = self.client.get(url, {"page_size": 2})
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual(
+            [item["id"] for item in data["results"]], [older.id, self.borrowing.id]
+        )
+
+        data = self.client.get(data["next"]).json()
+        self.assertEqual([item["id"] for item in data["results"]], [newer.id])
+        self.assertIsNone(data["next"])
+        self.assertIsNotNone(data["previous"])
+
+    def test_borrowing_list_unpaginated_by_default(self):
+        url = reverse("borrowings:borrowing-list")
+        self.client.force_authenticate(self.user)
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.json()), 1)
+
+    def test_borrowing_list_conditional_get(self):
+        url = reverse("borrowings:borrowing-list")
+        self.client.force_authenticate(self.user)
+        resp = self.client.get(url)
+        etag = resp["ETag"]
+        self.assertIn("private", resp["Cache-Control"])
+
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+
+        self.client.force_authenticate(self.staff_user)
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+
+    @patch("stripe.checkout.SessionService.create")
+    def test_borrowing_return_changes_etag(self, mock_stripe_create):
+        mock_stripe_create.return_value = MagicMock(id="sess_test", url="https://x")
+        url = reverse("borrowings:borrowing-detail", args=[self.borrowing.id])
+        self.client.force_authenticate(self.user)
+        etag = self.client.get(url)["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("borrowings:return-book", args=[self.borrowing.id])
+            )
+
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIsNotNone(resp.json()["actual_return_date"])
+
+    def test_payment_save_bumps_version_with_one_light_query(self):
+        payment = Payment.objects.create(
+            borrowing=self.borrowing,
+            type=Payment.Type.PAYMENT,
+            status=Payment.PaymentStatus.PENDING,
+            money_to_pay=1,
+        )
+        payment = Payment.objects.get(id=payment.id)
+        url = reverse("borrowings:borrowing-detail", args=[self.borrowing.id])
+        self.client.force_authenticate(self.user)
+        etag = self.client.get(url)["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as queries:
+                payment.status = Payment.PaymentStatus.PAID
+                payment.save()
+
+        self.assertEqual(len(queries), 2)
+        self.assertIn('SELECT "borrowings_borrowing"."user_id"', queries[1]["sql"])
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+
+    def test_payment_save_tolerates_missing_borrowing(self):
+        payment = Payment.objects.create(
+            borrowing_id=self.borrowing.id + 1000,
+            type=Payment.Type.PAYMENT,
+            status=Payment.PaymentStatus.PENDING,
+            money_to_pay=1,
+        )
+        payment.delete()
+
+
+class BorrowingSparseFieldsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="user@test.com", password="pass")
+        self.client.force_authenticate(self.user)
+        self.book = Book.objects.create(
+            title="Book", author="Author", cover="SOFT", inventory=5, daily_fee=2
+        )
+        self.borrowing = Borrowing.objects.create(
+            user=self.user,
+            book=self.book,
+            expected_return=date.today() + timedelta(days=3),
+        )
+        self.payment = Payment.objects.create(
+            borrowing=self.borrowing,
+            status=Payment.PaymentStatus.PENDING,
+            type=Payment.Type.PAYMENT,
+            money_to_pay=6,
+        )
+        self.detail_url = reverse(
+            "borrowings:borrowing-detail", args=[self.borrowing.id]
+        )
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(url, params)
+        self.assertEqual(resp.status_code, 200)
+        return resp.json(), [query["sql"] for query in queries]
+
+    def test_detail_default_shape(self):
+        data, _ = self.get(self.detail_url)
+        self.assertEqual(data["book"]["title"], "Book")
+        self.assertEqual(data["payment"][0]["id"], self.payment.id)
+
+    def test_unexpanded_relations_are_ids_without_joins(self):
+        data, queries = self.get(self.detail_url, fields="id,book,payment")
+        self.assertEqual(
+            data,
+            {
+                "id": self.borrowing.id,
+                "book": self.book.id,
+                "payment": [self.payment.id],
+            },
+        )
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn("books_book", queries[0])
+        self.assertNotIn("expected_return", queries[0])
+        self.assertNotIn("money_to_pay", queries[1])
+
+    def test_expand(self):
+        data, queries = self.get(self.detail_url, fields="id", expand="book,payment")
+        self.assertEqual(data["book"]["daily_fee"], "2.00")
+        self.assertEqual(
+            data["payment"],
+            [
+                {
+                    "id": self.payment.id,
+                    "status": "PENDING",
+                    "type": "PAYMENT",
+                    "money_to_pay": "6.00",
+                }
+            ],
+        )
+        self.assertEqual(len(queries), 2)
+        self.assertIn("books_book", queries[0])
+
+        data, queries = self.get(self.detail_url, expand="book")
+        self.assertEqual(data["book"]["id"], self.book.id)
+        self.assertEqual(data["payment"], [self.payment.id])
+
+    def test_list(self):
+        url = reverse("borrowings:borrowing-list")
+        data, queries = self.get(url, fields="id,book", page_size=10)
+        self.assertEqual(
+            data["results"], [{"id": self.borrowing.id, "book": self.book.id}]
+        )
+        self.assertNotIn("books_book", queries[-1])
+
+        data, _ = self.get(url, expand="book")
+        default, _ = self.get(url)
+        self.assertEqual(data, default)
+
+    def test_invalid_names(self):
+        resp = self.client.get(self.detail_url, {"fields": "id,secret", "expand": "id"})
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(
+            resp.json(),
+            {"fields": ["Unknown field: secret"], "expand": ["Cannot expand: id"]},
+        )
+
+
+class ActiveBorrowingIndexTestCase(TestCase):
+    """
+    Most borrowings in production are returned ones; the active-borrowing
+    queries must not have to scan past them.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@test.com", password="pass")
+        self.book = Book.objects.create(
+            title="Book", author="Author", cover="SOFT", inventory=5, daily_fee=2
+        )
+        Borrowing.objects.create(
+            user=self.user, book=self.book, expected_return=date.today()
+        )
+        # thousands of returned borrowings...
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {Borrowing._meta.db_table}
+                    (borrow_date, expected_return, actual_return_date,
+                     book_id, user_id)
+                SELECT current_date - i, current_date - i + 7,
+                       current_date - i + 3, %s, %s
+                FROM generate_series(1, 5000) AS i
+                """,
+                [self.book.id, self.user.id],
+            )
+
+        # ...and a few hundred active ones, spread over readers and due dates
+        self.books = Book.objects.bulk_create(
+            Book(
+                title=f"Book {i}",
+                author="Author",
+                cover="SOFT",
+                inventory=5,
+                daily_fee=2,
+            )
+            for i in range(300)
+        )
+        self.readers = User.objects.bulk_create(
+            User(email=f"reader{i}@test.com", password="!") for i in range(30)
+        )
+        Borrowing.objects.bulk_create(
+            Borrowing(
+                user=self.readers[i % len(self.readers)],
+                book=book,
+                expected_return=date.today() + timedelta(days=1 + i % 100),
+            )
+            for i, book in enumerate(self.books)
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {Borrowing._meta.db_table}")
+
+    def assertUsesIndex(self, queryset, index):
+        # The plan names the partitions' copies of the index.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT child.relname
+                FROM pg_inherits
+                JOIN pg_class child ON child.oid = inhrelid
+                WHERE inhparent = %s::regclass
+                """,
+                [index],
+            )
+            names = [index, *(name for (name,) in cursor.fetchall())]
+        plan = queryset.explain()
+        self.assertTrue(set(names) & set(plan.split()), plan)
+
+    def test_active_borrowings_of_user(self):
+        active = Borrowing.objects.filter(actual_return_date__isnull=True)
+        self.assertUsesIndex(
+            active.filter(user=self.readers[0]), "borrowing_active_user_book_idx"
+        )
+        self.assertUsesIndex(
+            active.filter(user=self.readers[0], book=self.books[0]),
+            "borrowing_active_user_book_idx",
+        )
+
+    def test_active_borrowings_due(self):
+        self.assertUsesIndex(
+            Borrowing.objects.filter(
+                actual_return_date__isnull=True, expected_return=date.today()
+            ),
+            "borrowing_active_expected_idx",
+        )
+
+
+class BorrowingPartitionsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="user@test.com", password="pass")
+        self.staff_user = User.objects.create_user(
+            email="staff@test.com", password="pass", is_staff=True
+        )
+        books = [
+            Book.objects.create(
+                title=f"Book {i}", author="A", cover="SOFT", inventory=5, daily_fee=1
+            )
+            for i in range(3)
+        ]
+        self.current = self.borrow(books[0], months_ago=0)
+        self.returned = self.borrow(books[1], months_ago=20, returned=True)
+        self.overdue = self.borrow(books[2], months_ago=16)
+
+    def borrow(self, book, months_ago, returned=False):
+        borrowing = Borrowing.objects.create(
+            user=self.user, book=book, expected_return=date.today()
+        )
+        borrow_date = date.today() - timedelta(days=31 * months_ago)
+        Borrowing.objects.filter(pk=borrowing.pk).update(
+            borrow_date=borrow_date,
+            actual_return_date=borrow_date + timedelta(days=5) if returned else None,
+        )
+        return borrowing
+
+    def partition_of(self, borrowing):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT tableoid::regclass::text FROM borrowings_borrowing
+                WHERE id = %(id)s
+                UNION ALL
+                SELECT tableoid::regclass::text FROM borrowings_borrowing_archive
+                WHERE id = %(id)s
+                """,
+                {"id": borrowing.id},
+            )
+            row = cursor.fetchone()
+        return row and row[0]
+
+    def run_command(self, **options):
+        out = StringIO()
+        call_command("borrowing_partitions", stdout=out, **options)
+        return out.getvalue()
+
+    def test_creates_monthly_partitions(self):
+        out = self.run_command()
+        month = date.today().strftime("%Y%m")
+        self.assertEqual(
+            self.partition_of(self.current), f"borrowings_borrowing_p{month}"
+        )
+        self.assertIn(f"Created borrowings_borrowing_p{month}, moved 1 rows", out)
+
+        borrowing = Borrowing.objects.create(
+            user=self.staff_user, book=self.current.book, expected_return=date.today()
+        )
+        self.assertEqual(self.partition_of(borrowing), f"borrowings_borrowing_p{month}")
+
+        # Nothing left to do on a second run.
+        self.assertNotIn("Created", self.run_command())
+
+    def test_archives_months_without_active_borrowings(self):
+        out = self.run_command()
+        archived = self.partition_of(self.returned)
+        self.assertIn(f"Archived {archived}", out)
+        self.assertIn(f"Keeping {self.partition_of(self.overdue)}", out)
+
+        self.assertFalse(Borrowing.objects.filter(pk=self.returned.pk).exists())
+        self.assertTrue(Borrowing.objects.filter(pk=self.overdue.pk).exists())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT inhparent::regclass::text FROM pg_inherits "
+                "WHERE inhrelid = %s::regclass",
+                [archived],
+            )
+            self.assertEqual(cursor.fetchone()[0], "borrowings_borrowing_archive")
+
+        url = reverse("borrowings:borrowing-list")
+        self.client.force_authenticate(self.staff_user)
+        returned = self.client.get(url, {"is_active": "false"}).json()
+        self.assertEqual([item["id"] for item in returned], [self.returned.id])
+        self.assertEqual(returned[0]["book"]["title"], "Book 1")
+        every = self.client.get(url).json()
+        self.assertNotIn(self.returned.id, [item["id"] for item in every])
+
+    def test_staff_retrieve_with_is_active_false_uses_live_borrowings(self):
+        self.client.force_authenticate(self.staff_user)
+        url = reverse("borrowings:borrowing-detail", args=[self.returned.id])
+        resp = self.client.get(url, {"is_active": "false"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["payment"], [])
+
+    def test_payable_payments_keep_month_live(self):
+        payment = Payment.objects.create(
+            borrowing=self.returned,
+            type=Payment.Type.FINE,
+            status=Payment.PaymentStatus.PENDING,
+            money_to_pay=1,
+            session_id="sess_open",
+            session_expires_at=timezone.now() + timedelta(hours=1),
+        )
+        queued = Payment.objects.create(
+            borrowing=self.returned,
+            type=Payment.Type.PAYMENT,
+            status=Payment.PaymentStatus.PENDING,
+            money_to_pay=1,
+        )
+        outbox = PaymentOutbox.objects.create(payment=queued)
+
+        out = self.run_command()
+        self.assertIn(
+            f"Keeping {self.partition_of(self.returned)}: it still has pending "
+            "payments",
+            out,
+        )
+        Payment.objects.filter(pk=payment.pk).update(status=Payment.PaymentStatus.PAID)
+        self.assertNotIn("Archived", self.run_command())
+
+        PaymentOutbox.objects.filter(pk=outbox.pk).update(failed_at=timezone.now())
+        self.assertIn("Archived", self.run_command())
+        self.assertFalse(Borrowing.objects.filter(pk=self.returned.pk).exists())
+
+    def test_expired_pending_payment_does_not_keep_month_live(self):
+        payment = Payment.objects.create(
+            borrowing=self.returned,
+            type=Payment.Type.FINE,
+            status=Payment.PaymentStatus.PENDING,
+            money_to_pay=1,
+            session_id="sess_expired",
+            session_expires_at=timezone.now() - timedelta(minutes=1),
+        )
+
+        self.assertIn("Archived", self.run_command())
+
+        self.assertFalse(Borrowing.objects.filter(pk=self.returned.pk).exists())
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, Payment.PaymentStatus.PENDING)
+
+    def test_archived_borrowings_lose_foreign_keys_and_notifications(self):
+        NotificationLog.objects.create(
+            borrowing=self.returned, kind=NotificationLog.Kind.BORROWED
+        )
+        payment = Payment.objects.create(
+            borrowing=self.returned,
+            type=Payment.Type.PAYMENT,
+            status=Payment.PaymentStatus.PAID,
+            money_to_pay=1,
+        )
+        self.run_command()
+        archived = self.partition_of(self.returned)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*) FROM pg_constraint "
+                "WHERE conrelid = %s::regclass AND contype = 'f'",
+                [archived],
+            )
+            self.assertEqual(cursor.fetchone()[0], 0)
+        self.assertFalse(NotificationLog.objects.exists())
+
+        self.client.force_authenticate(self.user)
+        resp = self.client.get(reverse("payment:transactions-list"))
+        self.assertEqual([item["id"] for item in resp.json()], [payment.id])
+
+    def test_deleting_book_removes_its_archived_borrowings(self):
+        Payment.objects.create(
+            borrowing=self.returned,
+            type=Payment.Type.PAYMENT,
+            status=Payment.PaymentStatus.PAID,
+            money_to_pay=1,
+        )
+        self.run_command()
+
+        self.returned.book.delete()
+        with connection.cursor() as cursor:
+            # deferred foreign keys would fail here
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+        self.assertFalse(BorrowingHistory.objects.filter(pk=self.returned.pk).exists())
+        self.assertFalse(Payment.objects.exists())
+
+    def test_deleting_user_removes_archived_borrowings(self):
+        self.run_command()
+        self.user.delete()
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        self.assertFalse(BorrowingHistory.objects.exists())
+
+    def test_detaches_old_archived_months(self):
+        self.run_command()
+        archived = self.partition_of(self.returned)
+        out = self.run_command(detach_after=18)
+        self.assertIn(f"Detached {archived}", out)
+        self.assertFalse(BorrowingHistory.objects.filter(pk=self.returned.pk).exists())
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT id FROM {archived}")
+            self.assertEqual(cursor.fetchall(), [(self.returned.id,)])
+
+    def test_second_active_borrowing_is_rejected(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Borrowing.objects.create(
+                user=self.user, book=self.current.book, expected_return=date.today()
+            )
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Borrowing.objects.filter(pk=self.returned.pk).update(
+                book=self.current.book, actual_return_date=None
+            )
+
+        self.run_command()
+        Borrowing.objects.filter(pk=self.current.pk).update(
+            actual_return_date=date.today()
+        )
+        Borrowing.objects.create(
+            user=self.user, book=self.current.book, expected_return=date.today()
+        )
+
+
+class ActiveBorrowingConcurrencyTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@test.com", password="pass")
+        self.book = Book.objects.create(
+            title="Book", author="Author", cover="SOFT", inventory=5, daily_fee=2
+        )
+
+    def borrow(self, inserted=None, commit=None):
+        try:
+            with transaction.atomic():
+                Borrowing.objects.create(
+                    user=self.user, book=self.book, expected_return=date.today()
+                )
+                if inserted:
+                    inserted.set()
+                    commit.wait(5)
+            return "created"
+        except IntegrityError:
+            return "rejected"
+        finally:
+            connection.close()
+
+    def test_concurrent_creates_keep_one_active_borrowing(self):
+        inserted, commit = threading.Event(), threading.Event()
+        with ThreadPoolExecutor(2) as executor:
+            first = executor.submit(self.borrow, inserted, commit)
+            self.assertTrue(inserted.wait(5))
+            second = executor.submit(self.borrow)
+
+            # the second insert waits for the first transaction's lock
+            with connection.cursor() as cursor:
+                for _ in range(500):
+                    cursor.execute(
+                        "SELECT count(*) FROM pg_locks "
+                        "WHERE locktype = 'advisory' AND NOT granted"
+                    )
+                    if cursor.fetchone()[0]:
+                        break
+                    time.sleep(0.01)
+                else:
+                    self.fail("the second insert did not wait for the first")
+            commit.set()
+
+            self.assertEqual([first.result(), second.result()], ["created", "rejected"])
+        self.assertEqual(Borrowing.objects.filter(actual_return_date=None).count(), 1)
+
 
 def test_borrowing_list_permissions(self):
     url = reverse("borrowings:borrowing-list")
@@ -1,6 +1,8 @@
 from datetime import date
 
 from django.db import transaction
+from django.urls import reverse
+from django.utils.decorators import method_decorator
 from drf_spectacular.utils import (
     OpenApiResponse,
     OpenApiExample,
@@ -14,15 +16,23 @@ from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from books.cache import get_catalog_version
 from books.models import Book
-from borrowings.models import Borrowing
+from books.sparse import SPARSE_PARAMETERS, SparseFieldsMixin
+from books.values import ValuesListMixin
+from borrowings.cache import bump_borrowing_version, get_borrowing_version
+from borrowings.models import Borrowing, BorrowingHistory
+from borrowings.pagination import BorrowingCursorPagination
 from borrowings.serializers import (
     BorrowingSerializer,
     BorrowingListSerializer,
     BorrowingDetailSerializer,
 )
+from library_project.conditional import ConditionalGetMixin
+from library_project.idempotency import IDEMPOTENCY_PARAMETER, idempotent
 from payment.models import Payment
-from payment.services import create_payment_session
+from payment.services import enqueue_payment_session
+from payment.tasks import process_payment_outbox
 
 FINE_MULTIPLE = 2
 
@@ -37,7 +47,9 @@ FINE_MULTIPLE = 2
             "Parameters:\n"
             "- `user_id`: Comma-separated list of user IDs (admin only)\n"
             "- `is_active`: `true` for active borrowings (not yet returned), "
-            "`false` for returned ones."
+            "`false` for returned ones.\n\n"
+            "Pass `page_size` or `cursor` to get cursor-paginated results "
+            "ordered by `borrow_date` and `id`."
         ),
         parameters=[
             OpenApiParameter(
@@ -52,6 +64,7 @@ FINE_MULTIPLE = 2
                 required=False,
                 type=str,
             ),
+            *SPARSE_PARAMETERS,
         ],
         responses={
             200: OpenApiResponse(
@@ -84,6 +97,7 @@ FINE_MULTIPLE = 2
     retrieve=extend_schema(
         summary="Retrieve borrowing details",
         description="Returns detailed information about a specific borrowing.",
+        parameters=SPARSE_PARAMETERS,
         responses={
             200: OpenApiResponse(
                 response=BorrowingDetailSerializer,
@@ -116,17 +130,22 @@ FINE_MULTIPLE = 2
         summary="Create new borrowing",
         description=(
             "Creates a new borrowing for the authenticated user.\n\n"
-            "Decreases the book inventory by 1 and returns a Stripe payment URL "
-            "for the borrowing fee.\n\n"
+            "Decreases the book inventory by 1 and queues a Stripe checkout "
+            "session for the borrowing fee. The response is `202 Accepted` with "
+            "a payment resource to poll: its `session_url` is filled in as soon "
+            "as the session is created.\n\n"
             "Raises an error if:\n"
             "- The book is out of stock\n"
-            "- The user already has an active borrowing for the same book"
+            "- The user already has an active borrowing for the same book\n\n"
+            "Send an `Idempotency-Key` header to make retries safe: a repeated "
+            "key returns the first response without borrowing again."
         ),
+        parameters=[IDEMPOTENCY_PARAMETER],
         request=BorrowingSerializer,
         responses={
-            201: OpenApiResponse(
+            202: OpenApiResponse(
                 response=BorrowingSerializer,
-                description="Borrowing successfully created",
+                description="Borrowing created, payment session queued",
                 examples=[
                     OpenApiExample(
                         "Created borrowing",
@@ -137,7 +156,11 @@ FINE_MULTIPLE = 2
                             "borrow_date": "2025-10-25",
                             "expected_return": "2025-10-30",
                             "actual_return_date": None,
-                            "payment_url": "https://checkout.stripe.com/pay/session_123",
+                            "payment": {
+                                "id": 7,
+                                "status": "PENDING",
+                                "url": "http://127.0.0.1:8000/api/payments/transactions/7/",
+                            },
                         },
                     )
                 ],
@@ -159,6 +182,9 @@ FINE_MULTIPLE = 2
     ),
 )
 class BorrowingView(
+    ConditionalGetMixin,
+    SparseFieldsMixin,
+    ValuesListMixin,
     viewsets.GenericViewSet,
     mixins.RetrieveModelMixin,
     mixins.ListModelMixin,
@@ -166,6 +192,16 @@ class BorrowingView(
 ):
     queryset = Borrowing.objects.all().select_related("book")
     serializer_class = BorrowingSerializer
+    pagination_class = BorrowingCursorPagination
+    cache_control = {"private": True, "no_cache": True}
+
+    def get_versions(self):
+        user_id = None if self.request.user.is_staff else self.request.user.id
+        # Borrowings embed book data, so catalog changes count as well.
+        return [get_borrowing_version(user_id), get_catalog_version()]
+
+    def get_etag_scope(self):
+        return f"user:{self.request.user.id}"
 
     def get_serializer_class(self):
         if self.action == "list":
@@ -185,6 +221,10 @@ class BorrowingView(
         is_active = self.request.query_params.get("is_active")
 
         if self.request.user.is_staff:
+            if self.action == "list" and is_active and is_active.lower() == "false":
+                # Returned borrowings include the archived partitions.
+                queryset = BorrowingHistory.objects.select_related("book")
+
             if user_id:
                 user_ids = self._params_to_ints(user_id)
                 queryset = queryset.filter(user__in=user_ids)
@@ -199,31 +239,44 @@ class BorrowingView(
 
         return queryset.filter(user=self.request.user)
 
+    @method_decorator(idempotent)
     def create(self, request, *args, **kwargs):
         serializer = BorrowingSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        book_id = request.data.get("book")
-        book = Book.objects.select_for_update().get(id=book_id)
+        book = serializer.validated_data["book"]
+        if book.inventory <= 0:
+            raise ValidationError(f"{book.title} is out of stock")
 
         with transaction.atomic():
-            if Borrowing.objects.filter(
-                user=request.user, book=book, actual_return_date__isnull=True
-            ).exists():
+            Borrowing.objects.lock_active(request.user.id, book.id)
+            if Borrowing.objects.has_active(request.user.id, book.id):
                 raise ValidationError(f"You already borrowed {book.title}")
-            if book.inventory <= 0:
-                raise ValidationError(f"{book.title} is out of stock")
 
             borrowing_instance = serializer.save(user=request.user, book=book)
+            payment, outbox = enqueue_payment_session(borrowing_instance)
 
-            book.inventory -= 1
-            book.save()
+            # Reserve last: the UPDATE row lock on a hot book is then only
+            # held until commit instead of for the whole request.
+            if not Book.objects.reserve(book.id):
+                raise ValidationError(f"{book.title} is out of stock")
 
-            payment_url = create_payment_session(borrowing_instance)
+            transaction.on_commit(lambda: process_payment_outbox.delay(outbox.id))
 
+        payment_location = request.build_absolute_uri(
+            reverse("payment:transactions-detail", args=[payment.id])
+        )
         response_data = BorrowingSerializer(borrowing_instance).data
-        response_data["payment_url"] = payment_url
+        response_data["payment"] = {
+            "id": payment.id,
+            "status": payment.status,
+            "url": payment_location,
+        }
 
-        return Response(response_data, status=status.HTTP_201_CREATED)
+        return Response(
+            response_data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Location": payment_location},
+        )
 
     def get_permissions(self):
         if self.action in ["list", "retrieve", "create"]:
@@ -248,8 +301,11 @@ def calculate_fine(borrowing):
     description=(
         "Marks a borrowed book as returned. "
         "If the book is returned later than the expected date, "
-        "a fine payment session will be created and returned in the response."
+        "a PENDING fine payment is returned; its Stripe session is created "
+        "in the background and appears on the payment once ready. "
+        "Send an `Idempotency-Key` header to make retries safe."
     ),
+    parameters=[IDEMPOTENCY_PARAMETER],
     request=None,
     responses={
         200: OpenApiResponse(
@@ -265,7 +321,7 @@ def calculate_fine(borrowing):
                         "borrow_date": "2025-10-20",
                         "expected_return": "2025-10-23",
                         "actual_return_date": "2025-10-25",
-                        "fine_payment_url": None,
+                        "fine_payment": None,
                     },
                 ),
                 OpenApiExample(
@@ -277,7 +333,11 @@ def calculate_fine(borrowing):
                         "borrow_date": "2025-10-10",
                         "expected_return": "2025-10-15",
                         "actual_return_date": "2025-10-25",
-                        "fine_payment_url": "https://checkout.stripe.com/pay/session_12345",
+                        "fine_payment": {
+                            "id": 7,
+                            "status": "PENDING",
+                            "url": "https://example.com/api/payments/transactions/7/",
+                        },
                     },
                 ),
             ],
@@ -304,36 +364,42 @@ def calculate_fine(borrowing):
 )
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
+@idempotent
 def return_book(request, pk):
-    borrowing = Borrowing.objects.select_for_update().get(pk=pk)
-    book = borrowing.book
-
-    if borrowing.actual_return_date is not None:
-        return Response(
-            {"detail": "This book was returned"}, status=status.HTTP_400_BAD_REQUEST
-        )
+    borrowing = Borrowing.objects.select_related("book").get(pk=pk)
 
     with transaction.atomic():
-        book.inventory += 1
-        book.save()
+        returned = Borrowing.objects.filter(
+            pk=borrowing.pk, actual_return_date__isnull=True
+        ).update(actual_return_date=date.today())
+        if not returned:
+            return Response(
+                {"detail": "This book was returned"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
         borrowing.actual_return_date = date.today()
-        borrowing.save()
+        bump_borrowing_version(borrowing.user_id)
 
+        # The fine's Stripe session is created by the outbox after commit,
+        # so a Stripe outage cannot hold up or undo the return.
+        fine_payment = None
         fine_amount = calculate_fine(borrowing)
-        fine_payment_url = None
         if fine_amount > 0:
-            fine_payment = Payment.objects.create(
-                borrowing=borrowing,
-                type=Payment.Type.FINE,
-                status=Payment.PaymentStatus.PENDING,
-                money_to_pay=fine_amount,
+            fine_payment, outbox = enqueue_payment_session(
+                borrowing, Payment.Type.FINE, int(fine_amount * 100)
             )
-            fine_payment_url = create_payment_session(fine_payment.borrowing)
+            transaction.on_commit(lambda: process_payment_outbox.delay(outbox.id))
 
-        serializer = BorrowingSerializer(borrowing)
-        data = serializer.data
-        if fine_payment_url:
-            data["fine_payment_url"] = fine_payment_url
+        # Release last, so the hot book row is only locked until commit.
+        Book.objects.release(borrowing.book_id)
 
+    data = BorrowingSerializer(borrowing).data
+    data["fine_payment"] = fine_payment and {
+        "id": fine_payment.id,
+        "status": fine_payment.status,
+        "url": request.build_absolute_uri(
+            reverse("payment:transactions-detail", args=[fine_payment.id])
+        ),
+    }
     return Response(data, status=status.HTTP_200_OK)
@@ -0,0 +1,68 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+class ConditionalGetMixin:
+    """
+    Strong ETag and Last-Modified for list and retrieve responses, derived
+    from version keys (see books.cache.get_version) rather than the body.
+
+    A request whose If-None-Match or If-Modified-Since still matches gets a
+    304 before the queryset is touched or anything is serialized.
+    """
+
+    # Cache-Control directives for the response, e.g. {"private": True}
+    cache_control = {}
+
+    def get_versions(self):
+        """
+        Version keys' values the response of this request depends on.
+        Without any, responses get no validators.
+        """
+        return []
+
+    def get_etag_scope(self):
+        """
+        Anything besides the URL that changes the response body, e.g. the
+        requesting user when the queryset is filtered by them.
+        """
+        return ""
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().retrieve, *args, **kwargs)
+
+    def conditional_response(self, request, handler, *args, **kwargs):
+        versions = self.get_versions()
+        if not versions:
+            return handler(request, *args, **kwargs)
+
+        etag = self._etag(request, versions)
+        last_modified = max(versions) // 10**9
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        if self.cache_control:
+            patch_cache_control(response, **self.cache_control)
+        return response
+
+    def _etag(self, request, versions):
+        parts = [
+            *map(str, versions),
+            request.get_full_path(),
+            self.get_etag_scope(),
+            request.accepted_media_type,
+        ]
+        return '"%s"' % hashlib.md5("\n".join(parts).encode()).hexdigest()
@@ -0,0 +1,129 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from drf_spectacular.utils import OpenApiParameter
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+IDEMPOTENCY_PARAMETER = OpenApiParameter(
+    name=IDEMPOTENCY_HEADER,
+    description=(
+        "Unique key for this operation. Retrying with the same key returns "
+        "the first response instead of repeating the operation."
+    ),
+    required=False,
+    type=str,
+    location=OpenApiParameter.HEADER,
+)
+
+
+def idempotent(view):
+    """
+    Replay the response of a view when a request repeats its
+    ``Idempotency-Key`` header.
+
+    The first request with a key claims it for the user, runs the view and
+    stores the response for ``IDEMPOTENCY_KEY_TTL`` seconds. Later requests
+    with the same key get that response back from a single cache read, so
+    the view's database writes and Stripe calls are never repeated. A key
+    still being processed answers 409, and a key reused for a different
+    request answers 422. Exceptions the view raises are turned into
+    responses by DRF's exception handler first, so a 4xx is replayed like
+    any other response. Unhandled exceptions and 5xx responses release the
+    key so the client can retry.
+
+    Wrap methods of class-based views with ``method_decorator``.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return view(request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {
+                    "detail": f"{IDEMPOTENCY_HEADER} must be 1 to "
+                    f"{MAX_KEY_LENGTH} characters long"
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        cache_key = idempotency_cache_key(request.user.id, key)
+        fingerprint = _fingerprint(request)
+        while not cache.add(
+            cache_key, {"fingerprint": fingerprint}, settings.IDEMPOTENCY_LOCK_TIMEOUT
+        ):
+            stored = cache.get(cache_key)
+            if stored is not None:
+                return _replay(stored, fingerprint)
+
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception as exc:
+            context = {"request": request, "args": args, "kwargs": kwargs}
+            response = api_settings.EXCEPTION_HANDLER(exc, context)
+            if response is None:
+                cache.delete(cache_key)
+                raise
+        except BaseException:
+            cache.delete(cache_key)
+            raise
+
+        if response.status_code >= 500:
+            cache.delete(cache_key)
+            return response
+
+        cache.set(
+            cache_key,
+            {
+                "fingerprint": fingerprint,
+                "status": response.status_code,
+                "data": response.data,
+                "headers": {
+                    name: value
+                    for name, value in response.headers.items()
+                    if name != "Content-Type"
+                },
+            },
+            settings.IDEMPOTENCY_KEY_TTL,
+        )
+        return response
+
+    return wrapper
+
+
+def idempotency_cache_key(user_id, key):
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f"idempotency:{user_id}:{digest}"
+
+
+def _fingerprint(request):
+    # Read before the view parses the body, while it is still available.
+    parts = [request.method.encode(), request.get_full_path().encode(), request.body]
+    return hashlib.sha256(b"\n".join(parts)).hexdigest()
+
+
+def _replay(stored, fingerprint):
+    if stored["fingerprint"] != fingerprint:
+        return Response(
+            {"detail": f"{IDEMPOTENCY_HEADER} was already used for another request"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if "status" not in stored:
+        return Response(
+            {"detail": f"A request with this {IDEMPOTENCY_HEADER} is in progress"},
+            status=status.HTTP_409_CONFLICT,
+        )
+
+    response = Response(stored["data"], status=stored["status"])
+    for name, value in stored["headers"].items():
+        response[name] = value
+    response["Idempotent-Replayed"] = "true"
+    return response
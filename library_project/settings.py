@@ -40,6 +40,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework_simplejwt",
     "rest_framework",
     "drf_spectacular",
@@ -81,6 +82,22 @@ WSGI_APPLICATION = "library_project.wsgi.application"
 
 STRIPE_SECRET_KEY = os.environ.get("STRIPE_SECRET_KEY")
 STRIPE_PUBLISHABLE_KEY = os.environ.get("STRIPE_PUBLISHABLE_KEY")
+STRIPE_WEBHOOK_SECRET = os.environ.get("STRIPE_WEBHOOK_SECRET")
+
+# Stripe client, see payment.gateway
+STRIPE_API_BASE = os.environ.get("STRIPE_API_BASE")  # e.g. benchmarks.fake_stripe
+STRIPE_POOL_SIZE = 10  # keep-alive connections per process
+STRIPE_CONNECT_TIMEOUT = 2  # seconds per attempt
+STRIPE_READ_TIMEOUT = 10  # seconds per attempt
+STRIPE_MAX_NETWORK_RETRIES = 2
+STRIPE_BREAKER_THRESHOLD = 5  # outages within the window that open the breaker
+STRIPE_BREAKER_WINDOW = 60  # seconds
+STRIPE_BREAKER_RESET = 30  # seconds calls fail fast before Stripe is probed again
+
+PAYMENT_SESSION_TTL = 23 * 60 * 60  # seconds a checkout session stays open
+PAYMENT_SESSION_REUSE_MARGIN = 10 * 60  # seconds an open session must have left
+PAYMENT_OUTBOX_MAX_ATTEMPTS = 8  # Stripe calls before an outbox entry is dead-lettered
+PAYMENT_OUTBOX_CLAIM_TIMEOUT = 60  # seconds a worker may hold an outbox entry
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -139,8 +156,31 @@ STATIC_URL = "static/"
 
 TELEGRAM_TOKEN = os.environ.get("TELEGRAM_TOKEN")
 
+# Outgoing Telegram messages, see telegram_bot.delivery
+TELEGRAM_GLOBAL_RATE = 25  # messages per second, Telegram allows ~30
+TELEGRAM_PER_CHAT_RATE = 1  # messages per second to a single chat
+TELEGRAM_DELIVERY_WORKERS = 8
+TELEGRAM_DELIVERY_MAX_ATTEMPTS = 5
+TELEGRAM_DELIVERY_BACKOFF = 1  # seconds, doubled on every retry
+TELEGRAM_CATCH_UP_DAYS = 2  # how far back lost new-borrowing notifications are found
+
 DOMAIN = "http://127.0.0.1:8000"
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ.get("REDIS_CACHE_URL", "redis://redis:6379/1"),
+    }
+}
+
+# Book list/detail response cache, see books.cache
+BOOK_CACHE_TTL = 300  # seconds
+BOOK_CACHE_LOCK_TIMEOUT = 10  # seconds a rebuild may hold the stampede lock
+BOOK_CACHE_LOCK_WAIT = 2  # seconds other requests wait for that rebuild
+
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60  # seconds a response is replayed for its key
+IDEMPOTENCY_LOCK_TIMEOUT = 60  # seconds a key stays claimed by a running request
+
 CELERY_BROKER_URL = "redis://redis:6379/0"
 CELERY_RESULT_BACKEND = "redis://redis:6379/0"
 CELERY_ACCEPT_CONTENT = ["json"]
@@ -158,6 +198,22 @@ CELERY_BEAT_SCHEDULE = {
         "task": "telegram_bot.tasks.send_due_today",
         "schedule": timedelta(days=1),
     },
+    "catch_up_borrowing_notifications_every_5_minutes": {
+        "task": "telegram_bot.tasks.catch_up_borrowing_notifications",
+        "schedule": timedelta(minutes=5),
+    },
+    "sweep_payment_outbox_every_minute": {
+        "task": "payment.tasks.sweep_payment_outbox",
+        "schedule": timedelta(minutes=1),
+    },
+    "process_stripe_events_every_minute": {
+        "task": "payment.tasks.process_stripe_events",
+        "schedule": timedelta(minutes=1),
+    },
+    "maintain_borrowing_partitions_daily": {
+        "task": "borrowings.tasks.maintain_borrowing_partitions",
+        "schedule": timedelta(days=1),
+    },
 }
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
@@ -170,4 +226,34 @@ REST_FRAMEWORK = {
         "books.permissions.IsAdminOrAuthenticatedOrReadOnly",
     ),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    "DEFAULT_RENDERER_CLASSES": (
+        "library_project.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "library_project.parsers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
 }
+
+PAGINATION_PAGE_SIZE = 50
+PAGINATION_MAX_PAGE_SIZE = 200
+
+# Book autocomplete, see BookViewSet.autocomplete
+AUTOCOMPLETE_MIN_LENGTH = 3
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 20
+AUTOCOMPLETE_CACHE_TTL = 30  # seconds
+
+# Most items accepted by the bulk book endpoints
+BOOK_BULK_MAX_ITEMS = 1000
+
+# Rows fetched per server-side cursor round trip by the catalog export
+EXPORT_CHUNK_SIZE = 2000
+
+# Monthly borrowing partitions, see the borrowing_partitions command
+BORROWING_PARTITIONS_AHEAD = 3  # months created after the current one
+BORROWING_ARCHIVE_AFTER_MONTHS = 12  # age at which returned months are archived
+BORROWING_DETACH_AFTER_MONTHS = None  # age at which archived months are detached
+BORROWING_ARCHIVE_TABLESPACE = os.environ.get("BORROWING_ARCHIVE_TABLESPACE")
@@ -0,0 +1,143 @@
+import time
+from functools import cache
+
+import requests
+import stripe
+from django.conf import settings
+from django.core.cache import cache as shared_cache
+from rest_framework import status
+from rest_framework.response import Response
+
+BREAKER_FAILURES_KEY = "payment:gateway:failures"
+BREAKER_OPEN_UNTIL_KEY = "payment:gateway:open_until"
+BREAKER_PROBE_KEY = "payment:gateway:probe"
+
+# Errors that say Stripe is unreachable or struggling, as opposed to errors
+# about the request itself.
+OUTAGE_ERRORS = (stripe.APIConnectionError, stripe.APIError, stripe.RateLimitError)
+
+
+class GatewayUnavailable(stripe.StripeError):
+    """
+    Raised without calling Stripe while the circuit breaker is open.
+    """
+
+
+# Errors for which a request that needs Stripe should be retried later
+UNAVAILABLE_ERRORS = (GatewayUnavailable, *OUTAGE_ERRORS)
+
+
+@cache
+def get_client():
+    """
+    The process-wide Stripe client. Its requests session keeps connections
+    to Stripe alive between calls, every attempt has connect and read
+    timeouts, and failed attempts are retried a bounded number of times
+    with jittered exponential backoff by the Stripe library.
+
+    ``STRIPE_API_BASE`` points it at another API host, such as
+    benchmarks.fake_stripe for load tests.
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=1, pool_maxsize=settings.STRIPE_POOL_SIZE
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    base_addresses = {}
+    if settings.STRIPE_API_BASE:
+        base_addresses["api"] = settings.STRIPE_API_BASE
+
+    return stripe.StripeClient(
+        settings.STRIPE_SECRET_KEY,
+        base_addresses=base_addresses,
+        max_network_retries=settings.STRIPE_MAX_NETWORK_RETRIES,
+        http_client=stripe.RequestsClient(
+            timeout=(settings.STRIPE_CONNECT_TIMEOUT, settings.STRIPE_READ_TIMEOUT),
+            session=session,
+        ),
+    )
+
+
+def create_checkout_session(params, idempotency_key=None):
+    options = {"idempotency_key": idempotency_key} if idempotency_key else {}
+    return _call(lambda: get_client().v1.checkout.sessions.create(params, options))
+
+
+def retrieve_checkout_session(session_id):
+    return _call(lambda: get_client().v1.checkout.sessions.retrieve(session_id))
+
+
+def expire_checkout_session(session_id):
+    """
+    Close an open checkout session, so it can no longer be paid.
+    """
+    return _call(lambda: get_client().v1.checkout.sessions.expire(session_id))
+
+
+def payments_unavailable():
+    """
+    503 for requests that need Stripe while it is down or the gateway fails
+    fast.
+    """
+    return Response(
+        {"detail": "Payments are temporarily unavailable"},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(settings.STRIPE_BREAKER_RESET)},
+    )
+
+
+def _call(request):
+    """
+    Run ``request`` behind a circuit breaker shared by all workers through
+    the cache. ``STRIPE_BREAKER_THRESHOLD`` outages within
+    ``STRIPE_BREAKER_WINDOW`` seconds open it: calls then raise
+    GatewayUnavailable at once for ``STRIPE_BREAKER_RESET`` seconds, after
+    which a single call is let through to probe whether Stripe recovered.
+    """
+    open_until = shared_cache.get(BREAKER_OPEN_UNTIL_KEY)
+    probing = open_until is not None
+    if probing and (
+        open_until > time.time()
+        or not shared_cache.add(BREAKER_PROBE_KEY, 1, settings.STRIPE_BREAKER_RESET)
+    ):
+        raise GatewayUnavailable("Payments are temporarily unavailable")
+
+    try:
+        result = request()
+    except OUTAGE_ERRORS:
+        if probing or _count_outage() >= settings.STRIPE_BREAKER_THRESHOLD:
+            _open()
+        raise
+    except stripe.StripeError:
+        # Stripe answered, so it is reachable again
+        if probing:
+            _close()
+        raise
+
+    if probing:
+        _close()
+    return result
+
+
+def _count_outage():
+    shared_cache.add(BREAKER_FAILURES_KEY, 0, settings.STRIPE_BREAKER_WINDOW)
+    try:
+        return shared_cache.incr(BREAKER_FAILURES_KEY)
+    except ValueError:
+        # the window expired between add and incr
+        return 1
+
+
+def _open():
+    shared_cache.set(
+        BREAKER_OPEN_UNTIL_KEY, time.time() + settings.STRIPE_BREAKER_RESET, None
+    )
+    shared_cache.delete(BREAKER_PROBE_KEY)
+
+
+def _close():
+    shared_cache.delete_many(
+        [BREAKER_FAILURES_KEY, BREAKER_OPEN_UNTIL_KEY, BREAKER_PROBE_KEY]
+    )
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-17 07:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("borrowings", "0004_partition_borrowings"),
+        ("payment", "0004_stripe_webhook_events"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="session_expires_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                condition=models.Q(
+                    ("session_id__isnull", False), ("status", "PENDING")
+                ),
+                fields=["borrowing", "type", "session_expires_at"],
+                name="payment_open_session_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-17 07:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payment", "0005_payment_open_sessions"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="paymentoutbox",
+            name="payment_outbox_pending_idx",
+        ),
+        migrations.AddField(
+            model_name="paymentoutbox",
+            name="claimed_until",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="paymentoutbox",
+            name="failed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="paymentoutbox",
+            index=models.Index(
+                condition=models.Q(
+                    ("failed_at__isnull", True), ("processed_at__isnull", True)
+                ),
+                fields=["created_at"],
+                name="payment_outbox_pending_idx",
+            ),
+        ),
+    ]
@@ -12,10 +12,76 @@ class Payment(models.Model):
 
     status = models.CharField(choices=PaymentStatus.choices)
     type = models.CharField(choices=Type.choices)
-    borrowing = models.ForeignKey("borrowings.Borrowing", on_delete=models.CASCADE)
+    # Borrowings are partitioned, so their id alone cannot be referenced by
+    # a database foreign key; deletes still cascade through the ORM.
+    borrowing = models.ForeignKey(
+        "borrowings.Borrowing", on_delete=models.CASCADE, db_constraint=False
+    )
     session_url = models.URLField()
-    session_id = models.CharField(max_length=255)
+    # NULL until the Stripe checkout session has been created.
+    session_id = models.CharField(max_length=255, blank=True, null=True, unique=True)
+    session_expires_at = models.DateTimeField(blank=True, null=True)
     money_to_pay = models.DecimalField(decimal_places=2, max_digits=10)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["borrowing", "type", "session_expires_at"],
+                condition=models.Q(status="PENDING", session_id__isnull=False),
+                name="payment_open_session_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"Status: {self.status} Type: {self.type}"
+
+
+class PaymentOutbox(models.Model):
+    payment = models.OneToOneField(
+        Payment, related_name="outbox", on_delete=models.CASCADE
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # Set while a worker is calling Stripe for the entry.
+    claimed_until = models.DateTimeField(blank=True, null=True)
+    # Set once the entry gave up after PAYMENT_OUTBOX_MAX_ATTEMPTS.
+    failed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["created_at"],
+                condition=models.Q(processed_at__isnull=True, failed_at__isnull=True),
+                name="payment_outbox_pending_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Outbox for payment {self.payment_id}"
+
+
+class StripeEvent(models.Model):
+    """
+    A verified Stripe webhook event waiting to be applied to its payment.
+    The primary key is Stripe's event id, so redelivered events are dropped.
+    """
+
+    id = models.CharField(max_length=255, primary_key=True)
+    type = models.CharField(max_length=255)
+    session_id = models.CharField(max_length=255)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["received_at"],
+                condition=models.Q(processed_at__isnull=True),
+                name="stripe_event_pending_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.type} {self.id}"
@@ -1,46 +1,342 @@
+from datetime import timedelta
+from decimal import Decimal
+
 import stripe
 from django.conf import settings
-from payment.models import Payment
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from borrowings.cache import bump_borrowing_version
+from borrowings.models import Borrowing
+from payment import gateway
+from payment.models import Payment, PaymentOutbox, StripeEvent
+
+# Webhook events after which a checkout session's payment is settled
+PAID_EVENTS = (
+    "checkout.session.completed",
+    "checkout.session.async_payment_succeeded",
+)
 
 
-def create_payment_session(borrowing):
-    stripe.api_key = settings.STRIPE_SECRET_KEY
-    book = borrowing.book
+def calculate_rental_amount(borrowing):
+    """
+    The rental price in cents, charging at least one day.
+    """
+    days = max(1, (borrowing.expected_return - borrowing.borrow_date).days)
+    return int(borrowing.book.daily_fee * days * 100)
 
-    days = (borrowing.expected_return - borrowing.borrow_date).days
-    total_amount = int(float(book.daily_fee) * days * 100)
 
+def create_checkout_session(
+    borrowing, unit_amount, expires_at=None, idempotency_key=None, name=None
+):
     DOMAIN = settings.DOMAIN
 
-    checkout_session = stripe.checkout.Session.create(
-        payment_method_types=["card"],
-        line_items=[
-            {
-                "price_data": {
-                    "currency": "USD",
-                    "unit_amount": total_amount,
-                    "product_data": {"name": book.title},
+    return gateway.create_checkout_session(
+        {
+            "payment_method_types": ["card"],
+            "line_items": [
+                {
+                    "price_data": {
+                        "currency": "USD",
+                        "unit_amount": unit_amount,
+                        "product_data": {"name": name or borrowing.book.title},
+                    },
+                    "quantity": 1,
                 },
-                "quantity": 1,
+            ],
+            "mode": "payment",
+            "success_url": f"{DOMAIN}/api/payments/success/?session_id={{CHECKOUT_SESSION_ID}}",
+            "cancel_url": f"{DOMAIN}/api/payments/cancel/?session_id={{CHECKOUT_SESSION_ID}}",
+            "metadata": {
+                "borrowing_id": str(borrowing.id),
+                "user_id": str(borrowing.user_id),
             },
-        ],
-        mode="payment",
-        success_url=f"{DOMAIN}/api/payments/success/?session_id={{CHECKOUT_SESSION_ID}}",
-        cancel_url=f"{DOMAIN}/api/payments/cancel/?session_id={{CHECKOUT_SESSION_ID}}",
-        metadata={
-            "borrowing_id": str(borrowing.id),
-            "user_id": str(borrowing.user.id),
+            **({"expires_at": int(expires_at.timestamp())} if expires_at else {}),
         },
+        idempotency_key=idempotency_key,
     )
 
-    payment = Payment.objects.create(
-        borrowing=borrowing,
-        type=Payment.Type.PAYMENT,
-        status=Payment.PaymentStatus.PENDING,
-        money_to_pay=total_amount / 100,
+
+def session_expiry():
+    """
+    Expiry to request for a new checkout session. Stripe accepts 30 minutes
+    to 24 hours.
+    """
+    return timezone.now() + timedelta(seconds=settings.PAYMENT_SESSION_TTL)
+
+
+def checkout_payment(borrowing, payment_type, unit_amount):
+    """
+    The PENDING payment of ``payment_type`` for ``borrowing`` with a checkout
+    session still open for at least ``PAYMENT_SESSION_REUSE_MARGIN``
+    seconds. An open session is reused without calling Stripe. A payment
+    still queued in the outbox gets its session here instead of from the
+    worker; it is returned without one while a worker is creating it.
+    Otherwise the old session is expired at Stripe and a new one is stored
+    on its payment, or on a new payment if there is none. Concurrent
+    checkouts of the same payment wait for each other, so only one session
+    is created.
+    """
+    with transaction.atomic():
+        _lock_checkout(borrowing.id, payment_type)
+        pending = Payment.objects.filter(
+            borrowing=borrowing,
+            type=payment_type,
+            status=Payment.PaymentStatus.PENDING,
+        )
+        payment = (
+            pending.filter(session_id__isnull=False)
+            .order_by(F("session_expires_at").desc(nulls_last=True))
+            .first()
+        )
+        reusable_until = timezone.now() + timedelta(
+            seconds=settings.PAYMENT_SESSION_REUSE_MARGIN
+        )
+        expires_at = payment and payment.session_expires_at
+        if expires_at and expires_at > reusable_until:
+            return payment
+
+        queued = pending.filter(session_id__isnull=True).first()
+        if queued is not None:
+            if not _take_over_outbox(queued):
+                return queued
+            return start_checkout(borrowing, payment_type, unit_amount, queued)
+
+        if payment is not None and not expire_session(payment.session_id):
+            # paid in the meantime: the webhook settles the payment
+            return payment
+        return start_checkout(borrowing, payment_type, unit_amount, payment)
+
+
+def _take_over_outbox(payment):
+    """
+    Mark the pending outbox entry of ``payment`` processed in the caller's
+    transaction, so its worker does not create a second session. False
+    when a worker has claimed the entry and is calling Stripe for it.
+    """
+    outbox = PaymentOutbox.objects.filter(
+        payment=payment, processed_at__isnull=True, failed_at__isnull=True
+    ).first()
+    if outbox is None:
+        return True
+    if claim_payment_outbox(outbox.id) is None:
+        return False
+    PaymentOutbox.objects.filter(id=outbox.id).update(
+        processed_at=timezone.now(), claimed_until=None
     )
+    return True
+
+
+def expire_session(session_id):
+    """
+    Expire a checkout session at Stripe. Returns False when it can no
+    longer be expired because it was completed.
+    """
+    try:
+        gateway.expire_checkout_session(session_id)
+    except stripe.InvalidRequestError:
+        # Only open sessions can be expired
+        session = gateway.retrieve_checkout_session(session_id)
+        return session.status == "expired"
+    return True
+
+
+def _lock_checkout(borrowing_id, payment_type):
+    """
+    Hold a transaction-level lock on the checkout of ``payment_type`` for
+    a borrowing, around looking up its payment and creating a session.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_advisory_xact_lock(hashtextextended(%s, 0))",
+            [f"checkout:{borrowing_id}:{payment_type}"],
+        )
+
+
+def start_checkout(borrowing, payment_type, unit_amount, payment=None):
+    """
+    Create a checkout session for ``unit_amount`` cents with a single Stripe
+    call and store it on ``payment``, or on a new PENDING payment of
+    ``payment_type`` when None. ``borrowing`` should come with its book.
+    """
+    expires_at = session_expiry()
+    checkout_session = create_checkout_session(
+        borrowing, unit_amount, expires_at, name=_product_name(borrowing, payment_type)
+    )
+
+    if payment is None:
+        payment = Payment(
+            borrowing=borrowing,
+            type=payment_type,
+            status=Payment.PaymentStatus.PENDING,
+        )
+    payment.money_to_pay = Decimal(unit_amount) / 100
     payment.session_id = checkout_session.id
     payment.session_url = checkout_session.url
+    payment.session_expires_at = expires_at
     payment.save()
+    return payment
+
+
+def _product_name(borrowing, payment_type):
+    if payment_type == Payment.Type.FINE:
+        return f"Late return fine: {borrowing.book.title}"
+    return borrowing.book.title
+
+
+def enqueue_payment_session(
+    borrowing, payment_type=Payment.Type.PAYMENT, unit_amount=None
+):
+    """
+    Create a PENDING payment of ``payment_type`` for ``unit_amount`` cents,
+    the rental amount by default, and its outbox entry in the caller's
+    transaction. The Stripe session is created later by
+    payment.tasks.process_payment_outbox.
+    """
+    if unit_amount is None:
+        unit_amount = calculate_rental_amount(borrowing)
+    payment = Payment.objects.create(
+        borrowing=borrowing,
+        type=payment_type,
+        status=Payment.PaymentStatus.PENDING,
+        money_to_pay=Decimal(unit_amount) / 100,
+    )
+    outbox = PaymentOutbox.objects.create(payment=payment)
+    return payment, outbox
+
+
+def fulfil_payment_outbox(outbox_id):
+    """
+    Create the Stripe session for a queued payment and store its URL.
+    The entry is claimed in its own short transaction, so no row lock is
+    held while Stripe is called. Returns False when Stripe failed and the
+    entry should be retried; after PAYMENT_OUTBOX_MAX_ATTEMPTS failures it
+    is dead-lettered instead. Calls refused by the open circuit breaker do
+    not count as attempts.
+    """
+    outbox = claim_payment_outbox(outbox_id)
+    if outbox is None:
+        return True
+
+    payment = outbox.payment
+    try:
+        expires_at = session_expiry()
+        checkout_session = create_checkout_session(
+            payment.borrowing,
+            int(payment.money_to_pay * 100),
+            expires_at,
+            idempotency_key=f"payment-{payment.id}",
+            name=_product_name(payment.borrowing, payment.type),
+        )
+    except gateway.GatewayUnavailable as error:
+        # The breaker failed fast without asking Stripe, so this is not an
+        # attempt: give it back and retry once the breaker lets calls through.
+        PaymentOutbox.objects.filter(id=outbox.id).update(
+            attempts=F("attempts") - 1, claimed_until=None, last_error=str(error)
+        )
+        return False
+    except stripe.StripeError as error:
+        outbox.last_error = str(error)
+        outbox.claimed_until = None
+        if outbox.attempts >= settings.PAYMENT_OUTBOX_MAX_ATTEMPTS:
+            outbox.failed_at = timezone.now()
+        outbox.save(update_fields=["last_error", "claimed_until", "failed_at"])
+        return outbox.failed_at is not None
+
+    with transaction.atomic():
+        payment.session_id = checkout_session.id
+        payment.session_url = checkout_session.url
+        payment.session_expires_at = expires_at
+        payment.save(update_fields=["session_id", "session_url", "session_expires_at"])
+
+        outbox.processed_at = timezone.now()
+        outbox.claimed_until = None
+        outbox.save(update_fields=["processed_at", "claimed_until"])
+
+    return True
+
+
+def claim_payment_outbox(outbox_id):
+    """
+    The outbox entry with its payment, borrowing and book, counted as one
+    more attempt and claimed for PAYMENT_OUTBOX_CLAIM_TIMEOUT seconds. None
+    when it is processed, dead-lettered or claimed by another worker.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        outbox = (
+            # Lock only the outbox row: skipping entries whose book is locked
+            # by a concurrent borrow would leave them unprocessed.
+            PaymentOutbox.objects.select_for_update(skip_locked=True, of=("self",))
+            .select_related("payment__borrowing__book")
+            .filter(
+                Q(claimed_until__isnull=True) | Q(claimed_until__lt=now),
+                id=outbox_id,
+                processed_at__isnull=True,
+                failed_at__isnull=True,
+                attempts__lt=settings.PAYMENT_OUTBOX_MAX_ATTEMPTS,
+            )
+            .first()
+        )
+        if outbox is None:
+            return None
+
+        outbox.attempts += 1
+        outbox.claimed_until = now + timedelta(
+            seconds=settings.PAYMENT_OUTBOX_CLAIM_TIMEOUT
+        )
+        outbox.save(update_fields=["attempts", "claimed_until"])
+    return outbox
+
+
+def record_stripe_event(event):
+    """
+    Store a verified webhook event for apply_stripe_events, once per event
+    id. Returns False for events that do not settle a payment.
+    """
+    session = event["data"]["object"]
+    if event["type"] not in PAID_EVENTS or session.get("payment_status") != "paid":
+        return False
+
+    StripeEvent.objects.bulk_create(
+        [StripeEvent(id=event["id"], type=event["type"], session_id=session["id"])],
+        ignore_conflicts=True,
+    )
+    return True
+
+
+def apply_stripe_events(batch_size):
+    """
+    Mark the payments of up to ``batch_size`` pending webhook events PAID
+    with a single UPDATE, and move their users' borrowing versions, which
+    the save signal would otherwise do. Returns how many events were
+    applied.
+    """
+    with transaction.atomic():
+        events = list(
+            StripeEvent.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True)
+            .order_by("received_at")
+            .values_list("id", "session_id")[:batch_size]
+        )
+        if not events:
+            return 0
 
-    return checkout_session.url
+        event_ids, session_ids = zip(*events)
+        paid = dict(
+            Payment.objects.filter(
+                session_id__in=set(session_ids), status=Payment.PaymentStatus.PENDING
+            ).values_list("id", "borrowing_id")
+        )
+        if paid:
+            Payment.objects.filter(id__in=paid).update(
+                status=Payment.PaymentStatus.PAID
+            )
+            user_ids = Borrowing.objects.filter(id__in=paid.values()).values_list(
+                "user_id", flat=True
+            )
+            for user_id in set(user_ids):
+                bump_borrowing_version(user_id)
+        StripeEvent.objects.filter(id__in=event_ids).update(processed_at=timezone.now())
+    return len(events)
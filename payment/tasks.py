@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from payment.models import PaymentOutbox
+from payment.services import apply_stripe_events, fulfil_payment_outbox
+
+OUTBOX_RETRY_DELAY = 10
+OUTBOX_SWEEP_BATCH = 100
+STRIPE_EVENT_BATCH = 500
+
+
+@shared_task(bind=True, max_retries=5)
+def process_payment_outbox(self, outbox_id):
+    if not fulfil_payment_outbox(outbox_id):
+        raise self.retry(countdown=OUTBOX_RETRY_DELAY * 2**self.request.retries)
+
+
+@shared_task
+def sweep_payment_outbox():
+    """
+    Re-enqueue outbox entries whose on-commit task never ran or gave up,
+    and dead-letter those out of attempts.
+    """
+    now = timezone.now()
+    pending = PaymentOutbox.objects.filter(
+        processed_at__isnull=True, failed_at__isnull=True
+    )
+    pending.filter(attempts__gte=settings.PAYMENT_OUTBOX_MAX_ATTEMPTS).update(
+        failed_at=now
+    )
+    outbox_ids = pending.filter(
+        created_at__lte=now - timedelta(minutes=1),
+        attempts__lt=settings.PAYMENT_OUTBOX_MAX_ATTEMPTS,
+    ).values_list("id", flat=True)[:OUTBOX_SWEEP_BATCH]
+
+    for outbox_id in outbox_ids:
+        process_payment_outbox.delay(outbox_id)
+
+
+@shared_task
+def process_stripe_events():
+    """
+    Apply pending webhook events batch by batch. Runs after each webhook
+    and every minute from beat; concurrent runs skip each other's rows.
+    """
+    while apply_stripe_events(STRIPE_EVENT_BATCH) == STRIPE_EVENT_BATCH:
+        pass
@@ -1,14 +1,34 @@
 import datetime
+import hashlib
+import hmac
+import json
+import time
 from unittest.mock import patch, MagicMock
 
+import stripe
+
+from django.core.cache import cache
+from django.db import IntegrityError, connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
 from django.contrib.auth import get_user_model
 
+from benchmarks.fake_stripe import FakeStripe, decode_params
 from books.models import Book
 from borrowings.models import Borrowing
-from payment.models import Payment
+from payment import gateway
+from payment.models import Payment, PaymentOutbox, StripeEvent
+from payment.services import (
+    apply_stripe_events,
+    calculate_rental_amount,
+    enqueue_payment_session,
+    fulfil_payment_outbox,
+)
+from payment.tasks import process_stripe_events, sweep_payment_outbox
 
 User = get_user_model()
 
@@ -72,9 +92,24 @@ class PaymentViewSetTestCase(APITestCase):
         self.assertEqual(resp.data["id"], self.payment.id)
         self.assertEqual(resp.data["money_to_pay"], "5.00")
 
+    def test_sparse_fields(self):
+        self.client.force_authenticate(user=self.user)
+        resp = self.client.get(
+            reverse("payment:transactions-list"), {"fields": "id,status"}
+        )
+        self.assertEqual(resp.data, [{"id": self.payment.id, "status": "PENDING"}])
+
+        url = reverse("payment:transactions-detail", args=[self.payment.id])
+        resp = self.client.get(url, {"fields": "session_url,borrowing"})
+        self.assertEqual(
+            resp.data,
+            {"borrowing": self.borrowing.id, "session_url": self.payment.session_url},
+        )
+
 
 class PaymentCheckoutViewTestCase(APITestCase):
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(email="user@test.com", password="pass123")
         self.book = Book.objects.create(
             title="Test Book",
@@ -90,7 +125,7 @@ class PaymentCheckoutViewTestCase(APITestCase):
             expected_return=datetime.date.today() + datetime.timedelta(days=3),
         )
 
-    @patch("stripe.checkout.Session.create")
+    @patch("stripe.checkout.SessionService.create")
     def test_checkout_creates_payment(self, mock_stripe):
         mock_session = MagicMock()
         mock_session.id = "sess_abc"
@@ -110,6 +145,179 @@ class PaymentCheckoutViewTestCase(APITestCase):
         self.assertEqual(payment.type, Payment.Type.PAYMENT)
         self.assertAlmostEqual(float(payment.money_to_pay), 1.5 * 3, places=2)
 
+    @patch("stripe.checkout.SessionService.create")
+    def test_checkout_replays_idempotency_key(self, mock_stripe):
+        mock_stripe.return_value = MagicMock(
+            id="sess_abc", url="https://stripe.test/session"
+        )
+        self.client.force_authenticate(user=self.user)
+        url = reverse("payment:checkout", kwargs={"borrowing_id": self.borrowing.id})
+
+        resp1 = self.client.post(url, HTTP_IDEMPOTENCY_KEY="checkout-1")
+        resp2 = self.client.post(url, HTTP_IDEMPOTENCY_KEY="checkout-1")
+
+        self.assertEqual(resp2.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp2.data, resp1.data)
+        mock_stripe.assert_called_once()
+        self.assertEqual(Payment.objects.filter(borrowing=self.borrowing).count(), 1)
+
+    @patch("stripe.checkout.SessionService.create")
+    def test_checkout_reuses_open_session(self, mock_stripe):
+        mock_stripe.return_value = MagicMock(id="sess_abc", url="https://x/abc")
+        self.client.force_authenticate(user=self.user)
+        url = reverse("payment:checkout", kwargs={"borrowing_id": self.borrowing.id})
+
+        resp1 = self.client.post(url)
+        resp2 = self.client.post(url)
+
+        self.assertEqual(resp2.data, resp1.data)
+        mock_stripe.assert_called_once()
+        payment = Payment.objects.get(borrowing=self.borrowing)
+        self.assertGreater(payment.session_expires_at, timezone.now())
+        self.assertEqual(
+            mock_stripe.call_args[0][0]["expires_at"],
+            int(payment.session_expires_at.timestamp()),
+        )
+
+    @patch("stripe.checkout.SessionService.expire")
+    @patch("stripe.checkout.SessionService.create")
+    def test_checkout_renews_expired_session(self, mock_stripe, mock_expire):
+        mock_stripe.return_value = MagicMock(id="sess_old", url="https://x/old")
+        self.client.force_authenticate(user=self.user)
+        url = reverse("payment:checkout", kwargs={"borrowing_id": self.borrowing.id})
+        self.client.post(url)
+
+        for expires_in in (
+            datetime.timedelta(minutes=-1),
+            # about to expire counts as expired
+            datetime.timedelta(minutes=5),
+        ):
+            Payment.objects.update(session_expires_at=timezone.now() + expires_in)
+            mock_stripe.return_value = MagicMock(
+                id=f"sess_{expires_in.seconds}", url="https://x/new"
+            )
+            resp = self.client.post(url)
+            self.assertEqual(resp.data["url"], "https://x/new")
+
+        self.assertEqual(mock_stripe.call_count, 3)
+        payment = Payment.objects.get(borrowing=self.borrowing)
+        self.assertEqual(payment.session_id, resp.data["session_id"])
+        self.assertGreater(payment.session_expires_at, timezone.now())
+        self.assertEqual(
+            [c.args[0] for c in mock_expire.call_args_list],
+            ["sess_old", "sess_86340"],
+        )
+
+    @patch("stripe.checkout.SessionService.retrieve")
+    @patch("stripe.checkout.SessionService.expire")
+    @patch("stripe.checkout.SessionService.create")
+    def test_checkout_keeps_completed_session(
+        self, mock_stripe, mock_expire, mock_retrieve
+    ):
+        mock_stripe.return_value = MagicMock(id="sess_old", url="https://x/old")
+        self.client.force_authenticate(user=self.user)
+        url = reverse("payment:checkout", kwargs={"borrowing_id": self.borrowing.id})
+        self.client.post(url)
+        Payment.objects.update(session_expires_at=timezone.now())
+
+        mock_expire.side_effect = stripe.InvalidRequestError(
+            "Only Checkout Sessions with a status of open can be expired", None
+        )
+        mock_retrieve.return_value = MagicMock(status="complete")
+        resp = self.client.post(url)
+
+        self.assertEqual(resp.data["session_id"], "sess_old")
+        mock_stripe.assert_called_once()
+        mock_retrieve.assert_called_once_with("sess_old")
+
+    @patch("stripe.checkout.SessionService.retrieve")
+    @patch("stripe.checkout.SessionService.expire")
+    @patch("stripe.checkout.SessionService.create")
+    def test_checkout_replaces_session_expired_by_stripe(
+        self, mock_stripe, mock_expire, mock_retrieve
+    ):
+        mock_stripe.return_value = MagicMock(id="sess_old", url="https://x/old")
+        self.client.force_authenticate(user=self.user)
+        url = reverse("payment:checkout", kwargs={"borrowing_id": self.borrowing.id})
+        self.client.post(url)
+        Payment.objects.update(session_expires_at=timezone.now())
+
+        mock_expire.side_effect = stripe.InvalidRequestError("Not open", None)
+        mock_retrieve.return_value = MagicMock(status="expired")
+        mock_stripe.return_value = MagicMock(id="sess_new", url="https://x/new")
+        resp = self.client.post(url)
+
+        self.assertEqual(resp.data["session_id"], "sess_new")
+        self.assertEqual(Payment.objects.filter(borrowing=self.borrowing).count(), 1)
+
+    @patch("stripe.checkout.SessionService.create")
+    def test_checkout_locks_the_borrowing_payment(self, mock_stripe):
+        mock_stripe.return_value = MagicMock(id="sess_abc", url="https://x/abc")
+        self.client.force_authenticate(user=self.user)
+        url = reverse("payment:checkout", kwargs={"borrowing_id": self.borrowing.id})
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(url)
+
+        locks = [q["sql"] for q in queries if "pg_advisory_xact_lock" in q["sql"]]
+        self.assertEqual(len(locks), 1)
+        self.assertIn(f"checkout:{self.borrowing.id}:PAYMENT", locks[0])
+
+    @patch("stripe.checkout.SessionService.create")
+    def test_checkout_does_not_reuse_paid_session(self, mock_stripe):
+        mock_stripe.return_value = MagicMock(id="sess_paid", url="https://x/paid")
+        self.client.force_authenticate(user=self.user)
+        url = reverse("payment:checkout", kwargs={"borrowing_id": self.borrowing.id})
+        self.client.post(url)
+        Payment.objects.update(status=Payment.PaymentStatus.PAID)
+
+        mock_stripe.return_value = MagicMock(id="sess_new", url="https://x/new")
+        resp = self.client.post(url)
+        self.assertEqual(resp.data["session_id"], "sess_new")
+        self.assertEqual(Payment.objects.filter(borrowing=self.borrowing).count(), 2)
+
+    @patch("stripe.checkout.SessionService.create")
+    def test_checkout_takes_over_queued_payment(self, mock_stripe):
+        mock_stripe.return_value = MagicMock(id="sess_abc", url="https://x/abc")
+        payment, outbox = enqueue_payment_session(self.borrowing)
+        self.client.force_authenticate(user=self.user)
+        url = reverse("payment:checkout", kwargs={"borrowing_id": self.borrowing.id})
+
+        resp = self.client.post(url)
+
+        self.assertEqual(resp.data["session_id"], "sess_abc")
+        payment.refresh_from_db()
+        outbox.refresh_from_db()
+        self.assertEqual(payment.session_id, "sess_abc")
+        self.assertIsNotNone(outbox.processed_at)
+        self.assertTrue(fulfil_payment_outbox(outbox.id))
+        mock_stripe.assert_called_once()
+        self.assertEqual(
+            mock_stripe.call_args[0][0]["line_items"][0]["price_data"]["unit_amount"],
+            int(payment.money_to_pay * 100),
+        )
+        self.assertEqual(Payment.objects.filter(borrowing=self.borrowing).count(), 1)
+
+    @patch("stripe.checkout.SessionService.create")
+    def test_checkout_waits_for_claimed_outbox(self, mock_stripe):
+        _, outbox = enqueue_payment_session(self.borrowing)
+        PaymentOutbox.objects.filter(id=outbox.id).update(
+            claimed_until=timezone.now() + datetime.timedelta(minutes=1)
+        )
+        self.client.force_authenticate(user=self.user)
+        url = reverse("payment:checkout", kwargs={"borrowing_id": self.borrowing.id})
+
+        resp = self.client.post(url, HTTP_IDEMPOTENCY_KEY="checkout-1")
+
+        self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(resp["Retry-After"], "1")
+        mock_stripe.assert_not_called()
+        self.assertEqual(Payment.objects.filter(borrowing=self.borrowing).count(), 1)
+
+    def test_rental_amount_charges_at_least_one_day(self):
+        self.borrowing.expected_return = self.borrowing.borrow_date
+        self.assertEqual(calculate_rental_amount(self.borrowing), 150)
+
     def test_checkout_nonexistent_borrowing_returns_404(self):
         self.client.force_authenticate(user=self.user)
         url = reverse("payment:checkout", kwargs={"borrowing_id": 999})
@@ -121,8 +329,8 @@ class PaymentResultViewsTestCase(APITestCase):
     def setUp(self):
         self.user = User.objects.create_user(email="u@test.com", password="pass")
 
-    @patch("stripe.checkout.Session.retrieve")
-    def test_success_view_updates_payment(self, mock_retrieve):
+    @patch("stripe.checkout.SessionService.retrieve")
+    def test_success_view_reads_local_state(self, mock_retrieve):
         book = Book.objects.create(
             title="Book", author="A", cover="HARD", inventory=2, daily_fee=2
         )
@@ -141,18 +349,23 @@ class PaymentResultViewsTestCase(APITestCase):
             money_to_pay=6.0,
         )
 
-        mock_retrieve.return_value = MagicMock(
-            metadata={"borrowing_id": borrowing.id, "user_id": self.user.id}
-        )
-
         self.client.force_authenticate(user=self.user)
         url = reverse("payment:success") + "?session_id=sess_1"
         resp = self.client.get(url)
         self.assertEqual(resp.status_code, 200)
-
-        payment.refresh_from_db()
-        self.assertEqual(payment.status, Payment.PaymentStatus.PAID)
+        self.assertEqual(resp.data["detail"], "Processing")
         self.assertEqual(str(resp.data["borrowing_id"]), str(borrowing.id))
+        mock_retrieve.assert_not_called()
+
+        Payment.objects.filter(pk=payment.pk).update(status=Payment.PaymentStatus.PAID)
+        resp = self.client.get(url)
+        self.assertEqual(resp.data["detail"], "Success")
+        self.assertEqual(resp.data["user_id"], str(self.user.id))
+
+    def test_success_view_unknown_session(self):
+        self.client.force_authenticate(user=self.user)
+        resp = self.client.get(reverse("payment:success") + "?session_id=sess_x")
+        self.assertEqual(resp.status_code, 404)
 
     def test_success_view_no_session_id(self):
         self.client.force_authenticate(user=self.user)
@@ -166,3 +379,451 @@ class PaymentResultViewsTestCase(APITestCase):
         resp = self.client.get(url)
         self.assertEqual(resp.status_code, 200)
         self.assertIn("Canceled", resp.data["detail"])
+
+
+class PaymentOutboxTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="u@test.com", password="pass")
+        self.book = Book.objects.create(
+            title="Book", author="A", cover="HARD", inventory=2, daily_fee=2
+        )
+        self.borrowing = Borrowing.objects.create(
+            user=self.user,
+            book=self.book,
+            expected_return=datetime.date.today() + datetime.timedelta(days=3),
+        )
+        self.payment, self.outbox = enqueue_payment_session(self.borrowing)
+
+    def test_enqueue_creates_pending_payment_without_session(self):
+        self.assertEqual(self.payment.status, Payment.PaymentStatus.PENDING)
+        self.assertEqual(self.payment.type, Payment.Type.PAYMENT)
+        self.assertEqual(float(self.payment.money_to_pay), 6.0)
+        self.assertEqual(self.payment.session_url, "")
+        self.assertIsNone(self.payment.session_id)
+        self.assertIsNone(self.outbox.processed_at)
+
+    @patch("stripe.checkout.SessionService.create")
+    def test_fulfil_fills_in_session_url(self, mock_stripe_create):
+        mock_stripe_create.return_value = MagicMock(
+            id="sess_outbox", url="https://stripe.test/outbox"
+        )
+
+        self.assertTrue(fulfil_payment_outbox(self.outbox.id))
+
+        self.payment.refresh_from_db()
+        self.outbox.refresh_from_db()
+        self.assertEqual(self.payment.session_id, "sess_outbox")
+        self.assertEqual(self.payment.session_url, "https://stripe.test/outbox")
+        self.assertIsNotNone(self.outbox.processed_at)
+        self.assertEqual(
+            mock_stripe_create.call_args[0][0]["line_items"][0]["price_data"][
+                "unit_amount"
+            ],
+            600,
+        )
+        self.assertEqual(
+            mock_stripe_create.call_args[0][1]["idempotency_key"],
+            f"payment-{self.payment.id}",
+        )
+
+        fulfil_payment_outbox(self.outbox.id)
+        mock_stripe_create.assert_called_once()
+
+    @patch("stripe.checkout.SessionService.create")
+    def test_fulfil_locks_only_the_outbox_row(self, mock_stripe_create):
+        mock_stripe_create.return_value = MagicMock(id="sess_lock", url="https://x")
+        with CaptureQueriesContext(connection) as queries:
+            fulfil_payment_outbox(self.outbox.id)
+        self.assertTrue(
+            any(
+                'FOR UPDATE OF "payment_paymentoutbox" SKIP LOCKED' in query["sql"]
+                for query in queries
+            )
+        )
+
+    @patch("stripe.checkout.SessionService.create")
+    def test_fulfil_records_stripe_failure(self, mock_stripe_create):
+        mock_stripe_create.side_effect = stripe.APIConnectionError("Stripe is down")
+
+        self.assertFalse(fulfil_payment_outbox(self.outbox.id))
+
+        self.outbox.refresh_from_db()
+        self.assertIsNone(self.outbox.processed_at)
+        self.assertEqual(self.outbox.attempts, 1)
+        self.assertIn("Stripe is down", self.outbox.last_error)
+        self.assertIsNone(self.outbox.claimed_until)
+        self.assertIsNone(self.outbox.failed_at)
+
+    @patch("stripe.checkout.SessionService.create")
+    def test_fulfil_calls_stripe_outside_the_claim_transaction(
+        self, mock_stripe_create
+    ):
+        depth = len(connection.atomic_blocks)
+
+        def create(params, options):
+            self.assertEqual(len(connection.atomic_blocks), depth)
+            claimed = PaymentOutbox.objects.get(id=self.outbox.id)
+            self.assertEqual(claimed.attempts, 1)
+            self.assertGreater(claimed.claimed_until, timezone.now())
+            return MagicMock(id="sess_claim", url="https://x")
+
+        mock_stripe_create.side_effect = create
+
+        self.assertTrue(fulfil_payment_outbox(self.outbox.id))
+        self.outbox.refresh_from_db()
+        self.assertIsNotNone(self.outbox.processed_at)
+        self.assertIsNone(self.outbox.claimed_until)
+
+    @patch("stripe.checkout.SessionService.create")
+    def test_fulfil_skips_claimed_entry(self, mock_stripe_create):
+        PaymentOutbox.objects.filter(id=self.outbox.id).update(
+            claimed_until=timezone.now() + datetime.timedelta(seconds=30)
+        )
+        self.assertTrue(fulfil_payment_outbox(self.outbox.id))
+        mock_stripe_create.assert_not_called()
+
+    @override_settings(PAYMENT_OUTBOX_MAX_ATTEMPTS=2)
+    @patch("stripe.checkout.SessionService.create")
+    def test_fulfil_dead_letters_after_max_attempts(self, mock_stripe_create):
+        mock_stripe_create.side_effect = stripe.InvalidRequestError(
+            "Bad amount", "amount"
+        )
+
+        self.assertFalse(fulfil_payment_outbox(self.outbox.id))
+        self.assertTrue(fulfil_payment_outbox(self.outbox.id))
+        self.assertTrue(fulfil_payment_outbox(self.outbox.id))
+
+        self.outbox.refresh_from_db()
+        self.assertEqual(mock_stripe_create.call_count, 2)
+        self.assertEqual(self.outbox.attempts, 2)
+        self.assertIsNotNone(self.outbox.failed_at)
+        self.assertIsNone(self.outbox.processed_at)
+
+    @override_settings(PAYMENT_OUTBOX_MAX_ATTEMPTS=1)
+    @patch("stripe.checkout.SessionService.create")
+    def test_fulfil_open_breaker_uses_no_attempt(self, mock_stripe_create):
+        cache.set(gateway.BREAKER_OPEN_UNTIL_KEY, time.time() + 30, None)
+
+        for _ in range(3):
+            self.assertFalse(fulfil_payment_outbox(self.outbox.id))
+
+        mock_stripe_create.assert_not_called()
+        self.outbox.refresh_from_db()
+        self.assertEqual(self.outbox.attempts, 0)
+        self.assertIsNone(self.outbox.failed_at)
+        self.assertIsNone(self.outbox.claimed_until)
+        self.assertIn("temporarily unavailable", self.outbox.last_error)
+
+        cache.delete(gateway.BREAKER_OPEN_UNTIL_KEY)
+        mock_stripe_create.return_value = MagicMock(id="sess_later", url="https://x")
+        self.assertTrue(fulfil_payment_outbox(self.outbox.id))
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.session_id, "sess_later")
+
+    @override_settings(PAYMENT_OUTBOX_MAX_ATTEMPTS=3)
+    @patch("payment.tasks.process_payment_outbox")
+    def test_sweep_dead_letters_entries_out_of_attempts(self, mock_task):
+        _, retried = enqueue_payment_session(self.borrowing)
+        PaymentOutbox.objects.update(
+            created_at=timezone.now() - datetime.timedelta(minutes=5)
+        )
+        PaymentOutbox.objects.filter(id=self.outbox.id).update(attempts=3)
+
+        sweep_payment_outbox()
+
+        mock_task.delay.assert_called_once_with(retried.id)
+        self.outbox.refresh_from_db()
+        self.assertIsNotNone(self.outbox.failed_at)
+
+    def test_payment_is_pollable_while_pending(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse("payment:transactions-detail", args=[self.payment.id])
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data["status"], Payment.PaymentStatus.PENDING)
+        self.assertEqual(resp.data["session_url"], "")
+
+
+@override_settings(STRIPE_BREAKER_THRESHOLD=2)
+class PaymentGatewayTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="u@test.com", password="pass")
+        book = Book.objects.create(
+            title="Book", author="A", cover="HARD", inventory=2, daily_fee=2
+        )
+        self.borrowing = Borrowing.objects.create(
+            user=self.user,
+            book=book,
+            expected_return=datetime.date.today() + datetime.timedelta(days=3),
+        )
+
+    def test_client_is_shared_and_has_timeouts(self):
+        client = gateway.get_client()
+        self.assertIs(gateway.get_client(), client)
+        self.assertEqual(client._requestor._client._timeout, (2, 10))
+        self.assertEqual(client._requestor._options.max_network_retries, 2)
+
+    @patch("stripe.checkout.SessionService.create")
+    def test_breaker_fails_fast_after_outages(self, mock_stripe_create):
+        mock_stripe_create.side_effect = stripe.APIConnectionError("Stripe is down")
+        for _ in range(2):
+            with self.assertRaises(stripe.APIConnectionError):
+                gateway.create_checkout_session({})
+        self.assertIsNotNone(cache.get(gateway.BREAKER_OPEN_UNTIL_KEY))
+
+        with self.assertRaises(gateway.GatewayUnavailable):
+            gateway.create_checkout_session({})
+        self.assertEqual(mock_stripe_create.call_count, 2)
+
+        self.client.force_authenticate(user=self.user)
+        resp = self.client.post(
+            reverse("payment:checkout", kwargs={"borrowing_id": self.borrowing.id})
+        )
+        self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(resp["Retry-After"], "30")
+        self.assertFalse(Payment.objects.exists())
+
+    @patch(
+        "stripe.checkout.SessionService.create",
+        side_effect=stripe.APIConnectionError("connection reset by 10.0.0.7"),
+    )
+    def test_checkout_outage_before_breaker_opens_is_503(self, mock_stripe_create):
+        self.client.force_authenticate(user=self.user)
+        resp = self.client.post(
+            reverse("payment:checkout", kwargs={"borrowing_id": self.borrowing.id})
+        )
+
+        mock_stripe_create.assert_called_once()
+        self.assertIsNone(cache.get(gateway.BREAKER_OPEN_UNTIL_KEY))
+        self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(resp.data["detail"], "Payments are temporarily unavailable")
+        self.assertEqual(resp["Retry-After"], "30")
+
+    @patch("stripe.checkout.SessionService.create")
+    def test_breaker_probes_once_and_closes(self, mock_stripe_create):
+        cache.set(gateway.BREAKER_OPEN_UNTIL_KEY, 0, None)
+        cache.set(gateway.BREAKER_PROBE_KEY, 1, None)
+        with self.assertRaises(gateway.GatewayUnavailable):
+            gateway.create_checkout_session({})
+        mock_stripe_create.assert_not_called()
+
+        cache.delete(gateway.BREAKER_PROBE_KEY)
+        mock_stripe_create.return_value = MagicMock(id="cs_1")
+        self.assertEqual(gateway.create_checkout_session({}).id, "cs_1")
+        self.assertIsNone(cache.get(gateway.BREAKER_OPEN_UNTIL_KEY))
+
+    @patch("stripe.checkout.SessionService.create")
+    def test_request_errors_do_not_open_breaker(self, mock_stripe_create):
+        mock_stripe_create.side_effect = stripe.InvalidRequestError("bad", "param")
+        for _ in range(3):
+            with self.assertRaises(stripe.InvalidRequestError):
+                gateway.create_checkout_session({})
+        self.assertIsNone(cache.get(gateway.BREAKER_OPEN_UNTIL_KEY))
+
+
+class FakeStripeTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.fake = self.enterContext(FakeStripe())
+        self.enterContext(
+            override_settings(
+                STRIPE_API_BASE=self.fake.url, STRIPE_MAX_NETWORK_RETRIES=0
+            )
+        )
+        gateway.get_client.cache_clear()
+        self.addCleanup(gateway.get_client.cache_clear)
+
+        user = User.objects.create_user(email="u@test.com", password="pass")
+        book = Book.objects.create(
+            title="Book", author="A", cover="HARD", inventory=2, daily_fee=2
+        )
+        borrowing = Borrowing.objects.create(
+            user=user,
+            book=book,
+            expected_return=datetime.date.today() + datetime.timedelta(days=3),
+        )
+        self.payment, self.outbox = enqueue_payment_session(borrowing)
+
+    def test_outbox_creates_session_on_fake_stripe(self):
+        self.assertTrue(fulfil_payment_outbox(self.outbox.id))
+
+        self.payment.refresh_from_db()
+        session = self.fake.sessions[self.payment.session_id]
+        self.assertEqual(self.payment.session_url, session["url"])
+        self.assertEqual(session["amount_total"], 600)
+        self.assertEqual(
+            session["metadata"]["borrowing_id"], str(self.payment.borrowing_id)
+        )
+
+    def test_fake_stripe_replays_idempotency_key(self):
+        first = gateway.create_checkout_session({"mode": "payment"}, "key-1")
+        second = gateway.create_checkout_session({"mode": "payment"}, "key-1")
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(len(self.fake.sessions), 1)
+
+    def test_fake_stripe_expires_open_sessions_only(self):
+        session = gateway.create_checkout_session({"mode": "payment"})
+        self.assertEqual(gateway.expire_checkout_session(session.id).status, "expired")
+        with self.assertRaises(stripe.InvalidRequestError):
+            gateway.expire_checkout_session(session.id)
+        self.assertEqual(
+            gateway.retrieve_checkout_session(session.id).status, "expired"
+        )
+
+    def test_fake_stripe_injects_errors(self):
+        self.fake.error_rate = 1
+        self.assertFalse(fulfil_payment_outbox(self.outbox.id))
+        self.outbox.refresh_from_db()
+        self.assertIn("Injected failure", self.outbox.last_error)
+
+    def test_decode_params(self):
+        self.assertEqual(
+            decode_params(
+                "mode=payment&payment_method_types[0]=card"
+                "&line_items[0][price_data][unit_amount]=600"
+                "&line_items[0][quantity]=1&metadata[user_id]=3"
+            ),
+            {
+                "mode": "payment",
+                "payment_method_types": ["card"],
+                "line_items": [{"price_data": {"unit_amount": "600"}, "quantity": "1"}],
+                "metadata": {"user_id": "3"},
+            },
+        )
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET="whsec_test")
+class PaymentWebhookTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="u@test.com", password="pass")
+        book = Book.objects.create(
+            title="Book", author="A", cover="HARD", inventory=2, daily_fee=2
+        )
+        self.borrowing = Borrowing.objects.create(
+            user=self.user,
+            book=book,
+            expected_return=datetime.date.today() + datetime.timedelta(days=3),
+        )
+        self.payment = Payment.objects.create(
+            status=Payment.PaymentStatus.PENDING,
+            type=Payment.Type.PAYMENT,
+            borrowing=self.borrowing,
+            session_url="url",
+            session_id="cs_test_1",
+            money_to_pay=6.0,
+        )
+        self.url = reverse("payment:webhook")
+
+    def _post(self, event, secret="whsec_test"):
+        payload = json.dumps(event)
+        timestamp = int(time.time())
+        signature = hmac.new(
+            secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256
+        ).hexdigest()
+        return self.client.post(
+            self.url,
+            payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=f"t={timestamp},v1={signature}",
+        )
+
+    def _event(self, event_id, session_id="cs_test_1"):
+        return {
+            "id": event_id,
+            "object": "event",
+            "type": "checkout.session.completed",
+            "data": {
+                "object": {
+                    "id": session_id,
+                    "object": "checkout.session",
+                    "payment_status": "paid",
+                }
+            },
+        }
+
+    @patch("payment.views.process_stripe_events")
+    def test_webhook_queues_event(self, mock_task):
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self._post(self._event("evt_1"))
+
+        self.assertEqual(resp.status_code, 200)
+        mock_task.delay.assert_called_once_with()
+        self.assertTrue(StripeEvent.objects.filter(id="evt_1").exists())
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.PaymentStatus.PENDING)
+
+        process_stripe_events()
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.PaymentStatus.PAID)
+        self.assertIsNotNone(StripeEvent.objects.get(id="evt_1").processed_at)
+
+    @patch("payment.views.process_stripe_events")
+    def test_webhook_ignores_redelivery_and_other_events(self, _):
+        self._post(self._event("evt_1"))
+        self._post(self._event("evt_1"))
+        other = dict(self._event("evt_2"), type="checkout.session.expired")
+        self.assertEqual(self._post(other).status_code, 200)
+
+        self.assertEqual(
+            list(StripeEvent.objects.values_list("id", flat=True)), ["evt_1"]
+        )
+
+    def test_webhook_rejects_bad_signature(self):
+        resp = self._post(self._event("evt_1"), secret="whsec_other")
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_apply_stripe_events_in_batches(self):
+        for i in range(2, 5):
+            Payment.objects.create(
+                status=Payment.PaymentStatus.PENDING,
+                type=Payment.Type.FINE,
+                borrowing=self.borrowing,
+                session_id=f"cs_test_{i}",
+                money_to_pay=1,
+            )
+        StripeEvent.objects.bulk_create(
+            StripeEvent(
+                id=f"evt_{i}",
+                type="checkout.session.completed",
+                session_id=f"cs_test_{i}",
+            )
+            for i in range(1, 5)
+        )
+
+        self.assertEqual(apply_stripe_events(3), 3)
+        self.assertEqual(apply_stripe_events(3), 1)
+        self.assertEqual(apply_stripe_events(3), 0)
+        self.assertFalse(
+            Payment.objects.filter(status=Payment.PaymentStatus.PENDING).exists()
+        )
+
+    @patch("payment.views.process_stripe_events")
+    def test_webhook_changes_borrowing_etag(self, _):
+        url = reverse("borrowings:borrowing-detail", args=[self.borrowing.id])
+        self.client.force_authenticate(self.user)
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+            status.HTTP_304_NOT_MODIFIED,
+        )
+
+        self._post(self._event("evt_1"))
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_stripe_events(10)
+
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.json()["payment"][0]["status"], "PAID")
+
+    def test_session_id_is_unique(self):
+        with self.assertRaises(IntegrityError):
+            Payment.objects.create(
+                status=Payment.PaymentStatus.PENDING,
+                type=Payment.Type.FINE,
+                borrowing=self.borrowing,
+                session_id="cs_test_1",
+                money_to_pay=1,
+            )
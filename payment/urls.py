@@ -6,6 +6,7 @@ from payment.views import (
     PaymentCheckoutView,
     PaymentSuccessView,
     PaymentCanceledView,
+    PaymentWebhookView,
 )
 
 app_name = "payment"
@@ -27,4 +28,5 @@ urlpatterns = [
         PaymentCanceledView.as_view(),
         name="cancel",
     ),
+    path("webhook/", PaymentWebhookView.as_view(), name="webhook"),
 ]
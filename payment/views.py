@@ -1,4 +1,7 @@
 import stripe
+from django.conf import settings
+from django.db import transaction
+from django.utils.decorators import method_decorator
 from drf_spectacular.utils import (
     extend_schema_view,
     extend_schema,
@@ -8,28 +11,39 @@ from drf_spectacular.utils import (
 )
 from rest_framework import viewsets, status
 from rest_framework import mixins
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from borrowings.models import Borrowing
-from library_project import settings
+from books.sparse import SPARSE_PARAMETERS, SparseFieldsMixin
+from books.values import ValuesListMixin
+from borrowings.models import Borrowing, BorrowingHistory
+from library_project.idempotency import IDEMPOTENCY_PARAMETER, idempotent
+from payment.gateway import UNAVAILABLE_ERRORS, payments_unavailable
 from payment.models import Payment
 from payment.serializers import (
     PaymentSerializer,
     PaymentListSerializer,
     PaymentDetailSerializer,
 )
+from payment.services import (
+    calculate_rental_amount,
+    checkout_payment,
+    record_stripe_event,
+)
+from payment.tasks import process_stripe_events
 
 
 @extend_schema_view(
     list=extend_schema(
         summary="List payments",
         description="Returns list of payments. Admins see all payments; users see only their own.",
+        parameters=SPARSE_PARAMETERS,
         responses={200: PaymentListSerializer},
     ),
     retrieve=extend_schema(
         summary="Retrieve payment",
         description="Returns detailed info about a specific payment.",
+        parameters=SPARSE_PARAMETERS,
         responses={
             200: PaymentDetailSerializer,
             404: OpenApiResponse(description="Payment not found"),
@@ -43,6 +57,8 @@ from payment.serializers import (
     ),
 )
 class PaymentGenericView(
+    SparseFieldsMixin,
+    ValuesListMixin,
     viewsets.GenericViewSet,
     mixins.RetrieveModelMixin,
     mixins.CreateModelMixin,
@@ -62,22 +78,35 @@ class PaymentGenericView(
         if self.request.user.is_staff:
             return Payment.objects.all()
         if self.request.user.is_authenticated:
-            return Payment.objects.filter(borrowing__user=self.request.user)
+            # Through the history, so payments of archived borrowings stay.
+            return Payment.objects.filter(
+                borrowing_id__in=BorrowingHistory.objects.filter(
+                    user=self.request.user
+                ).values("id")
+            )
         return Payment.objects.none()
 
 
 @extend_schema_view(
     post=extend_schema(
         summary="Checkout for borrowing",
-        description="Creates a Stripe Checkout session for a specific borrowing.",
+        description=(
+            "Returns a Stripe Checkout session for a specific borrowing. A "
+            "pending session that is still open is reused, otherwise a new "
+            "one is created. A rental payment still queued after borrowing "
+            "gets its session here, so no second payment is created. "
+            "Send an `Idempotency-Key` header to make retries safe: a repeated "
+            "key returns the first session instead of creating another one."
+        ),
         parameters=[
+            IDEMPOTENCY_PARAMETER,
             OpenApiParameter(
                 name="borrowing_id",
                 description="ID of borrowing to pay for",
                 required=True,
                 type=int,
                 location=OpenApiParameter.PATH,
-            )
+            ),
         ],
         responses={
             200: OpenApiResponse(
@@ -93,90 +122,119 @@ class PaymentGenericView(
                 ],
             ),
             404: OpenApiResponse(description="Borrowing not found"),
+            503: OpenApiResponse(
+                description=(
+                    "Stripe is unavailable, or the session is still being "
+                    "created; retry after Retry-After seconds"
+                )
+            ),
         },
     )
 )
 class PaymentCheckoutView(APIView):
     permission_classes = (IsAuthenticated,)
 
+    @method_decorator(idempotent)
     def post(self, request, *args, **kwargs):
         borrowing_id = self.kwargs["borrowing_id"]
-        stripe.api_key = settings.STRIPE_SECRET_KEY
 
         try:
-            borrowing = Borrowing.objects.get(id=borrowing_id)
+            borrowing = Borrowing.objects.select_related("book").get(id=borrowing_id)
         except Borrowing.DoesNotExist:
             return Response(
                 {"detail": "Borrowing not found"}, status=status.HTTP_404_NOT_FOUND
             )
 
-        book = borrowing.book
-
-        days = max(1, (borrowing.expected_return - borrowing.borrow_date).days)
-
-        DOMAIN = settings.DOMAIN
-
-        checkout_session = stripe.checkout.Session.create(
-            payment_method_types=["card"],
-            line_items=[
-                {
-                    "price_data": {
-                        "currency": "USD",
-                        "unit_amount": int(float(book.daily_fee) * days * 100),
-                        "product_data": {
-                            "name": book.title,
-                        },
-                    },
-                    "quantity": 1,
-                }
-            ],
-            mode="payment",
-            success_url=f"{DOMAIN}/api/payments/success/?session_id={{CHECKOUT_SESSION_ID}}",
-            cancel_url=f"{DOMAIN}/api/payments/cancel/?session_id={{CHECKOUT_SESSION_ID}}",
-            metadata={
-                "borrowing_id": str(borrowing.id),
-                "user_id": str(borrowing.user.id),
-            },
-        )
+        try:
+            payment = checkout_payment(
+                borrowing, Payment.Type.PAYMENT, calculate_rental_amount(borrowing)
+            )
+        except UNAVAILABLE_ERRORS:
+            return payments_unavailable()
+        if payment.session_id is None:
+            # Not cached by the idempotency decorator, so a retry can succeed
+            return Response(
+                {"detail": "The payment session is being created, retry shortly"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": "1"},
+            )
 
-        Payment.objects.create(
-            status=Payment.PaymentStatus.PENDING,
-            type=Payment.Type.PAYMENT,
-            borrowing=borrowing,
-            session_url=checkout_session.url,
-            session_id=checkout_session.id,
-            money_to_pay=book.daily_fee * days,
-        )
+        return Response({"session_id": payment.session_id, "url": payment.session_url})
 
-        return Response(
-            {"session_id": checkout_session.id, "url": checkout_session.url}
-        )
 
-
-@extend_schema(request=None, responses={200: OpenApiResponse(description="Success")})
+@extend_schema(
+    request=None,
+    responses={
+        200: OpenApiResponse(description="Success"),
+        404: OpenApiResponse(description="Payment not found"),
+    },
+)
 class PaymentSuccessView(APIView):
+    """
+    Stripe redirects here after checkout. The payment is marked PAID by the
+    webhook, so this only reports its current status.
+    """
+
     permission_classes = (IsAuthenticated,)
 
     def get(self, request):
         session_id = request.query_params.get("session_id")
         if not session_id:
             return Response({"detail": "No session id"}, status=400)
-        session = stripe.checkout.Session.retrieve(session_id)
-        borrowing_id = session.metadata["borrowing_id"]
-        user_id = session.metadata["user_id"]
-        payment = Payment.objects.filter(session_id=session_id).first()
-        if payment:
-            payment.status = Payment.PaymentStatus.PAID
-            payment.save()
+        payment = (
+            Payment.objects.filter(session_id=session_id)
+            .values("status", "borrowing_id", "borrowing__user_id")
+            .first()
+        )
+        if payment is None:
+            return Response(
+                {"detail": "Payment not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+        paid = payment["status"] == Payment.PaymentStatus.PAID
         return Response(
             {
-                "detail": "Success",
-                "borrowing_id": str(borrowing_id),
-                "user_id": str(user_id),
+                "detail": "Success" if paid else "Processing",
+                "status": payment["status"],
+                "borrowing_id": str(payment["borrowing_id"]),
+                "user_id": str(payment["borrowing__user_id"]),
             }
         )
 
 
+@extend_schema(
+    summary="Stripe webhook",
+    description=(
+        "Receives signed Stripe events. Completed checkout sessions are "
+        "queued and their payments marked PAID in the background."
+    ),
+    request=None,
+    responses={
+        200: OpenApiResponse(description="Event accepted"),
+        400: OpenApiResponse(description="Invalid payload or signature"),
+    },
+)
+class PaymentWebhookView(APIView):
+    authentication_classes = ()
+    permission_classes = (AllowAny,)
+
+    def post(self, request):
+        try:
+            event = stripe.Webhook.construct_event(
+                request.body,
+                request.headers.get("Stripe-Signature", ""),
+                settings.STRIPE_WEBHOOK_SECRET,
+            )
+        except (ValueError, stripe.SignatureVerificationError):
+            return Response(
+                {"detail": "Invalid payload or signature"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if record_stripe_event(event):
+            transaction.on_commit(process_stripe_events.delay)
+        return Response({"received": True})
+
+
 @extend_schema(request=None, responses={400: OpenApiResponse(description="Cancelled")})
 class PaymentCanceledView(APIView):
     permission_classes = (IsAuthenticated,)
@@ -1,3 +1,5 @@
 from django.contrib import admin
 
-# Register your models here.
+from telegram_bot.models import DeadLetterMessage
+
+admin.site.register(DeadLetterMessage)
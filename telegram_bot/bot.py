@@ -1,6 +1,5 @@
 import os
-import threading
-import time
+from datetime import date, timedelta
 
 import django
 import secrets
@@ -9,41 +8,88 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "library_project.settings")
 django.setup()
 
 import telebot
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Subquery
 from telebot import types
 from borrowings.models import Borrowing
 from library_project.settings import TELEGRAM_TOKEN
-from telegram_bot.models import TelegramToken
+from telegram_bot.delivery import TelegramDelivery
+from telegram_bot.models import NotificationLog, TelegramToken
 
 
 bot = telebot.TeleBot(TELEGRAM_TOKEN)
 
-notified_borrowings = set()
 
+def format_new_borrowing(borrowing):
+    book = borrowing.book
+    return (
+        f"✅ You borrowed a new book!\n\n"
+        f"📘 {book.title} — {book.author}\n"
+        f"📅 Return by: {borrowing.expected_return}"
+    )
 
-def check_borrowings():
-    global notified_borrowings
 
-    borrowings = (
-        Borrowing.objects.filter(actual_return_date__isnull=True)
-        .exclude(id__in=notified_borrowings)
-        .select_related("user", "book")
+def notify_new_borrowing(borrowing, telegram_id):
+    """
+    Send the new-borrowing message at most once per borrowing, across
+    restarts and replicas. Returns True when a message was sent.
+    """
+    if not NotificationLog.objects.claim(borrowing.id, NotificationLog.Kind.BORROWED):
+        return False
+    if telegram_id is None:
+        return False
+
+    delivery = TelegramDelivery(bot.send_message)
+    return bool(delivery.deliver([(telegram_id, format_new_borrowing(borrowing))]))
+
+
+def check_borrowings():
+    """
+    Catch-up scan for borrowings whose notification event was lost. New
+    borrowings are announced by telegram_bot.tasks.notify_borrowing_created;
+    this only picks up active borrowings from the last
+    TELEGRAM_CATCH_UP_DAYS that have no notification logged.
+    """
+    notified = NotificationLog.objects.filter(
+        borrowing_id=OuterRef("id"), kind=NotificationLog.Kind.BORROWED
+    )
+    borrowings = list(
+        Borrowing.objects.filter(
+            borrow_date__gte=date.today()
+            - timedelta(days=settings.TELEGRAM_CATCH_UP_DAYS),
+            actual_return_date__isnull=True,
+        )
+        .exclude(Exists(notified))
+        .select_related("book")
+    )
+    telegram_ids = dict(
+        # oldest first, so each user's newest token wins
+        TelegramToken.objects.filter(
+            user_id__in={borrowing.user_id for borrowing in borrowings}
+        )
+        .order_by("created_at")
+        .values_list("user_id", "telegram_id")
     )
 
+    messages = []
     for borrowing in borrowings:
-        try:
-            token = TelegramToken.objects.get(user=borrowing.user)
-            book = borrowing.book
-            message = (
-                f"✅ You borrowed a new book!\n\n"
-                f"📘 {book.title} — {book.author}\n"
-                f"📅 Return by: {borrowing.expected_return}"
+        claimed = NotificationLog.objects.claim(
+            borrowing.id, NotificationLog.Kind.BORROWED
+        )
+        if claimed and borrowing.user_id in telegram_ids:
+            messages.append(
+                (telegram_ids[borrowing.user_id], format_new_borrowing(borrowing))
             )
-            bot.send_message(chat_id=token.telegram_id, text=message)
-            notified_borrowings.add(borrowing.id)
-        except TelegramToken.DoesNotExist:
-            continue
-        except Exception as e:
-            print(f"Error sending message for borrowing {borrowing.id}: {e}")
+
+    TelegramDelivery(bot.send_message).deliver(messages)
+
+
+def format_borrowed_book(borrowing):
+    book = borrowing.book
+    return (
+        f"📘 {book.title} — {book.author}\n"
+        f"🗓 Reading period: {borrowing.borrow_date} — {borrowing.expected_return}\n"
+    )
 
 
 def get_borrowed_books(telegram_id):
@@ -56,24 +102,37 @@ def get_borrowed_books(telegram_id):
             user=user, actual_return_date__isnull=True
         ).select_related("book")
 
-        borrowed_books = []
-        for borrowing in borrowings:
-            book = borrowing.book
-            borrowed_books.append(
-                f"📘 {book.title} — {book.author}\n"
-                f"🗓 Reading period: {borrowing.borrow_date} — {borrowing.expected_return}\n"
-            )
-
-        return borrowed_books
+        return [format_borrowed_book(borrowing) for borrowing in borrowings]
     except TelegramToken.DoesNotExist:
         return []
 
 
-def watcher_loop():
-    print("📡 Borrowing watcher started...")
-    while True:
-        check_borrowings()
-        time.sleep(30)
+def get_borrowed_books_by_chat(borrowings):
+    """
+    Active borrowings of every user matched by ``borrowings``, grouped by
+    Telegram chat id, in a single query.
+    """
+    telegram_id = (
+        TelegramToken.objects.filter(user=OuterRef("user"))
+        .order_by("-created_at")
+        .values("telegram_id")[:1]
+    )
+    rows = (
+        Borrowing.objects.filter(
+            actual_return_date__isnull=True, user__in=borrowings.values("user")
+        )
+        .annotate(telegram_id=Subquery(telegram_id))
+        .filter(telegram_id__isnull=False)
+        .select_related("book")
+        .order_by("telegram_id", "borrow_date", "id")
+    )
+
+    borrowed_books = {}
+    for borrowing in rows:
+        borrowed_books.setdefault(borrowing.telegram_id, []).append(
+            format_borrowed_book(borrowing)
+        )
+    return borrowed_books
 
 
 @bot.message_handler(commands=["start"])
@@ -129,8 +188,5 @@ def buttons(message):
 
 
 if __name__ == "__main__":
-    watcher_thread = threading.Thread(target=watcher_loop, daemon=True)
-    watcher_thread.start()
-
     print("Starting Telegram Bot...")
     bot.polling(none_stop=True)
@@ -0,0 +1,212 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from redis.exceptions import LockNotOwnedError
+from requests.exceptions import ConnectionError, Timeout
+from telebot.apihelper import ApiHTTPException, ApiTelegramException
+
+from telegram_bot.models import DeadLetterMessage
+
+# Refill arithmetic is done in floats; treat "almost one token" as one so a
+# waiter never spins on sleeps too small to move the clock.
+TOKEN_EPSILON = 1e-9
+
+GLOBAL_RATE_KEY = "telegram:rate:global"
+CHAT_RATE_KEY = "telegram:rate:chat"
+LIMITER_STATE_TTL = 60 * 60  # idle limiters simply start over full
+LOCK_TIMEOUT = 1  # seconds, in case a holder dies mid-update
+LOCK_POLL_INTERVAL = 0.005
+
+
+@contextmanager
+def shared_lock(key):
+    """
+    Short mutual exclusion across every thread and process, held in the
+    shared Redis cache while a limiter's state is read and written back.
+    The lock carries a token of its holder, so a holder that outlived
+    LOCK_TIMEOUT cannot release a lock another worker has taken since.
+    """
+    lock_key = cache.make_and_validate_key(f"{key}:lock")
+    client = cache._cache.get_client(lock_key, write=True)
+    lock = client.lock(lock_key, timeout=LOCK_TIMEOUT, sleep=LOCK_POLL_INTERVAL)
+    lock.acquire()
+    try:
+        yield
+    finally:
+        try:
+            lock.release()
+        except LockNotOwnedError:
+            # expired while held; whoever holds it now keeps it
+            pass
+
+
+class TokenBucket:
+    """
+    Token bucket refilled with ``rate`` tokens per second. Its state lives
+    in the shared cache under ``key``, so every thread and worker process
+    using the same key draws from one bucket.
+    """
+
+    def __init__(self, key, rate, capacity=None, clock=time.time, sleep=time.sleep):
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.clock = clock
+        self.sleep = sleep
+
+    def acquire(self):
+        while True:
+            with shared_lock(self.key):
+                now = self.clock()
+                tokens, updated, paused_until = self._state(now)
+                tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+                ready = now >= paused_until and tokens >= 1 - TOKEN_EPSILON
+                if ready:
+                    tokens = max(tokens - 1, 0)
+                self._save(tokens, now, paused_until)
+                if ready:
+                    return
+                wait = max(paused_until - now, (1 - tokens) / self.rate)
+            self.sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Stop handing out tokens for ``seconds``, e.g. after a Telegram 429.
+        """
+        with shared_lock(self.key):
+            now = self.clock()
+            _, _, paused_until = self._state(now)
+            self._save(0, now, max(paused_until, now + seconds))
+
+    def _state(self, now):
+        return cache.get(self.key) or (self.capacity, now, 0)
+
+    def _save(self, tokens, updated, paused_until):
+        cache.set(self.key, (tokens, updated, paused_until), LIMITER_STATE_TTL)
+
+
+class ChatRateLimiter:
+    """
+    Spaces messages to the same chat at least ``1 / rate`` seconds apart,
+    across every thread and worker process, through the shared cache.
+    """
+
+    def __init__(self, key, rate, clock=time.time, sleep=time.sleep):
+        self.key = key
+        self.interval = 1 / rate
+        self.clock = clock
+        self.sleep = sleep
+
+    def acquire(self, chat_id):
+        key = f"{self.key}:{chat_id}"
+        with shared_lock(key):
+            now = self.clock()
+            slot = max(now, cache.get(key, now))
+            cache.set(key, slot + self.interval, LIMITER_STATE_TTL)
+        if slot > now:
+            self.sleep(slot - now)
+
+
+class TelegramDelivery:
+    """
+    Sends messages concurrently while staying under Telegram's global and
+    per-chat limits, which are shared by all deliveries through the cache.
+    429 and 5xx responses are retried with backoff; messages that still
+    fail end up in the DeadLetterMessage table.
+    """
+
+    def __init__(
+        self,
+        send,
+        workers=None,
+        global_rate=None,
+        per_chat_rate=None,
+        max_attempts=None,
+        backoff=None,
+        clock=time.time,
+        sleep=time.sleep,
+    ):
+        self.send = send
+        self.workers = workers or settings.TELEGRAM_DELIVERY_WORKERS
+        self.max_attempts = max_attempts or settings.TELEGRAM_DELIVERY_MAX_ATTEMPTS
+        self.backoff = backoff or settings.TELEGRAM_DELIVERY_BACKOFF
+        self.sleep = sleep
+        self.bucket = TokenBucket(
+            GLOBAL_RATE_KEY,
+            global_rate or settings.TELEGRAM_GLOBAL_RATE,
+            clock=clock,
+            sleep=sleep,
+        )
+        self.chats = ChatRateLimiter(
+            CHAT_RATE_KEY,
+            per_chat_rate or settings.TELEGRAM_PER_CHAT_RATE,
+            clock=clock,
+            sleep=sleep,
+        )
+
+    def deliver(self, messages):
+        """
+        Send ``(chat_id, text)`` pairs and return how many were delivered.
+        """
+        messages = list(messages)
+        if not messages:
+            return 0
+
+        if len(messages) == 1:
+            results = [self._deliver_one(messages[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                results = list(pool.map(self._deliver_one, messages))
+
+        dead_letters = [result for result in results if result is not None]
+        if dead_letters:
+            DeadLetterMessage.objects.bulk_create(dead_letters)
+        return len(messages) - len(dead_letters)
+
+    def _deliver_one(self, message):
+        chat_id, text = message
+        for attempt in range(1, self.max_attempts + 1):
+            self.chats.acquire(chat_id)
+            self.bucket.acquire()
+            try:
+                self.send(chat_id=chat_id, text=text)
+                return None
+            except (ApiTelegramException, ApiHTTPException) as error:
+                status = _status_code(error)
+                retryable = status == 429 or status >= 500
+                failure = error
+            except (ConnectionError, Timeout) as error:
+                retryable = True
+                failure = error
+            except Exception as error:
+                retryable = False
+                failure = error
+
+            if not retryable or attempt == self.max_attempts:
+                return DeadLetterMessage(
+                    chat_id=chat_id, text=text, error=str(failure), attempts=attempt
+                )
+
+            retry_after = _retry_after(failure)
+            if retry_after:
+                self.bucket.pause(retry_after)
+                self.sleep(retry_after)
+            else:
+                delay = self.backoff * 2 ** (attempt - 1)
+                self.sleep(delay + random.uniform(0, delay))
+
+
+def _status_code(error):
+    if isinstance(error, ApiTelegramException):
+        return error.error_code
+    return error.result.status_code
+
+
+def _retry_after(error):
+    if not isinstance(error, ApiTelegramException):
+        return None
+    return (error.result_json.get("parameters") or {}).get("retry_after")
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-17 06:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("borrowings", "0002_borrowing_pagination_indexes"),
+        ("telegram_bot", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NotificationLog",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("kind", models.CharField(choices=[("BORROWED", "Borrowed")])),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "borrowing",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="notifications",
+                        to="borrowings.borrowing",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("kind", "borrowing"),
+                        name="unique_notification_per_kind",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-17 07:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("borrowings", "0003_active_borrowing_indexes"),
+        ("telegram_bot", "0003_dead_letter_message"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="notificationlog",
+            name="borrowing",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="notifications",
+                to="borrowings.borrowing",
+            ),
+        ),
+    ]
@@ -11,3 +11,51 @@ class TelegramToken(models.Model):
     telegram_id = models.BigIntegerField()
     is_used = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+
+
+class NotificationLogQuerySet(models.QuerySet):
+    def claim(self, borrowing_id, kind):
+        """
+        Record that the borrowing is being notified about.
+        Returns False when another worker or an earlier run already did.
+        """
+        _, created = self.get_or_create(borrowing_id=borrowing_id, kind=kind)
+        return created
+
+
+class NotificationLog(models.Model):
+    class Kind(models.TextChoices):
+        BORROWED = "BORROWED"
+
+    # No database constraint, see Payment.borrowing
+    borrowing = models.ForeignKey(
+        "borrowings.Borrowing",
+        related_name="notifications",
+        on_delete=models.CASCADE,
+        db_constraint=False,
+    )
+    kind = models.CharField(choices=Kind.choices)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = NotificationLogQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["kind", "borrowing"], name="unique_notification_per_kind"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} for borrowing {self.borrowing_id}"
+
+
+class DeadLetterMessage(models.Model):
+    chat_id = models.BigIntegerField()
+    text = models.TextField()
+    error = models.TextField()
+    attempts = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Undelivered message to {self.chat_id}: {self.error}"
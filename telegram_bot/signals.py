@@ -0,0 +1,18 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from borrowings.models import Borrowing
+
+
+@receiver(post_save, sender=Borrowing)
+def publish_borrowing_created(sender, instance, created, **kwargs):
+    if not created:
+        return
+
+    # Imported lazily: telegram_bot.tasks loads the bot module, which calls
+    # django.setup() and cannot be imported while the app registry populates.
+    from telegram_bot.tasks import notify_borrowing_created
+
+    borrowing_id = instance.id
+    transaction.on_commit(lambda: notify_borrowing_created.delay(borrowing_id))
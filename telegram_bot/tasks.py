@@ -2,9 +2,39 @@ from datetime import date, timedelta
 
 from celery import shared_task
 
+from telegram_bot.delivery import TelegramDelivery
 from telegram_bot.models import TelegramToken
 from borrowings.models import Borrowing
-from telegram_bot.bot import bot, get_borrowed_books
+from telegram_bot.bot import (
+    bot,
+    check_borrowings,
+    get_borrowed_books_by_chat,
+    notify_new_borrowing,
+)
+
+
+@shared_task
+def notify_borrowing_created(borrowing_id):
+    borrowing = (
+        Borrowing.objects.select_related("book")
+        .filter(id=borrowing_id, actual_return_date__isnull=True)
+        .first()
+    )
+    if borrowing is None:
+        return
+
+    telegram_id = (
+        TelegramToken.objects.filter(user_id=borrowing.user_id)
+        .order_by("-created_at")
+        .values_list("telegram_id", flat=True)
+        .first()
+    )
+    notify_new_borrowing(borrowing, telegram_id)
+
+
+@shared_task
+def catch_up_borrowing_notifications():
+    check_borrowings()
 
 
 @shared_task
@@ -12,23 +42,20 @@ def send_reminder():
     three_days_ago = date.today() - timedelta(days=3)
     borrowings = Borrowing.objects.filter(
         actual_return_date__isnull=True, borrow_date__lte=three_days_ago
-    ).select_related("book", "user")
-
-    for borrowing in borrowings:
-        try:
-            token = TelegramToken.objects.get(user=borrowing.user)
-            telegram_id = token.telegram_id
-        except TelegramToken.DoesNotExist:
-            continue
+    )
 
-        borrowed_books = get_borrowed_books(telegram_id)
-        if borrowed_books:
-            message = (
-                "📚 Hello, this is a reminder that you have borrowed a book that will arrive every 3 days so that you don't forget to return it. Books you have borrowed:\n"
-                + "\n".join(borrowed_books)
-            )
+    messages = [
+        (
+            telegram_id,
+            "📚 Hello, this is a reminder that you have borrowed a book that will arrive every 3 days so that you don't forget to return it. Books you have borrowed:\n"
+            + "\n".join(borrowed_books),
+        )
+        for telegram_id, borrowed_books in get_borrowed_books_by_chat(
+            borrowings
+        ).items()
+    ]
 
-            bot.send_message(chat_id=telegram_id, text=message)
+    TelegramDelivery(bot.send_message).deliver(messages)
 
 
 @shared_task
@@ -36,20 +63,18 @@ def send_due_today():
     today = date.today()
     borrowings = Borrowing.objects.filter(
         actual_return_date__isnull=True, expected_return=today
-    ).select_related("book", "user")
-
-    for borrowing in borrowings:
-        try:
-            token = TelegramToken.objects.get(user=borrowing.user)
-            telegram_id = token.telegram_id
-        except TelegramToken.DoesNotExist:
-            continue
-
-        borrowed_books = get_borrowed_books(telegram_id)
-        if borrowed_books:
-            message = (
-                "⚠️ Today is the day to return books:\n"
-                + "\n".join(borrowed_books)
-                + "\nIf you don't return it today, you will be charged a penalty."
-            )
-            bot.send_message(chat_id=telegram_id, text=message)
+    )
+
+    messages = [
+        (
+            telegram_id,
+            "⚠️ Today is the day to return books:\n"
+            + "\n".join(borrowed_books)
+            + "\nIf you don't return it today, you will be charged a penalty.",
+        )
+        for telegram_id, borrowed_books in get_borrowed_books_by_chat(
+            borrowings
+        ).items()
+    ]
+
+    TelegramDelivery(bot.send_message).deliver(messages)
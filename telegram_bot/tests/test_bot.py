@@ -1,13 +1,14 @@
 from borrowings.models import Borrowing
 from books.models import Book
-from telegram_bot.bot import check_borrowings, notified_borrowings
+from telegram_bot.bot import check_borrowings
 from telegram_bot.bot import get_borrowed_books
 import datetime
 from unittest.mock import patch
 from telegram_bot.bot import start, buttons
 from django.test import TestCase
+from django.utils import timezone
 from django.contrib.auth import get_user_model
-from telegram_bot.models import TelegramToken
+from telegram_bot.models import DeadLetterMessage, NotificationLog, TelegramToken
 
 User = get_user_model()
 
@@ -74,18 +75,75 @@ class CheckBorrowingsTest(TestCase):
 
     @patch("telegram_bot.bot.bot.send_message")
     def test_send_notification_if_token_exists(self, mock_send):
-        notified_borrowings.clear()
         check_borrowings()
         self.assertTrue(mock_send.called)
-        self.assertIn(self.borrowing.id, notified_borrowings)
+        self.assertTrue(
+            NotificationLog.objects.filter(
+                borrowing=self.borrowing, kind=NotificationLog.Kind.BORROWED
+            ).exists()
+        )
+
+    @patch("telegram_bot.bot.bot.send_message")
+    def test_notification_goes_to_latest_token(self, mock_send):
+        TelegramToken.objects.create(user=self.user, telegram_id=2222, token="tok2")
+        TelegramToken.objects.filter(pk=self.token.pk).update(
+            created_at=timezone.now() + datetime.timedelta(days=1)
+        )
+        check_borrowings()
+        self.assertEqual(mock_send.call_args.kwargs["chat_id"], 1111)
 
     @patch("telegram_bot.bot.bot.send_message")
     def test_no_notification_if_no_token(self, mock_send):
         self.token.delete()
-        notified_borrowings.clear()
         check_borrowings()
         self.assertFalse(mock_send.called)
 
+    @patch("telegram_bot.bot.bot.send_message")
+    def test_notification_log_survives_restart(self, mock_send):
+        check_borrowings()
+        check_borrowings()
+        mock_send.assert_called_once()
+
+    @patch("telegram_bot.bot.bot.send_message")
+    def test_scan_finds_lost_events_below_notified_borrowings(self, mock_send):
+        newer = Borrowing.objects.create(
+            user=self.user,
+            book=Book.objects.create(
+                title="Sequel", author="A", cover="HARD", inventory=1, daily_fee=1
+            ),
+            expected_return=datetime.date.today() + datetime.timedelta(days=3),
+        )
+        NotificationLog.objects.create(
+            borrowing=newer, kind=NotificationLog.Kind.BORROWED
+        )
+
+        # unnotified rows, chat ids, then one claim for the lost row
+        with self.assertNumQueries(6):
+            check_borrowings()
+
+        mock_send.assert_called_once()
+        self.assertIn("📘 Book —", mock_send.call_args.kwargs["text"])
+        self.assertTrue(
+            NotificationLog.objects.filter(borrowing=self.borrowing).exists()
+        )
+
+    @patch("telegram_bot.bot.bot.send_message")
+    def test_scan_skips_borrowings_outside_the_window(self, mock_send):
+        Borrowing.objects.filter(id=self.borrowing.id).update(
+            borrow_date=datetime.date.today() - datetime.timedelta(days=30)
+        )
+        check_borrowings()
+        mock_send.assert_not_called()
+        self.assertFalse(NotificationLog.objects.exists())
+
+    @patch("telegram_bot.bot.bot.send_message")
+    def test_failed_send_is_dead_lettered(self, mock_send):
+        mock_send.side_effect = Exception("Telegram is down")
+        check_borrowings()
+        dead_letter = DeadLetterMessage.objects.get()
+        self.assertEqual(dead_letter.chat_id, 1111)
+        self.assertIn("Telegram is down", dead_letter.error)
+
 
 class BotHandlersTest(TestCase):
     def setUp(self):
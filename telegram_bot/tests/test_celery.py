@@ -1,7 +1,9 @@
+from datetime import date, timedelta
 from unittest.mock import patch
 
 
 from django.test import TestCase
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 
 from books.models import Book
@@ -84,12 +86,9 @@ class TelegramCeleryTasksTestCase(TestCase):
             user=self.user, telegram_id=12345, token="tok123"
         )
 
-    @patch("telegram_bot.tasks.get_borrowed_books")
     @patch("telegram_bot.tasks.bot")
     @patch("telegram_bot.tasks.date")
-    def test_send_reminder_sends_message(
-        self, mock_date_class, mock_bot, mock_get_borrowed_books
-    ):
+    def test_send_reminder_sends_message(self, mock_date_class, mock_bot):
         """Test send_reminder with mocked date"""
         from datetime import date as real_date
 
@@ -107,23 +106,19 @@ class TelegramCeleryTasksTestCase(TestCase):
             borrow_date=real_date(2025, 10, 15)
         )
 
-        mock_get_borrowed_books.return_value = ["Test Book by Author"]
+        with self.assertNumQueries(1):
+            tasks.send_reminder()
 
-        tasks.send_reminder()
-
-        mock_get_borrowed_books.assert_called_once_with(12345)
         mock_bot.send_message.assert_called_once()
 
         call_kwargs = mock_bot.send_message.call_args[1]
         self.assertEqual(call_kwargs["chat_id"], 12345)
         self.assertIn("reminder", call_kwargs["text"].lower())
+        self.assertIn("Test Book", call_kwargs["text"])
 
-    @patch("telegram_bot.tasks.get_borrowed_books")
     @patch("telegram_bot.tasks.bot")
     @patch("telegram_bot.tasks.date")
-    def test_send_due_today_sends_message(
-        self, mock_date_class, mock_bot, mock_get_borrowed_books
-    ):
+    def test_send_due_today_sends_message(self, mock_date_class, mock_bot):
         """Test send_due_today with mocked date"""
         from datetime import date as real_date
 
@@ -140,11 +135,9 @@ class TelegramCeleryTasksTestCase(TestCase):
             borrow_date=real_date(2025, 10, 17)
         )
 
-        mock_get_borrowed_books.return_value = ["Test Book by Author"]
-
-        tasks.send_due_today()
+        with self.assertNumQueries(1):
+            tasks.send_due_today()
 
-        mock_get_borrowed_books.assert_called_once_with(12345)
         mock_bot.send_message.assert_called_once()
 
         call_kwargs = mock_bot.send_message.call_args[1]
@@ -176,34 +169,72 @@ class TelegramCeleryTasksTestCase(TestCase):
 
         mock_bot.send_message.assert_not_called()
 
-    @patch("telegram_bot.tasks.get_borrowed_books")
     @patch("telegram_bot.tasks.bot")
     @patch("telegram_bot.tasks.date")
-    def test_send_reminder_no_borrowed_books(
-        self, mock_date_class, mock_bot, mock_get_borrowed_books
-    ):
-        """Test send_reminder when get_borrowed_books returns empty"""
+    def test_send_reminder_one_message_per_user(self, mock_date_class, mock_bot):
+        """Test a user with many due books gets a single digest"""
         from datetime import date as real_date
 
         mock_date_class.today.return_value = real_date(2025, 10, 24)
         mock_date_class.side_effect = lambda *args, **kw: real_date(*args, **kw)
 
-        borrowing = Borrowing.objects.create(
-            user=self.user,
-            book=self.book,
-            expected_return=real_date(2025, 10, 30),
-            actual_return_date=None,
+        other_user = User.objects.create_user(email="other@test.com", password="pass")
+        TelegramToken.objects.create(user=other_user, telegram_id=67890, token="tok456")
+        for user, title in [
+            (self.user, "First"),
+            (self.user, "Second"),
+            (self.user, "Third"),
+            (other_user, "Fourth"),
+        ]:
+            book = Book.objects.create(
+                title=title, author="Author", cover="HARD", inventory=5, daily_fee=2.0
+            )
+            borrowing = Borrowing.objects.create(
+                user=user, book=book, expected_return=real_date(2025, 10, 30)
+            )
+            Borrowing.objects.filter(pk=borrowing.pk).update(
+                borrow_date=real_date(2025, 10, 15)
+            )
+
+        with self.assertNumQueries(1):
+            tasks.send_reminder()
+
+        self.assertEqual(mock_bot.send_message.call_count, 2)
+        messages = {
+            call[1]["chat_id"]: call[1]["text"]
+            for call in mock_bot.send_message.call_args_list
+        }
+        for title in ("First", "Second", "Third"):
+            self.assertIn(title, messages[12345])
+        self.assertIn("Fourth", messages[67890])
+        self.assertNotIn("First", messages[67890])
+
+    @patch("telegram_bot.tasks.bot")
+    @patch("telegram_bot.tasks.date")
+    def test_send_due_today_lists_all_active_books(self, mock_date_class, mock_bot):
+        """Test the due-today digest lists every active book of the user"""
+        from datetime import date as real_date
+
+        mock_date_class.today.return_value = real_date(2025, 10, 24)
+        mock_date_class.side_effect = lambda *args, **kw: real_date(*args, **kw)
+
+        Borrowing.objects.create(
+            user=self.user, book=self.book, expected_return=real_date(2025, 10, 24)
         )
-        Borrowing.objects.filter(pk=borrowing.pk).update(
-            borrow_date=real_date(2025, 10, 15)
+        later_book = Book.objects.create(
+            title="Later Book", author="Author", cover="SOFT", inventory=5, daily_fee=1
+        )
+        Borrowing.objects.create(
+            user=self.user, book=later_book, expected_return=real_date(2025, 11, 1)
         )
 
-        mock_get_borrowed_books.return_value = []
-
-        tasks.send_reminder()
+        with self.assertNumQueries(1):
+            tasks.send_due_today()
 
-        mock_get_borrowed_books.assert_called_once_with(12345)
-        mock_bot.send_message.assert_not_called()
+        mock_bot.send_message.assert_called_once()
+        text = mock_bot.send_message.call_args[1]["text"]
+        self.assertIn("Test Book", text)
+        self.assertIn("Later Book", text)
 
     @patch("telegram_bot.tasks.bot")
     @patch("telegram_bot.tasks.date")
@@ -273,3 +304,91 @@ class TelegramCeleryTasksTestCase(TestCase):
         tasks.send_due_today()
 
         mock_bot.send_message.assert_not_called()
+
+
+class BorrowingCreatedNotificationTestCase(TestCase):
+    """Test the borrowing-created event and its Celery consumer"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@test.com", password="pass")
+        self.book = Book.objects.create(
+            title="Test Book", author="Author", cover="HARD", inventory=5, daily_fee=2.0
+        )
+        self.telegram_token = TelegramToken.objects.create(
+            user=self.user, telegram_id=12345, token="tok123"
+        )
+
+    @patch("telegram_bot.tasks.notify_borrowing_created")
+    def test_new_borrowing_publishes_event_on_commit(self, mock_task):
+        """Test that creating a borrowing enqueues the notification after commit"""
+        with self.captureOnCommitCallbacks(execute=True):
+            borrowing = Borrowing.objects.create(
+                user=self.user, book=self.book, expected_return=date.today()
+            )
+
+        mock_task.delay.assert_called_once_with(borrowing.id)
+
+    @patch("telegram_bot.tasks.notify_borrowing_created")
+    def test_updated_borrowing_publishes_nothing(self, mock_task):
+        """Test that saving an existing borrowing does not re-announce it"""
+        borrowing = Borrowing.objects.create(
+            user=self.user, book=self.book, expected_return=date.today()
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            borrowing.actual_return_date = date.today()
+            borrowing.save()
+
+        mock_task.delay.assert_not_called()
+
+    @patch("telegram_bot.bot.bot.send_message")
+    def test_notify_borrowing_created_sends_message(self, mock_send):
+        """Test the consumer sends one message to the linked chat"""
+        borrowing = Borrowing.objects.create(
+            user=self.user, book=self.book, expected_return=date.today()
+        )
+
+        tasks.notify_borrowing_created(borrowing.id)
+
+        mock_send.assert_called_once()
+        call_kwargs = mock_send.call_args[1]
+        self.assertEqual(call_kwargs["chat_id"], 12345)
+        self.assertIn("Test Book", call_kwargs["text"])
+
+    @patch("telegram_bot.bot.bot.send_message")
+    def test_notify_borrowing_created_uses_latest_token(self, mock_send):
+        """Test a user with several tokens is notified in the newest chat"""
+        TelegramToken.objects.create(user=self.user, telegram_id=67890, token="tok2")
+        TelegramToken.objects.filter(telegram_id=12345).update(
+            created_at=timezone.now() - timedelta(days=1)
+        )
+        borrowing = Borrowing.objects.create(
+            user=self.user, book=self.book, expected_return=date.today()
+        )
+
+        tasks.notify_borrowing_created(borrowing.id)
+
+        self.assertEqual(mock_send.call_args[1]["chat_id"], 67890)
+
+    @patch("telegram_bot.bot.bot.send_message")
+    def test_notify_borrowing_created_is_delivered_once(self, mock_send):
+        """Test a redelivered event does not notify the user twice"""
+        borrowing = Borrowing.objects.create(
+            user=self.user, book=self.book, expected_return=date.today()
+        )
+
+        tasks.notify_borrowing_created(borrowing.id)
+        tasks.notify_borrowing_created(borrowing.id)
+
+        mock_send.assert_called_once()
+
+    @patch("telegram_bot.bot.bot.send_message")
+    def test_notify_borrowing_created_without_token(self, mock_send):
+        """Test the consumer does nothing for users without Telegram"""
+        self.telegram_token.delete()
+        borrowing = Borrowing.objects.create(
+            user=self.user, book=self.book, expected_return=date.today()
+        )
+
+        tasks.notify_borrowing_created(borrowing.id)
+
+        mock_send.assert_not_called()
@@ -0,0 +1,174 @@
+from unittest.mock import MagicMock
+
+from django.core.cache import cache
+from django.test import TestCase
+from requests.exceptions import ConnectionError
+from telebot.apihelper import ApiTelegramException
+
+from telegram_bot.delivery import (
+    LOCK_TIMEOUT,
+    ChatRateLimiter,
+    TelegramDelivery,
+    TokenBucket,
+    shared_lock,
+)
+from telegram_bot.models import DeadLetterMessage
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def telegram_error(code, retry_after=None):
+    result_json = {"ok": False, "error_code": code, "description": "error"}
+    if retry_after is not None:
+        result_json["parameters"] = {"retry_after": retry_after}
+    return ApiTelegramException("sendMessage", MagicMock(), result_json)
+
+
+class RateLimiterTestCase(TestCase):
+    """Test the token bucket and the per-chat limiter"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_token_bucket_allows_burst_then_throttles(self):
+        clock = FakeClock()
+        bucket = TokenBucket("test:bucket", rate=10, clock=clock, sleep=clock.sleep)
+
+        for _ in range(30):
+            bucket.acquire()
+
+        self.assertAlmostEqual(clock.now, 2.0)
+
+    def test_token_bucket_pause(self):
+        clock = FakeClock()
+        bucket = TokenBucket("test:bucket", rate=10, clock=clock, sleep=clock.sleep)
+
+        bucket.pause(5)
+        bucket.acquire()
+
+        self.assertGreaterEqual(clock.now, 5)
+
+    def test_chat_limiter_spaces_same_chat_only(self):
+        clock = FakeClock()
+        limiter = ChatRateLimiter("test:chats", rate=1, clock=clock, sleep=clock.sleep)
+
+        limiter.acquire(1)
+        limiter.acquire(2)
+        self.assertEqual(clock.now, 0)
+
+        limiter.acquire(1)
+        self.assertEqual(clock.now, 1)
+
+    def test_limiters_with_the_same_key_share_state(self):
+        clock = FakeClock()
+        first, second = (
+            TokenBucket("test:bucket", rate=10, clock=clock, sleep=clock.sleep)
+            for _ in range(2)
+        )
+
+        for _ in range(10):
+            first.acquire()
+            second.acquire()
+
+        self.assertAlmostEqual(clock.now, 1.0)
+
+    def test_expired_lock_holder_keeps_the_next_holders_lock(self):
+        lock_key = cache.make_and_validate_key("test:bucket:lock")
+        client = cache._cache.get_client(lock_key, write=True)
+
+        with shared_lock("test:bucket"):
+            # the lock expires and another worker takes it
+            client.delete(lock_key)
+            other = client.lock(lock_key, timeout=LOCK_TIMEOUT)
+            self.assertTrue(other.acquire(blocking=False))
+
+        self.assertTrue(other.owned())
+        other.release()
+        with shared_lock("test:bucket"):
+            self.assertTrue(client.exists(lock_key))
+        self.assertFalse(client.exists(lock_key))
+
+
+class TelegramDeliveryTestCase(TestCase):
+    """Test retries and dead-lettering of the delivery engine"""
+
+    def setUp(self):
+        cache.clear()
+        self.clock = FakeClock()
+        self.send = MagicMock()
+
+    def delivery(self, **kwargs):
+        options = {
+            "workers": 4,
+            "global_rate": 30,
+            "per_chat_rate": 1,
+            "max_attempts": 3,
+            "backoff": 1,
+            "clock": self.clock,
+            "sleep": self.clock.sleep,
+        }
+        options.update(kwargs)
+        return TelegramDelivery(self.send, **options)
+
+    def test_delivers_all_messages(self):
+        messages = [(chat_id, f"hello {chat_id}") for chat_id in range(20)]
+
+        delivered = self.delivery().deliver(messages)
+
+        self.assertEqual(delivered, 20)
+        self.assertEqual(self.send.call_count, 20)
+        self.assertFalse(DeadLetterMessage.objects.exists())
+
+    def test_separate_deliveries_share_the_chat_limit(self):
+        self.delivery().deliver([(1, "first")])
+        self.delivery().deliver([(1, "second")])
+
+        self.assertEqual(self.clock.now, 1)
+
+    def test_retries_after_429_using_retry_after(self):
+        self.send.side_effect = [telegram_error(429, retry_after=7), None]
+
+        delivered = self.delivery().deliver([(1, "hello")])
+
+        self.assertEqual(delivered, 1)
+        self.assertEqual(self.send.call_count, 2)
+        self.assertIn(7, self.clock.sleeps)
+
+    def test_retries_server_and_network_errors(self):
+        self.send.side_effect = [telegram_error(502), ConnectionError(), None]
+
+        delivered = self.delivery().deliver([(1, "hello")])
+
+        self.assertEqual(delivered, 1)
+        self.assertEqual(self.send.call_count, 3)
+
+    def test_dead_letters_after_max_attempts(self):
+        self.send.side_effect = telegram_error(500)
+
+        delivered = self.delivery().deliver([(1, "hello")])
+
+        self.assertEqual(delivered, 0)
+        self.assertEqual(self.send.call_count, 3)
+        dead_letter = DeadLetterMessage.objects.get()
+        self.assertEqual(dead_letter.chat_id, 1)
+        self.assertEqual(dead_letter.text, "hello")
+        self.assertEqual(dead_letter.attempts, 3)
+
+    def test_client_errors_are_not_retried(self):
+        self.send.side_effect = telegram_error(403)
+
+        self.delivery().deliver([(1, "hello"), (2, "hello")])
+
+        self.assertEqual(self.send.call_count, 2)
+        self.assertEqual(DeadLetterMessage.objects.count(), 2)